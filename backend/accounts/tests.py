@@ -1,3 +1,53 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from twain_core.ratelimit import LocalMemoryBackend, get_backend, parse_rate
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("10/m"), (10, 10 / 60))
+        self.assertEqual(parse_rate("3/5s"), (3, 3 / 5))
+
+    def test_bucket_refills_over_time(self):
+        backend = LocalMemoryBackend()
+        capacity, refill = parse_rate("2/m")
+        self.assertEqual(backend.consume("k", capacity, refill, now=0), 0)
+        self.assertEqual(backend.consume("k", capacity, refill, now=0), 0)
+        self.assertAlmostEqual(backend.consume("k", capacity, refill, now=0), 30)
+        self.assertAlmostEqual(backend.consume("k", capacity, refill, now=15), 15)
+        self.assertEqual(backend.consume("k", capacity, refill, now=30), 0)
+
+    def test_full_backend_evicts_least_recently_used_bucket(self):
+        backend = LocalMemoryBackend(max_keys=2)
+        capacity, refill = parse_rate("1/m")
+        backend.consume("limited", capacity, refill, now=0)
+        backend.consume("idle", capacity, refill, now=1)
+        backend.consume("limited", capacity, refill, now=2)  # denied, but now the most recent
+        backend.consume("new", capacity, refill, now=3)
+        # The limited client is still limited; the idle one was forgotten, so it starts full
+        self.assertGreater(backend.consume("limited", capacity, refill, now=4), 0)
+        self.assertEqual(backend.consume("idle", capacity, refill, now=5), 0)
+
+
+# A fast hasher keeps the attempts well inside one refill interval
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoginRateLimitTests(TestCase):
+    def setUp(self):
+        get_backend().reset()
+        self.addCleanup(get_backend().reset)
+        User.objects.create_user("dave", password="correct-horse")
+
+    def test_login_attempts_are_limited_per_ip(self):
+        url = reverse("login")
+        for _ in range(10):
+            response = self.client.post(url, {"username": "dave", "password": "wrong"})
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(url, {"username": "dave", "password": "wrong"})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response["Retry-After"]) >= 1)
+
+        # A different client is unaffected
+        response = self.client.post(url, {"username": "dave", "password": "correct-horse"}, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 302)
@@ -2,7 +2,10 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.models import User
+from twain_core.ratelimit import ratelimit
 
+# Each attempt costs a PBKDF2 hash, so cap guesses per client
+@ratelimit(key="ip", rate="10/m")
 def login_view(request):
     if request.method == "POST":
         username = request.POST.get("username")
@@ -0,0 +1,63 @@
+"""
+Set-based bulk actions for the admin inbox and client list.
+
+Each action is one UPDATE or DELETE over the chosen rows, the ticked ids
+or everything matching the current filter, inside one transaction, in
+place of a get_object_or_404() and save() per row. Bulk statements don't
+send model signals, so the hooks those signals would run are called
+here: the admin dashboard counters are adjusted (dashboard.counters), and
+every affected row gets a django.contrib.admin LogEntry, the audit trail
+the Django admin keeps for its own edits, written in one INSERT.
+"""
+from django.contrib.admin.models import CHANGE, DELETION, LogEntry
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from dashboard.counters import adjust, delete_messages_without_signals
+
+
+def selected(queryset, data):
+    """The rows of ``queryset`` picked in a bulk form: the ticked ids, or all of them for scope=filter."""
+    if data.get("scope") == "filter":
+        return queryset
+    return queryset.filter(pk__in=[pk for pk in data.getlist("ids") if pk.isdigit()])
+
+
+def audit(user, rows, action_flag, change_message=""):
+    LogEntry.objects.log_actions(user.pk, rows, action_flag, change_message=change_message)
+
+
+def mark_messages(user, queryset, is_read):
+    """Mark the messages read (or unread); returns how many changed."""
+    with transaction.atomic():
+        changing = queryset.filter(is_read=not is_read).order_by()
+        rows = list(changing.select_for_update().only("id", "name", "email"))
+        audit(user, rows, CHANGE, [{"changed": {"fields": ["Is read"]}}])
+        changed = changing.update(is_read=is_read)
+        adjust(unread_count=-changed if is_read else changed)
+    return changed
+
+
+def delete_messages(user, queryset):
+    """Delete the messages; returns how many were deleted."""
+    with transaction.atomic():
+        rows = list(queryset.order_by().select_for_update().only("id", "name", "email"))
+        audit(user, rows, DELETION)
+        return delete_messages_without_signals(queryset)
+
+
+def set_subscription_status(user, queryset, status):
+    """Activate or cancel the subscriptions; returns how many changed."""
+    now = timezone.now()
+    if status == "active":
+        changes, labels = {"status": "active", "started_at": Coalesce(F("started_at"), Value(now))}, ["Status", "Started at"]
+    else:
+        changes, labels = {"status": "canceled", "canceled_at": now}, ["Status", "Canceled at"]
+    with transaction.atomic():
+        changing = queryset.exclude(status=status).order_by()
+        # The plan join is nullable, so only the subscription rows themselves can be locked
+        rows = list(changing.select_for_update(of=("self",)).select_related("user", "plan"))
+        audit(user, rows, CHANGE, [{"changed": {"fields": labels}}])
+        return changing.update(**changes)
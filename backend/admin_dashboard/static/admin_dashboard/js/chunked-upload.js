@@ -0,0 +1,121 @@
+/*
+ * Resumable uploads for Knowledge article videos and attachments.
+ *
+ * Files are sent in the chunk size chosen by the server, a few chunks at a
+ * time, each with an X-Chunk-SHA256 header. The upload id is remembered in
+ * localStorage, so choosing the same file again after a dropped connection
+ * or a closed tab only sends the chunks the server has not received.
+ * crypto.subtle needs a secure context (HTTPS or localhost).
+ */
+(function () {
+  "use strict";
+
+  var PARALLEL = 3;
+  var RETRIES = 3;
+
+  function hex(buffer) {
+    return Array.prototype.map.call(new Uint8Array(buffer), function (b) {
+      return b.toString(16).padStart(2, "0");
+    }).join("");
+  }
+
+  function request(method, url, csrf, body, headers) {
+    var init = { method: method, credentials: "same-origin", headers: Object.assign({ "X-CSRFToken": csrf }, headers || {}) };
+    if (body !== undefined) init.body = body;
+    return fetch(url, init).then(function (response) {
+      if (response.status === 204) return {};
+      return response.json().then(function (data) {
+        if (!response.ok) throw new Error(data.error || response.statusText);
+        return data;
+      });
+    });
+  }
+
+  function start(widget, file) {
+    var base = widget.dataset.uploadUrl;
+    var csrf = widget.querySelector("[name=csrfmiddlewaretoken]").value;
+    var progress = widget.querySelector(".progress-bar");
+    var status = widget.querySelector(".upload-status");
+    var nameInput = widget.querySelector("[name=attachment_name]");
+    var key = ["chunked-upload", widget.dataset.article, widget.dataset.target, file.name, file.size, file.lastModified].join(":");
+
+    function show(done, total) {
+      var percent = Math.round((done / total) * 100);
+      progress.style.width = percent + "%";
+      progress.textContent = percent + "%";
+    }
+
+    function open() {
+      var existing = localStorage.getItem(key);
+      var resume = existing
+        ? request("GET", base + existing + "/", csrf).catch(function () { return null; })
+        : Promise.resolve(null);
+      return resume.then(function (state) {
+        if (state && state.status === "uploading") return state;
+        return request("POST", base, csrf, JSON.stringify({
+          article: widget.dataset.article,
+          target: widget.dataset.target,
+          filename: file.name,
+          size: file.size,
+          name: nameInput ? nameInput.value : "",
+        }), { "Content-Type": "application/json" }).then(function (created) {
+          localStorage.setItem(key, created.id);
+          return created;
+        });
+      });
+    }
+
+    function send(state, index, attempt) {
+      var blob = file.slice(index * state.chunk_size, Math.min(file.size, (index + 1) * state.chunk_size));
+      return blob.arrayBuffer().then(function (data) {
+        return crypto.subtle.digest("SHA-256", data).then(function (digest) {
+          return request("PUT", base + state.id + "/chunks/" + index + "/", csrf, data, {
+            "Content-Type": "application/octet-stream",
+            "X-Chunk-SHA256": hex(digest),
+          });
+        });
+      }).catch(function (error) {
+        if (attempt >= RETRIES) throw error;
+        return send(state, index, attempt + 1);
+      });
+    }
+
+    status.textContent = "Uploading " + file.name + "…";
+    open().then(function (state) {
+      var received = new Set(state.received);
+      var pending = [];
+      for (var i = 0; i < state.total_chunks; i++) {
+        if (!received.has(i)) pending.push(i);
+      }
+      var done = received.size;
+      show(done, state.total_chunks);
+
+      function worker() {
+        var index = pending.shift();
+        if (index === undefined) return Promise.resolve();
+        return send(state, index, 1).then(function () {
+          show(++done, state.total_chunks);
+          return worker();
+        });
+      }
+
+      var workers = [];
+      for (var w = 0; w < PARALLEL; w++) workers.push(worker());
+      return Promise.all(workers).then(function () {
+        return request("POST", base + state.id + "/complete/", csrf);
+      });
+    }).then(function (result) {
+      localStorage.removeItem(key);
+      status.textContent = "Uploaded: " + result.name;
+    }).catch(function (error) {
+      status.textContent = "Upload interrupted (" + error.message + "). Choose the same file again to resume.";
+    });
+  }
+
+  document.querySelectorAll("[data-chunked-upload]").forEach(function (widget) {
+    var input = widget.querySelector("input[type=file]");
+    input.addEventListener("change", function () {
+      if (input.files.length) start(widget, input.files[0]);
+    });
+  });
+})();
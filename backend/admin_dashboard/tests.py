@@ -1,3 +1,117 @@
+from datetime import timedelta
+
+from django.contrib.admin.models import CHANGE, DELETION, LogEntry
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from dashboard.counters import get_counters
+from dashboard.models import ArchivedMessage, Message, SubscriptionPlan, UserSubscription
+from dashboard.pagination import message_page
+
+
+class MessageInboxTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for n in range(7):
+            Message.objects.create(name=f"Sender {n}", description="x" * 5000, is_read=n % 2 == 0)
+        # Two messages share a timestamp, so the id has to break the tie
+        for n, message in enumerate(Message.objects.order_by("id")):
+            Message.objects.filter(pk=message.pk).update(created_at=now - timedelta(minutes=min(n, 5)))
+
+    def test_pages_follow_created_at_then_id(self):
+        expected = list(Message.objects.order_by("-created_at", "id").values_list("pk", flat=True))
+        seen, cursor = [], None
+        while True:
+            page, cursor = message_page(Message.objects.all(), cursor, page_size=3)
+            seen += [m.pk for m in page]
+            if not cursor:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_starts_from_the_top(self):
+        first, _ = message_page(Message.objects.all(), None, page_size=3)
+        self.assertEqual(message_page(Message.objects.all(), "bad", page_size=3)[0], first)
+
+    def test_home_tiles_are_one_row_read(self):
+        self.client.force_login(User.objects.create_user("admin"))
+        with self.assertNumQueries(5):  # session, user, counters, recent projects, recent messages
+            response = self.client.get(reverse("admin_dashboard_home"))
+        self.assertEqual((response.context["message_count"], response.context["unread_count"]), (7, 3))
+
+    def test_inbox_counts_in_one_query_and_defers_bodies(self):
+        self.client.force_login(User.objects.create_user("admin"))
+        with self.assertNumQueries(4):  # session, user, one page, the counters row
+            response = self.client.get(reverse("admin_messages"), {"status": "unread"})
+        self.assertEqual((response.context["message_count"], response.context["unread_count"]), (7, 3))
+        messages = response.context["messages"]
+        self.assertEqual(len(messages), 3)
+        self.assertTrue(all(not m.is_read for m in messages))
+        self.assertEqual(messages[0].get_deferred_fields(), {"description", "problem"})
+        self.assertIsNone(response.context["next_cursor"])
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin")
+        self.client.force_login(self.admin)
+        self.messages = [Message.objects.create(name=f"Sender {n}", is_read=n < 2) for n in range(6)]
+
+    def post(self, url_name, **data):
+        return self.client.post(reverse(url_name), data)
+
+    def test_marking_costs_the_same_queries_for_any_selection(self):
+        unread = [m.pk for m in self.messages[2:]]
+        with self.assertNumQueries(8) as few:  # session, user, savepoint, select, log insert, update, counters, release
+            self.post("admin_messages_bulk", action="mark_read", ids=unread[:1])
+        with self.assertNumQueries(len(few.captured_queries)):
+            response = self.post("admin_messages_bulk", action="mark_read", ids=unread[1:], status="unread")
+        self.assertRedirects(response, reverse("admin_messages") + "?status=unread", fetch_redirect_response=False)
+        self.assertFalse(Message.objects.filter(is_read=False).exists())
+        self.assertEqual(get_counters()["unread_count"], 0)
+        self.assertEqual(LogEntry.objects.filter(action_flag=CHANGE, user=self.admin).count(), 4)
+
+    def test_delete_whole_filter(self):
+        self.post("admin_messages_bulk", action="delete", scope="filter", status="read")
+        self.assertEqual(Message.objects.count(), 4)
+        self.assertFalse(Message.objects.filter(is_read=True).exists())
+        counters = get_counters()
+        self.assertEqual((counters["message_count"], counters["unread_count"]), (4, 4))
+        deleted = LogEntry.objects.filter(action_flag=DELETION).values_list("object_id", flat=True)
+        self.assertEqual(sorted(deleted), sorted(str(m.pk) for m in self.messages[:2]))
+
+    def test_unknown_action_is_rejected(self):
+        response = self.post("admin_messages_bulk", action="archive", scope="filter")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Message.objects.count(), 6)
+
+    def test_client_activation_and_cancellation(self):
+        plan = SubscriptionPlan.objects.create(name="Basic", slug="basic", price_kes=1000)
+        started = timezone.now() - timedelta(days=30)
+        subs = [
+            UserSubscription.objects.create(user=User.objects.create_user(f"client{n}"), plan=plan, started_at=started if n else None)
+            for n in range(3)
+        ]
+        self.post("admin_clients_bulk", action="activate", ids=[subs[0].pk, subs[1].pk])
+        subs[0].refresh_from_db()
+        subs[1].refresh_from_db()
+        self.assertEqual((subs[0].status, subs[1].status), ("active", "active"))
+        self.assertIsNotNone(subs[0].started_at)
+        self.assertEqual(subs[1].started_at, started)
+
+        self.post("admin_clients_bulk", action="cancel", scope="filter")
+        self.assertEqual(set(UserSubscription.objects.values_list("status", flat=True)), {"canceled"})
+        self.assertFalse(UserSubscription.objects.filter(canceled_at=None).exists())
+        self.assertEqual(LogEntry.objects.filter(action_flag=CHANGE).count(), 5)
+
 
-# Create your tests here.
+class MessageArchiveViewTests(TestCase):
+    def test_archive_is_searchable(self):
+        now = timezone.now()
+        for n, text in enumerate(["Needs a WhatsApp bot", "Instagram replies", "WhatsApp catalogue"]):
+            ArchivedMessage.objects.create(id=n + 1, kind="contact", name=f"Sender {n}", description=text, created_at=now - timedelta(days=n))
+        self.client.force_login(User.objects.create_user("admin"))
+        response = self.client.get(reverse("admin_message_archive"), {"q": "whatsapp"})
+        self.assertEqual([m.name for m in response.context["archived"]], ["Sender 0", "Sender 2"])
+        self.assertContains(response, "Needs a WhatsApp bot")
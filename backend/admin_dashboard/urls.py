@@ -6,6 +6,8 @@ urlpatterns = [
 
     # Messages
     path("messages/", views.admin_messages, name="admin_messages"),
+    path("messages/bulk/", views.admin_messages_bulk, name="admin_messages_bulk"),
+    path("messages/archive/", views.admin_message_archive, name="admin_message_archive"),
     path("messages/<int:pk>/", views.admin_message_detail, name="admin_message_detail"),
     path("messages/<int:pk>/toggle-read/", views.admin_message_toggle_read, name="admin_message_toggle_read"),
     path("messages/<int:pk>/delete/", views.admin_message_delete, name="admin_message_delete"),
@@ -38,6 +40,7 @@ urlpatterns = [
     # Other admin sections
     path("analytics/", views.analytics, name="admin_analytics"),
     path("clients/", views.clients, name="admin_clients"),
+    path("clients/bulk/", views.admin_clients_bulk, name="admin_clients_bulk"),
     path("clients/<int:pk>/activate/", views.admin_client_activate, name="admin_client_activate"),
     path("clients/<int:pk>/cancel/", views.admin_client_cancel, name="admin_client_cancel"),
     path("projects/", views.projects, name="admin_projects"),
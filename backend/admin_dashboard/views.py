@@ -1,12 +1,19 @@
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import HttpResponseBadRequest
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import urlencode
 
 from dashboard.models import (
     Message, Service, CaseStudy, Client, Project, Testimonial,
     UserSubscription, KnowledgeCategory, KnowledgeArticle, Tool
 )
+from dashboard.archive import search_archive
+from dashboard.counters import get_counters
+from dashboard.pagination import message_page
+from . import bulk
 from .forms import KnowledgeCategoryForm, KnowledgeArticleForm, ToolForm
 
 
@@ -14,11 +21,8 @@ from .forms import KnowledgeCategoryForm, KnowledgeArticleForm, ToolForm
 @login_required
 def admin_dashboard_home(request):
     context = {
-        "message_count": Message.objects.count(),
-        "unread_count": Message.objects.filter(is_read=False).count(),
-        "service_count": Service.objects.count(),
-        "case_count": CaseStudy.objects.count(),
-        "client_count": Client.objects.count(),
+        # Tile counts are one row, kept up to date by dashboard.counters
+        **get_counters(),
         "recent_projects": Project.objects.order_by('-created_at')[:5],
         "recent_messages": Message.objects.order_by('-created_at')[:5],
     }
@@ -26,20 +30,33 @@ def admin_dashboard_home(request):
 
 
 # --- Messages ---
-@login_required
-def admin_messages(request):
-    status = request.GET.get("status")  # 'all', 'read', 'unread'
-    qs = Message.objects.all().order_by("-created_at")
+def filtered_messages(status):
+    """Messages shown under a status tab: 'all', 'read' or 'unread'."""
+    qs = Message.objects.all()
     if status == "read":
         qs = qs.filter(is_read=True)
     elif status == "unread":
         qs = qs.filter(is_read=False)
+    return qs
+
+
+def messages_url(status):
+    url = reverse("admin_messages")
+    return f"{url}?{urlencode({'status': status})}" if status in ("read", "unread") else url
+
+
+@login_required
+def admin_messages(request):
+    status = request.GET.get("status")  # 'all', 'read', 'unread'
+    # The list shows senders and dates; the message bodies are only read on the detail page
+    qs = filtered_messages(status).defer("description", "problem")
+    page, next_cursor = message_page(qs, request.GET.get("cursor"))
 
     context = {
-        "messages": qs,
+        "messages": page,
+        "next_cursor": next_cursor,
         "status": status or "all",
-        "message_count": Message.objects.count(),
-        "unread_count": Message.objects.filter(is_read=False).count(),
+        **get_counters(),
     }
     return render(request, "admin_dashboard/messages/list.html", context)
 
@@ -66,6 +83,34 @@ def admin_message_delete(request, pk):
     msg.delete()
     return redirect("admin_messages")
 
+@login_required
+def admin_message_archive(request):
+    """Archived messages, newest first, optionally narrowed by a search."""
+    query = request.GET.get("q", "").strip()
+    page, next_cursor = message_page(search_archive(query), request.GET.get("cursor"))
+    return render(request, "admin_dashboard/messages/archive.html", {
+        "archived": page,
+        "next_cursor": next_cursor,
+        "query": query,
+    })
+
+@login_required
+@require_POST
+def admin_messages_bulk(request):
+    """Mark read, mark unread or delete the ticked messages, or every message under the current tab."""
+    status = request.POST.get("status")
+    rows = bulk.selected(filtered_messages(status), request.POST)
+    action = request.POST.get("action")
+    if action == "mark_read":
+        bulk.mark_messages(request.user, rows, True)
+    elif action == "mark_unread":
+        bulk.mark_messages(request.user, rows, False)
+    elif action == "delete":
+        bulk.delete_messages(request.user, rows)
+    else:
+        return HttpResponseBadRequest("Unknown action")
+    return redirect(messages_url(status))
+
 
 # --- Analytics ---
 def analytics(request):
@@ -78,6 +123,7 @@ def clients(request):
     subscriptions = UserSubscription.objects.select_related("user", "plan").order_by("-started_at")
     return render(request, "admin_dashboard/clients.html", {"subscriptions": subscriptions})
 
+@login_required
 @require_POST
 def admin_client_activate(request, pk):
     sub = get_object_or_404(UserSubscription, pk=pk)
@@ -86,6 +132,7 @@ def admin_client_activate(request, pk):
     sub.save()
     return redirect("admin_clients")
 
+@login_required
 @require_POST
 def admin_client_cancel(request, pk):
     sub = get_object_or_404(UserSubscription, pk=pk)
@@ -94,6 +141,17 @@ def admin_client_cancel(request, pk):
     sub.save()
     return redirect("admin_clients")
 
+@login_required
+@require_POST
+def admin_clients_bulk(request):
+    """Activate or cancel the ticked subscriptions, or all of them."""
+    action = request.POST.get("action")
+    if action not in ("activate", "cancel"):
+        return HttpResponseBadRequest("Unknown action")
+    rows = bulk.selected(UserSubscription.objects.all(), request.POST)
+    bulk.set_subscription_status(request.user, rows, "active" if action == "activate" else "canceled")
+    return redirect("admin_clients")
+
 
 # --- Content Manager Overview ---
 @login_required
@@ -12,6 +12,7 @@ def index(request):
 
         # Save message to database
         Message.objects.create(
+            kind="contact",
             name=name,
             email=email,
             business_name=business_name,
@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import ContactMessage, SubscriptionPlan, SupportMessage, Tool, UserSubscription
+from .models import ArchivedMessage, ContactMessage, SubscriptionPlan, SupportMessage, Tool, UserSubscription
 from .models import KnowledgeCategory, KnowledgeArticle, KnowledgeAttachment
+from .archive import search_archive
+from .search import filter_queryset
 
 
 
@@ -80,6 +82,10 @@ class KnowledgeArticleAdmin(admin.ModelAdmin):
     )
     readonly_fields = ("published_at", "updated_at")
 
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the full-text index rather than LIKE over search_fields
+        return filter_queryset(queryset, search_term), False
+
 # Tools We Use 
 @admin.register(Tool)
 class ToolAdmin(admin.ModelAdmin):
@@ -95,12 +101,8 @@ class ContactMessageAdmin(admin.ModelAdmin):
     list_display = ("name", "email", "business_name", "platform", "description", "created_at", "is_read")
     list_filter = ("platform", "is_read")
     search_fields = ("name", "email", "business_name", "description")
-    ordering = ("-created_at",)
-
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        # Only show messages that look like contact requests
-        return qs.exclude(name="").exclude(email="").exclude(business_name="")
+    # The proxy's manager selects the kind; this ordering matches message_contact_idx
+    ordering = ("-created_at", "id")
 
 
 @admin.register(SupportMessage)
@@ -108,9 +110,23 @@ class SupportMessageAdmin(admin.ModelAdmin):
     list_display = ("problem", "urgency", "created_at", "is_read")
     list_filter = ("urgency", "is_read")
     search_fields = ("problem",)
-    ordering = ("-created_at",)
+    ordering = ("-created_at", "id")
+
+
+@admin.register(ArchivedMessage)
+class ArchivedMessageAdmin(admin.ModelAdmin):
+    # Filled by manage.py archive_messages; read-only here
+    list_display = ("name", "email", "kind", "created_at", "archived_at")
+    list_filter = ("kind",)
+    search_fields = ("name", "email", "business_name", "description", "problem")
+    ordering = ("-created_at", "id")
+
+    def get_search_results(self, request, queryset, search_term):
+        # The archive's full-text index in place of icontains over every search field
+        return search_archive(search_term, queryset), False
+
+    def has_add_permission(self, request):
+        return False
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        # Only show messages that look like support tickets
-        return qs.exclude(problem="")
+    def has_change_permission(self, request, obj=None):
+        return False
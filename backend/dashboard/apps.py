@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        # Connect the admin counter, page validator, article rendering, image,
+        # search index, related-article and view-count signals
+        from . import conditional, counters, images, popularity, related, rendering, search  # noqa: F401
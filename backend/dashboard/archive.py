@@ -0,0 +1,77 @@
+"""
+Hot/cold archival of messages.
+
+Read messages older than MESSAGE_ARCHIVE_AFTER_DAYS move from Message to
+ArchivedMessage, so the inbox, its counters and the contact/support admins
+only work over recent or unread mail and their indexes stay small. The
+archive keeps every column and the original ids, and is browsed and
+searched from its own admin view.
+
+``manage.py archive_messages`` (run from cron) moves rows in batches; each
+batch is copied and deleted in one transaction, so an interrupted run
+leaves every message in exactly one of the two tables and the next run
+carries on from there.
+
+The archive only grows, so its search is indexed like the Knowledge
+Centre's (dashboard.search): an external-content FTS5 table kept in step
+by triggers on SQLite, a generated tsvector column with a GIN index on
+PostgreSQL (migration 0026). Both match whole words and word prefixes,
+not arbitrary substrings; other databases fall back to ``icontains``.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .counters import delete_messages_without_signals
+from .models import ArchivedMessage, Message
+from .search import search_terms
+
+BATCH_SIZE = 500
+FIELDS = [field.attname for field in ArchivedMessage._meta.concrete_fields if field.name != "archived_at"]
+SEARCH_FIELDS = ("name", "email", "business_name", "platform", "description", "problem")
+SEARCH_TABLE = "dashboard_archivedmessage_search"
+
+
+def archive_messages(older_than, batch_size=BATCH_SIZE):
+    """Move read messages created before now - ``older_than`` into the archive; returns how many moved."""
+    cutoff = timezone.now() - older_than
+    # Served by message_read_idx
+    candidates = Message.objects.filter(is_read=True, created_at__lt=cutoff).order_by("created_at")
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(candidates.select_for_update().values(*FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            ArchivedMessage.objects.bulk_create(ArchivedMessage(**row) for row in rows)
+            deleted = delete_messages_without_signals(Message.objects.filter(pk__in=[row["id"] for row in rows]))
+        moved += deleted
+
+
+def match_sql(terms):
+    """SQL selecting the ids of archived messages that contain every term (as a word prefix), or None."""
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        return f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match]
+    if connection.vendor == "postgresql":
+        match = " & ".join(f"{term}:*" for term in terms)
+        return "SELECT id FROM dashboard_archivedmessage WHERE search_document @@ to_tsquery('simple', %s)", [match]
+    return None
+
+
+def search_archive(query, queryset=None):
+    """Archived messages (from ``queryset``, all by default) containing every word of ``query``."""
+    archived = ArchivedMessage.objects.all() if queryset is None else queryset
+    terms = search_terms(query)
+    if not terms:
+        return archived
+    sql = match_sql(terms)
+    if sql is not None:
+        return archived.filter(pk__in=RawSQL(*sql))
+    for term in terms:
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f"{field}__icontains": term})
+        archived = archived.filter(condition)
+    return archived
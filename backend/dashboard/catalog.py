@@ -0,0 +1,60 @@
+"""
+Cached catalog of active subscription plans.
+
+All active plans are loaded in one query, their feature lists parsed once,
+and the result kept in Django's cache under a key derived from the plans
+table itself: its row count and newest updated_at. Saving a plan moves the
+time and deleting one changes the count, so every process sees the new key
+on its next read, whichever process made the change and however the cache
+is configured; stale entries simply expire. A read costs one aggregate
+query in place of loading and parsing the plans. ``QuerySet.update()``
+doesn't touch updated_at; call ``invalidate_catalog()`` after bulk updates.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+
+from .conditional import table_stamp
+from .models import SubscriptionPlan
+
+CATALOG_TIMEOUT = 60 * 60
+
+
+def catalog_key(stamp):
+    count, updated = stamp
+    return f"plan_catalog:{count}:{updated.isoformat() if updated else ''}"
+
+
+def invalidate_catalog():
+    """Move the plans' stamp on after a change that didn't set updated_at."""
+    SubscriptionPlan.objects.update(updated_at=timezone.now())
+
+
+def build_catalog():
+    """Load active plans in one query, grouped by plan type, with features pre-parsed."""
+    catalog = {"monthly_plans": [], "one_time_plans": []}
+    for plan in SubscriptionPlan.objects.filter(is_active=True).order_by("sort_order", "price_kes"):
+        plan._feature_list = plan.feature_list()
+        if plan.plan_type == "monthly":
+            catalog["monthly_plans"].append(plan)
+        elif plan.plan_type == "one_time":
+            catalog["one_time_plans"].append(plan)
+    return catalog
+
+
+def get_catalog(stamp=None):
+    """
+    Return {"monthly_plans": [...], "one_time_plans": [...]}, ready to
+    merge into a template context.
+
+    Even with the cache warm this is one query, the plans' table_stamp,
+    since the key depends on it; the cache saves loading and parsing the
+    plans. Views that have already read the stamp (for their ETag) pass it
+    in, which makes a warm read free.
+    """
+    key = catalog_key(stamp or table_stamp(SubscriptionPlan))
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_catalog()
+        cache.set(key, catalog, CATALOG_TIMEOUT)
+    return catalog
+
@@ -0,0 +1,114 @@
+"""
+ETag and Last-Modified validators for rarely-changing dashboard pages.
+
+Each page is validated from one aggregate query: the article's updated_at
+and content_hash (which moves when rerender_articles rewrites the HTML)
+plus its attachments, or the newest updated_at and row count of the tools
+or plans. Views use them through Django's ``condition`` decorator, so a
+matching If-None-Match / If-Modified-Since gets 304 before any template is
+rendered. The ETag also covers the templates' modification times, so a
+deploy that changes markup doesn't leave browsers on the old page.
+"""
+import functools
+import hashlib
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import KnowledgeArticle, SubscriptionPlan, Tool
+
+
+@functools.lru_cache(maxsize=None)
+def template_fingerprint():
+    directories = [Path(__file__).parent / "templates", *map(Path, settings.TEMPLATES[0]["DIRS"])]
+    newest = max((path.stat().st_mtime_ns for d in directories for path in d.rglob("*.html")), default=0)
+    return str(newest)
+
+
+def make_etag(*parts):
+    raw = ":".join(str(part) for part in (template_fingerprint(), *parts))
+    return f'"{hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def memoized(name):
+    """Cache a validator's query on the request: condition() asks for the ETag and Last-Modified separately."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(request, *args, **kwargs):
+            attr = f"_stamp_{name}"
+            if not hasattr(request, attr):
+                setattr(request, attr, func(request, *args, **kwargs))
+            return getattr(request, attr)
+        return wrapper
+    return decorator
+
+
+def table_stamp(model):
+    """(row count, newest updated_at): deletes change the count, edits and inserts the time."""
+    stamp = model.objects.aggregate(count=Count("id"), updated=Max("updated_at"))
+    return stamp["count"], stamp["updated"]
+
+
+# --- Knowledge article ---
+@memoized("article")
+def article_stamp(request, slug):
+    rows = (
+        KnowledgeArticle.objects.filter(slug=slug, is_published=True)
+        .order_by()
+        .values("updated_at", "content_hash")
+        .annotate(attachment_count=Count("attachments"), latest_attachment=Max("attachments__id"))
+    )
+    return next(iter(rows[:1]), None)
+
+
+def article_etag(request, slug):
+    stamp = article_stamp(request, slug)
+    if stamp is None:
+        return None  # let the view render its 404
+    return make_etag(
+        "article", slug, stamp["updated_at"].isoformat(), stamp["content_hash"],
+        stamp["attachment_count"], stamp["latest_attachment"],
+    )
+
+
+def article_last_modified(request, slug):
+    stamp = article_stamp(request, slug)
+    return stamp["updated_at"] if stamp else None
+
+
+@receiver([post_save, post_delete], sender="dashboard.KnowledgeAttachment")
+def touch_article(sender, instance, raw=False, **kwargs):
+    # An edited attachment changes the article page; update() skips the article's save signals
+    if not raw:
+        KnowledgeArticle.objects.filter(pk=instance.article_id).update(updated_at=timezone.now())
+
+
+# --- Tools and plans ---
+@memoized("tools")
+def tools_stamp(request):
+    return table_stamp(Tool)
+
+
+def tools_etag(request):
+    return make_etag("tools", *tools_stamp(request))
+
+
+def tools_last_modified(request):
+    return tools_stamp(request)[1]
+
+
+@memoized("plans")
+def plans_stamp(request):
+    return table_stamp(SubscriptionPlan)
+
+
+def plans_etag(request):
+    return make_etag("plans", *plans_stamp(request))
+
+
+def plans_last_modified(request):
+    return plans_stamp(request)[1]
@@ -0,0 +1,139 @@
+"""
+Denormalized row counts for the admin dashboard tiles.
+
+AdminCounters is one row holding the number of messages (and unread ones),
+services, case studies and clients. Save and delete signals on those
+models, proxies included, adjust it with atomic ``F() + n`` updates, so
+the tiles are a single primary-key read however large the tables grow.
+
+``QuerySet.update()`` and ``bulk_create()`` send no signals: code that
+uses them calls ``adjust()`` with the change. Anything else that bypasses
+the ORM (fixtures, raw SQL, a crash between a write and its increment)
+leaves drift, which ``manage.py reconcile_counters`` corrects; run it
+from cron.
+"""
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from .models import AdminCounters, CaseStudy, Client, Message, Service
+
+COUNTER_ID = 1
+FIELDS = ("message_count", "unread_count", "service_count", "case_count", "client_count")
+# Models counted by row alone; messages also track is_read
+COUNTED = {Service: "service_count", CaseStudy: "case_count", Client: "client_count"}
+
+
+def recount():
+    """Exact counts from the tables themselves."""
+    counts = Message.objects.aggregate(message_count=Count("id"), unread_count=Count("id", filter=Q(is_read=False)))
+    for model, field in COUNTED.items():
+        counts[field] = model.objects.count()
+    return counts
+
+
+def reconcile():
+    """Overwrite the counters with exact counts; returns {field: drift} for the ones that were off."""
+    with transaction.atomic():
+        # Write first, so the row is locked while counting and no increment slips in between
+        if not AdminCounters.objects.filter(pk=COUNTER_ID).update(reconciled_at=timezone.now()):
+            AdminCounters.objects.create(pk=COUNTER_ID, reconciled_at=timezone.now(), **recount())
+            return {}
+        stored = AdminCounters.objects.filter(pk=COUNTER_ID).values(*FIELDS).get()
+        counts = recount()
+        drift = {field: stored[field] - counts[field] for field in FIELDS if stored[field] != counts[field]}
+        if drift:
+            AdminCounters.objects.filter(pk=COUNTER_ID).update(**counts)
+    return drift
+
+
+def adjust(**deltas):
+    """Add ``deltas`` ({field: n}) to the counters in one UPDATE."""
+    deltas = {field: n for field, n in deltas.items() if n}
+    if not deltas:
+        return
+    if not AdminCounters.objects.filter(pk=COUNTER_ID).update(**{field: F(field) + n for field, n in deltas.items()}):
+        reconcile()  # no row yet; the recount already includes this change
+
+
+def delete_messages_without_signals(queryset):
+    """
+    Delete the messages in ``queryset`` with one DELETE and adjust the
+    counters; returns how many were deleted. Call it inside a transaction.
+
+    ``QuerySet.delete()`` loads every row again to send post_delete, which
+    is what keeps the counters right one message at a time. Nothing
+    references a Message, so there is nothing for it to cascade, and a bulk
+    delete can skip the collector and count the change once: the DELETE is
+    issued directly, over the queryset's primary keys as a subquery.
+    """
+    queryset = queryset.order_by()
+    unread = queryset.filter(is_read=False).count()
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    select, params = queryset.values("pk").query.sql_with_params()
+    table, pk = Message._meta.db_table, Message._meta.pk.column
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {quote(table)} WHERE {quote(pk)} IN ({select})", params)
+        deleted = cursor.rowcount
+    adjust(message_count=-deleted, unread_count=-unread)
+    return deleted
+
+
+def get_counters():
+    """{"message_count", "unread_count", "service_count", "case_count", "client_count"}, ready for a template context."""
+    counters = AdminCounters.objects.filter(pk=COUNTER_ID).values(*FIELDS).first()
+    if counters is None:
+        reconcile()
+        counters = AdminCounters.objects.filter(pk=COUNTER_ID).values(*FIELDS).get()
+    return counters
+
+
+# --- Signals ---
+def message_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Remember whether an existing message was unread, to count the change after saving
+    instance._was_unread = None
+    if raw or instance._state.adding or (update_fields is not None and "is_read" not in update_fields):
+        return
+    was_read = Message.objects.filter(pk=instance.pk).values_list("is_read", flat=True).first()
+    if was_read is not None:
+        instance._was_unread = not was_read
+
+
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adjust(message_count=1, unread_count=int(not instance.is_read))
+    elif instance._was_unread is not None:
+        adjust(unread_count=int(not instance.is_read) - int(instance._was_unread))
+
+
+def message_deleted(sender, instance, **kwargs):
+    adjust(message_count=-1, unread_count=-int(not instance.is_read))
+
+
+def row_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust(**{COUNTED[sender._meta.concrete_model]: 1})
+
+
+def row_deleted(sender, instance, **kwargs):
+    adjust(**{COUNTED[sender._meta.concrete_model]: -1})
+
+
+def senders(model):
+    """``model`` and its proxies; signals are sent with the class that was saved."""
+    return [m for m in apps.get_models() if m._meta.concrete_model is model]
+
+
+for sender in senders(Message):
+    pre_save.connect(message_saving, sender=sender)
+    post_save.connect(message_saved, sender=sender)
+    post_delete.connect(message_deleted, sender=sender)
+for model in COUNTED:
+    for sender in senders(model):
+        post_save.connect(row_saved, sender=sender)
+        post_delete.connect(row_deleted, sender=sender)
@@ -0,0 +1,188 @@
+"""
+Responsive derivatives for Knowledge article feature images.
+
+When an article's feature_image changes, resized AVIF, WebP and JPEG copies
+are written under ``<upload dir>/derivatives/<stem>/`` by a small background
+thread pool and listed in ``image_variants``. ``responsive_image()`` turns
+that list into <picture>/srcset data for templates. Existing uploads are
+backfilled with ``manage.py build_image_derivatives``.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 960, 1280, 1920)
+# (format, MIME type, save options), best compression first. JPEG comes last
+# because it is the <img> fallback every browser can show.
+FORMATS = [
+    ("avif", "image/avif", {"quality": 50}),
+    ("webp", "image/webp", {"quality": 75, "method": 4}),
+    ("jpeg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+]
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt[0] == "jpeg" or features.check(fmt[0])]
+
+
+def derivative_dir(name):
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, "derivatives", posixpath.splitext(filename)[0])
+
+
+def target_widths(width):
+    """Standard widths below the original, plus the original when it is small enough."""
+    widths = [w for w in WIDTHS if w < width]
+    if width <= WIDTHS[-1]:
+        widths.append(width)
+    return widths
+
+
+def build_derivatives(name, storage=None):
+    """Write every derivative of the image ``name`` and return its image_variants entry."""
+    storage = storage or default_storage
+    with storage.open(name, "rb") as source:
+        image = Image.open(source)
+        # Phone photos are often stored sideways with an EXIF rotation tag
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    items = []
+    directory = derivative_dir(name)
+    for width in target_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        for fmt, _, options in available_formats():
+            frame = resized
+            if fmt == "jpeg" and has_alpha:
+                flattened = Image.new("RGB", resized.size, "white")
+                flattened.paste(resized, mask=resized.getchannel("A"))
+                frame = flattened
+            buffer = BytesIO()
+            frame.save(buffer, fmt.upper(), **options)
+            path = storage.save(posixpath.join(directory, f"{width}w.{EXTENSIONS[fmt]}"), ContentFile(buffer.getvalue()))
+            items.append({"format": fmt, "width": width, "height": height, "name": path})
+    return {"source": name, "width": image.width, "height": image.height, "items": items}
+
+
+def delete_derivatives(variants, storage=None):
+    storage = storage or default_storage
+    for item in (variants or {}).get("items", []):
+        try:
+            storage.delete(item["name"])
+        except OSError:
+            logger.warning("Could not delete image derivative %s", item["name"])
+
+
+def responsive_image(image_field, variants, storage=None):
+    """
+    <picture> data for an image: ``sources`` (type + srcset, best format first),
+    and ``src``/``srcset``/``width``/``height`` for the <img> fallback. Until the
+    derivatives exist, only the original is offered, without dimensions.
+    """
+    if not image_field:
+        return None
+    storage = storage or default_storage
+    data = {"src": image_field.url, "srcset": "", "sources": [], "width": None, "height": None}
+    if (variants or {}).get("source") != image_field.name:
+        return data
+
+    by_format = {}
+    for item in variants["items"]:
+        by_format.setdefault(item["format"], []).append(item)
+
+    def srcset(items):
+        return ", ".join(f"{storage.url(item['name'])} {item['width']}w" for item in items)
+
+    for fmt, mime, _ in FORMATS:
+        items = by_format.get(fmt)
+        if not items:
+            continue
+        if fmt == "jpeg":
+            largest = items[-1]
+            data.update(src=storage.url(largest["name"]), srcset=srcset(items), width=largest["width"], height=largest["height"])
+        else:
+            data["sources"].append({"type": mime, "srcset": srcset(items)})
+    return data
+
+
+# --- Background processing ---
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2),
+                    thread_name_prefix="image-derivatives",
+                )
+    return _executor
+
+
+def record_variants(pk, name, variants, previous):
+    """Save ``variants`` unless the article's image changed meanwhile; drop whichever files are unused."""
+    from .models import KnowledgeArticle
+
+    updated = KnowledgeArticle.objects.filter(pk=pk, feature_image=name).update(image_variants=variants)
+    if not updated:
+        delete_derivatives(variants)
+    elif previous:
+        current = {item["name"] for item in variants["items"]}
+        delete_derivatives({"items": [item for item in previous.get("items", []) if item["name"] not in current]})
+    return bool(updated)
+
+
+def process_article(pk):
+    """Build derivatives for an article's current feature image (run by the pool)."""
+    from .models import KnowledgeArticle
+
+    try:
+        article = KnowledgeArticle.objects.filter(pk=pk).only("id", "feature_image", "image_variants").first()
+        if article is None:
+            return
+        name = article.feature_image.name or ""
+        if not name:
+            KnowledgeArticle.objects.filter(pk=pk).update(image_variants={})
+            delete_derivatives(article.image_variants)
+            return
+        record_variants(pk, name, build_derivatives(name), article.image_variants)
+    except Exception:
+        logger.exception("Failed to build image derivatives for article %s", pk)
+    finally:
+        if getattr(settings, "IMAGE_DERIVATIVES_ASYNC", True):
+            close_old_connections()
+
+
+def schedule(pk):
+    """Process the article after the current transaction commits, in the pool unless disabled."""
+    if getattr(settings, "IMAGE_DERIVATIVES_ASYNC", True):
+        transaction.on_commit(lambda: get_executor().submit(process_article, pk))
+    else:
+        transaction.on_commit(lambda: process_article(pk))
+
+
+@receiver(post_save, sender="dashboard.KnowledgeArticle")
+def feature_image_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if (instance.feature_image.name or "") != (instance.image_variants or {}).get("source", ""):
+        schedule(instance.pk)
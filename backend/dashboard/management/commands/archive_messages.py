@@ -0,0 +1,23 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dashboard.archive import BATCH_SIZE, archive_messages
+
+
+class Command(BaseCommand):
+    help = "Move read messages older than MESSAGE_ARCHIVE_AFTER_DAYS into the message archive. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.MESSAGE_ARCHIVE_AFTER_DAYS,
+            help="Archive read messages older than this many days.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Messages moved per transaction.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        moved = archive_messages(timedelta(days=options["days"]), batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} messages in {time.monotonic() - started:.1f}s."))
@@ -0,0 +1,46 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.related import compute
+
+
+def synthetic_corpus(articles, topics, vocabulary, words, seed):
+    """Articles drawn from topic-specific word distributions over a shared vocabulary."""
+    rng = random.Random(seed)
+    lexicon = [f"w{n}" for n in range(vocabulary)]
+    topic_words = [rng.sample(lexicon, 300) for _ in range(topics)]
+    corpus = []
+    for pk in range(1, articles + 1):
+        own = topic_words[rng.randrange(topics)]
+        # Mostly the topic's own words (Zipf-like: earlier words more often), the rest background
+        body = [own[min(int(rng.paretovariate(1.2)) - 1, 299)] if rng.random() < 0.6 else rng.choice(lexicon) for _ in range(words)]
+        corpus.append((pk, " ".join(body[:6]), " ".join(body[6:30]), " ".join(body)))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = "Time a full related-articles computation on a synthetic corpus (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--articles", type=int, default=50000)
+        parser.add_argument("--topics", type=int, default=500)
+        parser.add_argument("--vocabulary", type=int, default=40000)
+        parser.add_argument("--words", type=int, default=400, help="Words per article body.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--workers", type=int, default=1, help="Processes for the neighbour search.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        corpus = synthetic_corpus(options["articles"], options["topics"], options["vocabulary"], options["words"], options["seed"])
+        self.stdout.write(f"Generated {len(corpus)} articles in {time.monotonic() - started:.1f}s")
+
+        started = time.monotonic()
+        frequencies, vectors, neighbours = compute(lambda: iter(corpus), workers=options["workers"])
+        elapsed = time.monotonic() - started
+        entries = sum(len(vector) for vector in vectors.values())
+        self.stdout.write(
+            f"Rebuilt {len(vectors)} articles in {elapsed:.1f}s ({elapsed / max(len(vectors), 1) * 1000:.2f} ms/article): "
+            f"{len(frequencies)} terms, {entries} vector entries, {sum(map(len, neighbours.values()))} neighbour rows"
+        )
@@ -0,0 +1,43 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from dashboard.images import build_derivatives, record_variants
+from dashboard.models import KnowledgeArticle
+
+
+class Command(BaseCommand):
+    help = "Build responsive derivatives for existing Knowledge article feature images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Image processes (default: all cores).")
+        parser.add_argument("--force", action="store_true", help="Rebuild derivatives that are already up to date.")
+
+    def handle(self, *args, **options):
+        articles = KnowledgeArticle.objects.exclude(feature_image="").exclude(feature_image__isnull=True)
+        pending = [
+            article for article in articles.only("id", "feature_image", "image_variants").order_by("id")
+            if options["force"] or article.image_variants.get("source") != article.feature_image.name
+        ]
+        started = time.monotonic()
+        built = failed = 0
+
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {pool.submit(build_derivatives, article.feature_image.name): article for article in pending}
+            for future in as_completed(futures):
+                article = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as ex:
+                    failed += 1
+                    self.stderr.write(f"{article.feature_image.name}: {ex}")
+                    continue
+                record_variants(article.pk, article.feature_image.name, variants, article.image_variants)
+                built += 1
+                self.stdout.write(f"{article.feature_image.name}: {len(variants['items'])} derivatives")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built derivatives for {built} of {len(pending)} images in {time.monotonic() - started:.1f}s ({failed} failed)."
+        ))
@@ -0,0 +1,83 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import FileField
+
+from twain_core.storage import BLOB_DIR, ContentAddressedStorage, file_sha256, hashed_name, is_content_addressed
+
+
+class Command(BaseCommand):
+    help = (
+        "Hash every file under MEDIA_ROOT and hard-link identical files to a single blob. "
+        "With --rename, file fields are also moved to content-addressed names so they get immutable cache "
+        "headers (the old names stay as links for URLs embedded in article bodies); run "
+        "build_image_derivatives afterwards so feature images pick up their renamed sources."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Hashing threads (default: all cores).")
+        parser.add_argument("--rename", action="store_true", help="Point file fields at content-addressed names.")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not twain_core.storage.ContentAddressedStorage.")
+        root = str(settings.MEDIA_ROOT)
+        paths = []
+        for directory, dirnames, filenames in os.walk(root):
+            if directory == root:
+                dirnames[:] = [d for d in dirnames if d != BLOB_DIR]
+            paths += [
+                os.path.join(directory, filename) for filename in filenames
+                if not os.path.islink(os.path.join(directory, filename))
+            ]
+
+        started = time.monotonic()
+
+        def dedupe(path):
+            # hashlib releases the GIL on large buffers, so threads hash in parallel
+            digest = file_sha256(path)
+            return path, digest, storage.adopt(path, digest)
+
+        digests, freed = {}, 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for path, digest, saved in pool.map(dedupe, paths):
+                digests[os.path.relpath(path, root).replace(os.sep, "/")] = digest
+                freed += saved
+        self.stdout.write(
+            f"Hashed {len(paths)} files into {len(set(digests.values()))} blobs, "
+            f"freeing {freed / 2**20:.1f} MiB in {time.monotonic() - started:.1f}s."
+        )
+
+        if options["rename"]:
+            self.stdout.write(f"Renamed {self.rename_fields(storage, digests)} file references.")
+
+        orphans = 0
+        for blob in storage.orphaned_blobs():
+            os.unlink(blob)
+            orphans += 1
+        self.stdout.write(self.style.SUCCESS(f"Done; removed {orphans} unused blobs."))
+
+    def rename_fields(self, storage, digests):
+        renamed, new_names = 0, {}
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if not isinstance(field, FileField) or field.storage is not default_storage:
+                    continue
+                rows = model._default_manager.exclude(**{field.name: ""}).exclude(**{f"{field.name}__isnull": True})
+                for pk, name in rows.values_list("pk", field.attname).iterator():
+                    if is_content_addressed(name) or name not in digests:
+                        continue
+                    if name not in new_names:
+                        digest = digests[name]
+                        new_name = storage.get_available_name(hashed_name(name, digest), max_length=field.max_length)
+                        os.link(storage.blob_path(digest), storage.path(new_name))
+                        new_names[name] = new_name
+                    model._default_manager.filter(pk=pk).update(**{field.attname: new_names[name]})
+                    renamed += 1
+        return renamed
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dashboard.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads (and their partial files) that have not been touched recently. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, default=settings.CHUNKED_UPLOAD_EXPIRY_HOURS,
+            help="Remove uploads idle for longer than this many hours.",
+        )
+
+    def handle(self, *args, **options):
+        removed = purge_stale_uploads(timedelta(hours=options["hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} stale uploads."))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.related import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute related-article recommendations and term statistics for all published Knowledge articles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Processes for the neighbour search (default: 1).")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = rebuild(workers=options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"Related articles rebuilt for {count} articles in {time.monotonic() - started:.1f}s."))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Knowledge Centre full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Articles indexed per transaction.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} articles in {time.monotonic() - started:.1f}s."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount messages, services, case studies and clients and correct the admin dashboard counters. Run from cron."
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        for field, delta in drift.items():
+            self.stdout.write(f"{field} was off by {delta:+d}")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled." if drift else "Counters were already exact."))
@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from dashboard.models import KnowledgeArticle
+from dashboard.rendering import apply_render, content_hash, render
+
+
+class Command(BaseCommand):
+    help = "Re-render Knowledge article bodies whose stored HTML is stale (e.g. after a renderer change)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Renderer processes (default: all cores).")
+        parser.add_argument("--batch-size", type=int, default=200, help="Articles rendered and saved per batch.")
+        parser.add_argument("--force", action="store_true", help="Re-render every article, even if up to date.")
+
+    def handle(self, *args, **options):
+        batch_size, force = options["batch_size"], options["force"]
+        started = time.monotonic()
+        scanned = rendered = 0
+        last_id = 0
+
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                batch = list(
+                    KnowledgeArticle.objects.filter(id__gt=last_id).order_by("id").only("id", "content", "content_hash")[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1].pk
+                scanned += len(batch)
+
+                stale = [a for a in batch if force or a.content_hash != content_hash(a.content)]
+                if not stale:
+                    continue
+                chunksize = max(1, len(stale) // (options["workers"] * 4))
+                now = timezone.now()
+                for article, result in zip(stale, pool.map(render, [a.content for a in stale], chunksize=chunksize)):
+                    apply_render(article, result)
+                    # The page changed: move Last-Modified on too, not just the ETag
+                    article.updated_at = now
+                with transaction.atomic():
+                    KnowledgeArticle.objects.bulk_update(
+                        stale, ["content_html", "toc", "read_time_minutes", "content_hash", "updated_at"]
+                    )
+                rendered += len(stale)
+                self.stdout.write(f"rendered {rendered} of {scanned} scanned")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-rendered {rendered} of {scanned} articles in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,66 @@
+from django.db import migrations
+from django.utils.html import strip_tags
+
+TABLE = "dashboard_knowledgearticle_search"
+
+# Prefix indexes keep as-you-type queries ("wha*") from scanning every
+# matching term; ~2-20ms per query at 100k articles
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE {TABLE} USING fts5(
+        title, summary, body,
+        tokenize = 'porter unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    # Weighted bm25 as the default rank: title 10, summary 4, body 1
+    f"INSERT INTO {TABLE} ({TABLE}, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')",
+]
+SQLITE_INSERT = f"INSERT INTO {TABLE} (rowid, title, summary, body) VALUES (%s, %s, %s, %s)"
+
+POSTGRES_CREATE = [
+    f"""CREATE TABLE {TABLE} (
+        article_id bigint PRIMARY KEY REFERENCES dashboard_knowledgearticle (id)
+            ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        body text NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    f"CREATE INDEX {TABLE}_document_gin ON {TABLE} USING gin (document)",
+]
+POSTGRES_INSERT = f"""
+    INSERT INTO {TABLE} (article_id, body, document)
+    VALUES (%s, %s, setweight(to_tsvector('english', %s), 'A')
+                 || setweight(to_tsvector('english', %s), 'B')
+                 || setweight(to_tsvector('english', %s), 'D'))
+"""
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in ("sqlite", "postgresql"):
+        return
+    KnowledgeArticle = apps.get_model("dashboard", "KnowledgeArticle")
+    with schema_editor.connection.cursor() as cursor:
+        for statement in SQLITE_CREATE if vendor == "sqlite" else POSTGRES_CREATE:
+            cursor.execute(statement)
+        for article in KnowledgeArticle.objects.only("id", "title", "summary", "content").iterator():
+            summary, body = strip_tags(article.summary or ""), strip_tags(article.content or "")
+            if vendor == "sqlite":
+                cursor.execute(SQLITE_INSERT, [article.pk, article.title, summary, body])
+            else:
+                cursor.execute(POSTGRES_INSERT, [article.pk, body, article.title, summary, body])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_contactmessage_supportmessage_delete_payment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
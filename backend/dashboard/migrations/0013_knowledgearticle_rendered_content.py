@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+# Existing articles keep an empty content_hash, so `manage.py rerender_articles`
+# renders them; until then knowledge_detail.html falls back to the raw content.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_knowledge_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgearticle',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='knowledgearticle',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='knowledgearticle',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='knowledgearticle',
+            name='read_time_minutes',
+            field=models.PositiveIntegerField(default=5, help_text='Estimated read time (minutes); recalculated when the content changes.'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0013_knowledgearticle_rendered_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='knowledgearticle',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['sort_order', '-published_at', 'id'], name='knowledge_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='knowledgearticle',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', 'sort_order', '-published_at', 'id'], name='knowledge_cat_listing_idx'),
+        ),
+    ]
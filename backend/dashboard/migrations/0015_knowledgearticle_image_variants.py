@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0014_knowledgearticle_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgearticle',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
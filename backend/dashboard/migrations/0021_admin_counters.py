@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:21
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.utils import timezone
+
+
+def count_existing_rows(apps, schema_editor):
+    Message = apps.get_model('dashboard', 'Message')
+    counts = Message.objects.aggregate(message_count=Count('id'), unread_count=Count('id', filter=Q(is_read=False)))
+    for model, field in (('Service', 'service_count'), ('CaseStudy', 'case_count'), ('Client', 'client_count')):
+        counts[field] = apps.get_model('dashboard', model).objects.count()
+    apps.get_model('dashboard', 'AdminCounters').objects.create(pk=1, reconciled_at=timezone.now(), **counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0020_message_inbox_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_count', models.IntegerField(default=0)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('service_count', models.IntegerField(default=0)),
+                ('case_count', models.IntegerField(default=0)),
+                ('client_count', models.IntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'admin counters',
+            },
+        ),
+        migrations.RunPython(count_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+def backfill_kind(apps, schema_editor):
+    # The support form is the only one that fills in a problem; every other row keeps the "contact" default
+    Message = apps.get_model('dashboard', 'Message')
+    Message.objects.exclude(problem='').update(kind='support')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0021_admin_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='kind',
+            field=models.CharField(choices=[('contact', 'Contact request'), ('support', 'Support ticket')], default='contact', max_length=10),
+        ),
+        migrations.RunPython(backfill_kind, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('kind', 'contact')), fields=['-created_at', 'id'], name='message_contact_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('kind', 'support')), fields=['-created_at', 'id'], name='message_support_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0022_message_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('contact', 'Contact request'), ('support', 'Support ticket')], max_length=10)),
+                ('name', models.CharField(blank=True, max_length=150)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('business_name', models.CharField(blank=True, max_length=200)),
+                ('platform', models.CharField(blank=True, max_length=50)),
+                ('description', models.TextField(blank=True)),
+                ('problem', models.TextField(blank=True)),
+                ('urgency', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-created_at', 'id'], name='archived_message_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:39
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Log, Power
+
+
+def scores_to_log2(apps, schema_editor):
+    KnowledgeArticle = apps.get_model('dashboard', 'KnowledgeArticle')
+    KnowledgeArticle.objects.filter(trending_score__gt=0).update(trending_score=Log(Value(2.0), F('trending_score')))
+    KnowledgeArticle.objects.filter(trending_score__lte=0).update(trending_score=None)
+
+
+def scores_from_log2(apps, schema_editor):
+    KnowledgeArticle = apps.get_model('dashboard', 'KnowledgeArticle')
+    KnowledgeArticle.objects.filter(trending_score__isnull=False).update(trending_score=Power(Value(2.0), F('trending_score')))
+    KnowledgeArticle.objects.filter(trending_score__isnull=True).update(trending_score=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0024_chunkedupload_assembling_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='knowledgearticle',
+            name='trending_score',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(scores_to_log2, scores_from_log2),
+    ]
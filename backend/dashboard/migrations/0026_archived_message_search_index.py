@@ -0,0 +1,63 @@
+from django.db import migrations
+
+TABLE = "dashboard_archivedmessage_search"
+SOURCE = "dashboard_archivedmessage"
+COLUMNS = ("name", "email", "business_name", "platform", "description", "problem")
+
+NEW_VALUES = ", ".join(f"new.{column}" for column in COLUMNS)
+OLD_VALUES = ", ".join(f"old.{column}" for column in COLUMNS)
+INSERT_NEW = f"INSERT INTO {TABLE} (rowid, {', '.join(COLUMNS)}) VALUES (new.id, {NEW_VALUES});"
+DELETE_OLD = f"INSERT INTO {TABLE} ({TABLE}, rowid, {', '.join(COLUMNS)}) VALUES ('delete', old.id, {OLD_VALUES});"
+
+# External content: the text lives once, in the archive table, and the
+# triggers keep the index in step with bulk_create() and raw deletes alike
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE {TABLE} USING fts5(
+        {', '.join(COLUMNS)},
+        content = '{SOURCE}', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    f"CREATE TRIGGER {TABLE}_insert AFTER INSERT ON {SOURCE} BEGIN {INSERT_NEW} END",
+    f"CREATE TRIGGER {TABLE}_delete AFTER DELETE ON {SOURCE} BEGIN {DELETE_OLD} END",
+    f"CREATE TRIGGER {TABLE}_update AFTER UPDATE ON {SOURCE} BEGIN {DELETE_OLD} {INSERT_NEW} END",
+    f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {TABLE}_{event}" for event in ("insert", "delete", "update")
+] + [f"DROP TABLE IF EXISTS {TABLE}"]
+
+# 'simple': names, emails and platforms shouldn't be stemmed
+DOCUMENT = " || ' ' || ".join(f"coalesce({column}, '')" for column in COLUMNS)
+POSTGRES_CREATE = [
+    f"""ALTER TABLE {SOURCE} ADD COLUMN search_document tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, {DOCUMENT})) STORED""",
+    f"CREATE INDEX {SOURCE}_search_gin ON {SOURCE} USING gin (search_document)",
+]
+POSTGRES_DROP = [
+    f"DROP INDEX IF EXISTS {SOURCE}_search_gin",
+    f"ALTER TABLE {SOURCE} DROP COLUMN IF EXISTS search_document",
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        statements = statements_by_vendor.get(schema_editor.connection.vendor, [])
+        with schema_editor.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0025_trending_score_log2'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_CREATE, "postgresql": POSTGRES_CREATE}),
+            run({"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}),
+        ),
+    ]
@@ -1,7 +1,11 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from .images import responsive_image
+
 
 User = get_user_model()
 
@@ -22,8 +26,13 @@ class SubscriptionPlan(models.Model):
     highlighted = models.BooleanField(default=False, help_text="If True, visually emphasize this plan")
     is_active = models.BooleanField(default=True)
     sort_order = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def feature_list(self):
+        # Plans served from dashboard.catalog carry their features pre-parsed
+        parsed = self.__dict__.get("_feature_list")
+        if parsed is not None:
+            return parsed
         return [f.strip() for f in self.features.split(",")] if self.features else []
 
     def __str__(self):
@@ -90,17 +99,29 @@ class KnowledgeArticle(models.Model):
     summary = models.TextField(blank=True, help_text="Short intro shown in cards.")
     content = models.TextField(help_text="Full documentation body (Markdown or HTML).")
 
+    # Rendered body, rebuilt on save when content_hash no longer matches (see dashboard.rendering)
+    content_html = models.TextField(blank=True, editable=False)
+    toc = models.JSONField(default=list, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+
     # Display and metadata
-    read_time_minutes = models.PositiveIntegerField(default=5, help_text="Estimated read time (minutes).")
+    read_time_minutes = models.PositiveIntegerField(default=5, help_text="Estimated read time (minutes); recalculated when the content changes.")
     featured = models.BooleanField(default=False, help_text="If True, can be highlighted in the list.")
     is_published = models.BooleanField(default=True)
     sort_order = models.PositiveIntegerField(default=0)
 
     # Media
     feature_image = models.ImageField(upload_to="knowledge/images/", blank=True, null=True)
+    # Original size and resized derivatives of feature_image (see dashboard.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     video_url = models.URLField(blank=True, help_text="Optional link to YouTube/Vimeo/etc.")
     video_file = models.FileField(upload_to="knowledge/videos/", blank=True, null=True, help_text="Optional uploaded video file.")
 
+    # Popularity, written in batches by dashboard.popularity
+    view_count = models.PositiveBigIntegerField(default=0, editable=False)
+    # Base-2 log of the decayed view weights (see dashboard.popularity)
+    trending_score = models.FloatField(null=True, blank=True, editable=False)
+
     # Audit
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="knowledge_articles")
     published_at = models.DateTimeField(auto_now_add=True)
@@ -108,6 +129,20 @@ class KnowledgeArticle(models.Model):
 
     class Meta:
         ordering = ["sort_order", "-published_at"]
+        indexes = [
+            # Keyset pagination of the Knowledge Centre, overall and per category.
+            # Partial, because the listing's is_published filter isn't an indexable equality on SQLite.
+            models.Index(
+                fields=["sort_order", "-published_at", "id"], condition=models.Q(is_published=True),
+                name="knowledge_listing_idx",
+            ),
+            models.Index(
+                fields=["category", "sort_order", "-published_at", "id"], condition=models.Q(is_published=True),
+                name="knowledge_cat_listing_idx",
+            ),
+            # The trending leaderboard reads the top few of this
+            models.Index(fields=["-trending_score"], condition=models.Q(is_published=True), name="knowledge_trending_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -115,6 +150,9 @@ class KnowledgeArticle(models.Model):
     def get_absolute_url(self):
         return reverse("dashboard_knowledge_detail", kwargs={"slug": self.slug})
 
+    def responsive_image(self):
+        return responsive_image(self.feature_image, self.image_variants)
+
     def video_embed_url(self):
         """
         Returns a safe YouTube/Vimeo embed URL from a typical share/watch URL.
@@ -153,6 +191,80 @@ class KnowledgeAttachment(models.Model):
         return f"{self.article.title} – {self.name}"
 
 
+# Related-article recommendations (see dashboard.related)
+class KnowledgeTerm(models.Model):
+    """Document frequency of a term at the last full rebuild."""
+    term = models.CharField(max_length=40, unique=True)
+    document_frequency = models.PositiveIntegerField()
+
+
+class ArticleTerm(models.Model):
+    """One entry of an article's pruned, normalized TF-IDF vector."""
+    article = models.ForeignKey(KnowledgeArticle, on_delete=models.CASCADE, related_name="terms")
+    term = models.CharField(max_length=40, db_index=True)
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["article", "term"], name="unique_article_term")]
+
+
+class RelatedArticle(models.Model):
+    article = models.ForeignKey(KnowledgeArticle, on_delete=models.CASCADE, related_name="related_links")
+    related = models.ForeignKey(KnowledgeArticle, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ["article", "rank"]
+        constraints = [models.UniqueConstraint(fields=["article", "rank"], name="unique_related_rank")]
+
+
+# Resumable uploads of large article media (see dashboard.uploads)
+class ChunkedUpload(models.Model):
+    TARGET_CHOICES = [("video", "Article video"), ("attachment", "Article attachment")]
+    STATUS_CHOICES = [
+        ("uploading", "Uploading"), ("assembling", "Assembling"), ("complete", "Complete"), ("failed", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chunked_uploads")
+    article = models.ForeignKey(KnowledgeArticle, on_delete=models.CASCADE, related_name="chunked_uploads")
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    attachment_name = models.CharField(max_length=200, blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Expected digest of the whole file, if the client sent one.")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="uploading")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "updated_at"], name="chunked_upload_gc_idx")]
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()})"
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index):
+        """Expected byte length of chunk ``index``; only the last one may be short."""
+        if index == self.total_chunks - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+
+class UploadChunk(models.Model):
+    upload = models.ForeignKey(ChunkedUpload, on_delete=models.CASCADE, related_name="chunks")
+    index = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["upload", "index"], name="unique_upload_chunk")]
+
+
 # Tools Model
 class Tool(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -162,6 +274,7 @@ class Tool(models.Model):
     website_url = models.URLField(blank=True, help_text="Official website or documentation link")
     sort_order = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["sort_order", "name"]
@@ -169,7 +282,22 @@ class Tool(models.Model):
     def __str__(self):
         return self.name
 
+class MessageKindManager(models.Manager):
+    """Messages of one kind; the proxies' default manager, so each admin reads only its own slice."""
+
+    def __init__(self, kind):
+        super().__init__()
+        self.kind = kind
+
+    def get_queryset(self):
+        return super().get_queryset().filter(kind=self.kind)
+
+
 class Message(models.Model):
+    # Set by the form that created the message: the website contact form or dashboard support
+    KIND_CHOICES = [("contact", "Contact request"), ("support", "Support ticket")]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default="contact")
+
     # Website contact fields
     name = models.CharField(max_length=150, blank=True)
     email = models.EmailField(blank=True)
@@ -189,11 +317,47 @@ class Message(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the admin inbox, all messages and by read status.
+            # Partial, because Django's is_read filters aren't indexable equalities on SQLite.
+            models.Index(fields=["-created_at", "id"], name="message_inbox_idx"),
+            models.Index(fields=["-created_at", "id"], condition=models.Q(is_read=False), name="message_unread_idx"),
+            models.Index(fields=["-created_at", "id"], condition=models.Q(is_read=True), name="message_read_idx"),
+            # The contact request and support ticket admins, newest first
+            models.Index(fields=["-created_at", "id"], condition=models.Q(kind="contact"), name="message_contact_idx"),
+            models.Index(fields=["-created_at", "id"], condition=models.Q(kind="support"), name="message_support_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name or 'Anonymous'} — {self.email or 'No email'}"
 
 
 
+class ArchivedMessage(models.Model):
+    """A read message moved out of Message by dashboard.archive; it keeps the message's id."""
+    id = models.BigIntegerField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=Message.KIND_CHOICES)
+    name = models.CharField(max_length=150, blank=True)
+    email = models.EmailField(blank=True)
+    business_name = models.CharField(max_length=200, blank=True)
+    platform = models.CharField(max_length=50, blank=True)
+    description = models.TextField(blank=True)
+    problem = models.TextField(blank=True)
+    urgency = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the archive view
+            models.Index(fields=["-created_at", "id"], name="archived_message_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name or 'Anonymous'} — {self.email or 'No email'}"
+
+
 class Service(models.Model):
     title = models.CharField(max_length=150)
     description = models.TextField()
@@ -234,18 +398,50 @@ class Project(models.Model):
     def __str__(self):
         return self.name
 
+class AdminCounters(models.Model):
+    """
+    Row counts behind the admin dashboard tiles, kept by dashboard.counters.
+    There is a single row, with pk 1. Plain integers: a counter that has
+    drifted may briefly go negative until it is reconciled.
+    """
+    message_count = models.IntegerField(default=0)
+    unread_count = models.IntegerField(default=0)
+    service_count = models.IntegerField(default=0)
+    case_count = models.IntegerField(default=0)
+    client_count = models.IntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "admin counters"
+
+    def __str__(self):
+        return "Admin dashboard counters"
+
+
 # Proxy models to separate Contact Requests and Support Tickets in admin
 class ContactMessage(Message):
+    objects = MessageKindManager("contact")
+
     class Meta:
         proxy = True
         verbose_name = "Contact Request"
         verbose_name_plural = "Contact Requests"
 
+    def save(self, *args, **kwargs):
+        self.kind = "contact"
+        super().save(*args, **kwargs)
+
 
 class SupportMessage(Message):
+    objects = MessageKindManager("support")
+
     class Meta:
         proxy = True
         verbose_name = "Support Ticket"
         verbose_name_plural = "Support Tickets"
+
+    def save(self, *args, **kwargs):
+        self.kind = "support"
+        super().save(*args, **kwargs)
         
 
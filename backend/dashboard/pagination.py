@@ -0,0 +1,93 @@
+"""
+Keyset (cursor) pagination for Knowledge Centre listings and the admin
+message inbox and archive.
+
+Articles are listed by (sort_order, -published_at, id), messages and
+archived messages by (-created_at, id). A cursor encodes that key for the
+last row on a page, and the next page is an index seek from that key.
+OFFSET would re-read every earlier row instead, so a deep page costs the
+same as the first one.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 12
+ORDERING = ("sort_order", "-published_at", "id")
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_ORDERING = ("-created_at", "id")
+
+
+def encode_key(*values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_key(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def encode_cursor(article):
+    return encode_key(article.sort_order, article.published_at.isoformat(), article.pk)
+
+
+def decode_cursor(cursor):
+    """(sort_order, published_at, id) from a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        sort_order, published_at, pk = decode_key(cursor)
+        return int(sort_order), datetime.fromisoformat(published_at), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Return (articles, next_cursor) for the page of ``queryset`` after ``cursor``."""
+    queryset = queryset.order_by(*ORDERING)
+    key = decode_cursor(cursor)
+    if key is None:
+        rows = list(queryset[:page_size + 1])
+    else:
+        sort_order, published_at, pk = key
+        # The rest of the cursor's sort_order group, then the groups after it.
+        # Both are range scans on the composite index; no earlier rows are read.
+        rows = list(
+            queryset.filter(sort_order=sort_order, published_at__lte=published_at)
+            .filter(Q(published_at__lt=published_at) | Q(id__gt=pk))[:page_size + 1]
+        )
+        if len(rows) <= page_size:
+            rows += queryset.filter(sort_order__gt=sort_order)[:page_size + 1 - len(rows)]
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+# --- Messages ---
+def encode_message_cursor(message):
+    return encode_key(message.created_at.isoformat(), message.pk)
+
+
+def decode_message_cursor(cursor):
+    """(created_at, id) from a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        created_at, pk = decode_key(cursor)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def message_page(queryset, cursor=None, page_size=MESSAGE_PAGE_SIZE):
+    """Return (messages, next_cursor) for the page of ``queryset`` after ``cursor``, newest first."""
+    queryset = queryset.order_by(*MESSAGE_ORDERING)
+    key = decode_message_cursor(cursor)
+    if key is not None:
+        created_at, pk = key
+        # The <= bound is what makes this a range seek on the index; the OR alone would scan from the top
+        queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__gt=pk))
+    rows = list(queryset[:page_size + 1])
+    next_cursor = encode_message_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
@@ -0,0 +1,187 @@
+"""
+View counts and the trending leaderboard for Knowledge articles.
+
+Detail page hits are counted in a per-process buffer rather than written
+one by one, which on SQLite would serialize every page view behind the
+database write lock. After a request finishes, a buffer older than
+ARTICLE_VIEW_FLUSH_SECONDS is written out with one
+``UPDATE ... SET view_count = view_count + n`` per distinct n. A process
+that stops loses at most one interval of counts, which is acceptable for
+popularity figures.
+
+Trending scores decay with a half-life of TRENDING_HALF_LIFE_HOURS. Rather
+than decaying every row, a view at time t weighs 2 ** ((t - epoch) /
+half_life): every weight shrinks by the same factor as time passes, so
+ranking by the sum of weights ranks by decayed score. Those weights grow
+past the float limit after 1024 half-lives, so trending_score stores the
+base-2 log of the sum (NULL before the first view) and a flush adds to it
+with an in-database log-add, still one atomic UPDATE. Ordering by the log
+orders by the sum, and 2 ** (score - half-lives since the epoch) is the
+decayed score for display; nothing grows with time, so the epoch never
+needs moving.
+
+The leaderboard is kept in the cache, refreshed after each flush, so the
+Knowledge Centre shows it without a query.
+"""
+import functools
+import logging
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest, Least, Log, Power
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TRENDING_EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+TRENDING_SIZE = 5
+LEADERBOARD_KEY = "knowledge_trending"
+BATCH_SIZE = 500
+
+
+def decay_exponent(now=None):
+    """Base-2 log of the weight of a view at ``now``: the half-lives since TRENDING_EPOCH."""
+    elapsed = ((now or timezone.now()) - TRENDING_EPOCH).total_seconds()
+    return elapsed / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def log_add(field, added):
+    """log2(2 ** field + 2 ** added) as an expression, for a nullable log-space column."""
+    added = Value(added)
+    high, low = Greatest(F(field), added), Least(F(field), added)
+    return Case(
+        When(**{f"{field}__isnull": True}, then=added),
+        default=high + Log(Value(2.0), Value(1.0) + Power(Value(2.0), low - high)),
+    )
+
+
+# --- Buffer ---
+class ViewBuffer:
+    """Views per article slug, counted in memory between flushes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.last_flush = time.monotonic()
+
+    def add(self, slug, n=1):
+        with self.lock:
+            self.counts[slug] += n
+
+    def due(self):
+        return bool(self.counts) and time.monotonic() - self.last_flush >= settings.ARTICLE_VIEW_FLUSH_SECONDS
+
+    def drain(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.last_flush = time.monotonic()
+        return counts
+
+    def restore(self, counts):
+        with self.lock:
+            self.counts.update(counts)
+
+
+buffer = ViewBuffer()
+
+
+def counts_views(view):
+    """Count GETs of a detail view that render the article or confirm the browser's copy (304)."""
+    @functools.wraps(view)
+    def wrapper(request, slug, *args, **kwargs):
+        response = view(request, slug, *args, **kwargs)
+        if request.method == "GET" and response.status_code in (200, 304):
+            buffer.add(slug)
+        return response
+    return wrapper
+
+
+def write_views(counts, now=None):
+    """Add ``counts`` ({slug: views}) to the articles, one UPDATE per distinct count."""
+    from .models import KnowledgeArticle
+
+    exponent = decay_exponent(now)
+    slugs_by_count = defaultdict(list)
+    for slug, n in counts.items():
+        slugs_by_count[n].append(slug)
+    with transaction.atomic():
+        for n, slugs in slugs_by_count.items():
+            for start in range(0, len(slugs), BATCH_SIZE):
+                KnowledgeArticle.objects.filter(slug__in=slugs[start:start + BATCH_SIZE]).update(
+                    view_count=F("view_count") + n, trending_score=log_add("trending_score", exponent + math.log2(n)),
+                )
+
+
+def flush():
+    """Write out the buffered views; on a database error they stay buffered for the next flush."""
+    counts = buffer.drain()
+    if not counts:
+        return 0
+    try:
+        write_views(counts)
+    except DatabaseError:
+        buffer.restore(counts)
+        logger.exception("Could not write %s buffered article views", sum(counts.values()))
+        return 0
+    refresh_leaderboard()
+    return sum(counts.values())
+
+
+@receiver(request_finished)
+def flush_if_due(sender, **kwargs):
+    # The response has been sent, so the flush doesn't delay the request that triggers it
+    if buffer.due():
+        flush()
+
+
+# --- Leaderboard ---
+def build_leaderboard(now=None):
+    from .models import KnowledgeArticle
+
+    exponent = decay_exponent(now)
+    rows = (
+        KnowledgeArticle.objects.filter(is_published=True, trending_score__isnull=False)
+        .order_by("-trending_score")
+        .values_list("title", "slug", "view_count", "trending_score")[:TRENDING_SIZE]
+    )
+    return [
+        {
+            "title": title,
+            "url": reverse("dashboard_knowledge_detail", kwargs={"slug": slug}),
+            "views": views,
+            "score": 2 ** (score - exponent),
+        }
+        for title, slug, views, score in rows
+    ]
+
+
+def refresh_leaderboard():
+    leaderboard = build_leaderboard()
+    # Other processes flush too; expiring with the flush interval bounds how stale a process's copy gets
+    cache.set(LEADERBOARD_KEY, leaderboard, settings.ARTICLE_VIEW_FLUSH_SECONDS)
+    return leaderboard
+
+
+def trending_articles():
+    """[{"title", "url", "views", "score"}] for the most-read articles lately, best first."""
+    leaderboard = cache.get(LEADERBOARD_KEY)
+    if leaderboard is None:
+        leaderboard = refresh_leaderboard()
+    return leaderboard
+
+
+@receiver([post_save, post_delete], sender="dashboard.KnowledgeArticle")
+def article_changed(sender, **kwargs):
+    # Titles, slugs and publication show up on the leaderboard
+    cache.delete(LEADERBOARD_KEY)
@@ -0,0 +1,333 @@
+"""
+Related-article recommendations for the Knowledge Centre.
+
+Published articles become TF-IDF vectors over their title, summary and body
+(title words count three times, summary words twice). Each vector keeps its
+TERMS_PER_ARTICLE heaviest terms, L2-normalized, and cosine similarities are
+accumulated through an inverted index, so only articles that share a term
+are ever compared. The TOP_K neighbours of every article are stored in
+RelatedArticle, which the detail page reads with one indexed query.
+
+``manage.py rebuild_related_articles`` recomputes everything and refreshes
+the document frequencies in KnowledgeTerm. Saving or deleting an article
+updates only that article and the neighbour lists it enters or leaves.
+NumPy/SciPy aren't dependencies of this project, so the sparse arithmetic
+is plain Python; ``manage.py benchmark_related`` times a rebuild on a
+synthetic corpus.
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+TOP_K = 5
+TERMS_PER_ARTICLE = 40
+MIN_DF = 2  # a term found in one article can't relate it to another
+MAX_DF_RATIO = 0.5  # terms in over half the articles say nothing about the topic
+# Full rebuilds score through each term's heaviest postings only ("champion
+# lists"); a long list belongs to a common term that adds little to a score
+# but would cost time quadratic in its length
+MAX_POSTINGS = 100
+FIELD_WEIGHTS = (3, 2, 1)  # title, summary, body
+BATCH_SIZE = 500
+WATCHED_FIELDS = {"title", "summary", "content", "is_published"}
+
+TAG_RE = re.compile(r"<[^>]*>")
+TOKEN_RE = re.compile(r"[a-z0-9]{2,40}")
+STOP_WORDS = frozenset("""
+    about after all also an and any are as at be been but by can could do does for from get has have how if in
+    into is it its just may more most must no not of on once one only or other our out over should so some such
+    than that the their them then there these they this those through to too under up use used using very was
+    we were what when where which while who why will with would you your
+""".split())
+
+
+# --- Vectors ---
+def term_counts(title, summary, content):
+    # Repeating a field's tokens weights it while keeping the counting in C
+    counts = Counter()
+    for text, weight in zip((title, summary, TAG_RE.sub(" ", content or "")), FIELD_WEIGHTS):
+        counts.update(TOKEN_RE.findall((text or "").lower()) * weight)
+    for word in STOP_WORDS & counts.keys():
+        del counts[word]
+    return counts
+
+
+def idf(document_frequency, total):
+    return math.log((1 + total) / (1 + document_frequency)) + 1
+
+
+def vectorize(counts, idfs, size=TERMS_PER_ARTICLE):
+    """Sublinear TF-IDF over the terms in ``idfs``, pruned to ``size`` terms and L2-normalized."""
+    weights = heapq.nlargest(
+        size,
+        ((term, (1 + math.log(count)) * idfs[term]) for term, count in counts.items() if term in idfs),
+        key=lambda item: item[1],
+    )
+    norm = math.sqrt(sum(weight * weight for _, weight in weights)) or 1.0
+    return {term: weight / norm for term, weight in weights}
+
+
+def build_postings(entries, limit=None):
+    """
+    Inverted index {term: (pks, weights)} from (pk, term, weight) entries.
+    With ``limit``, each term keeps only its heaviest entries.
+    """
+    lists = defaultdict(list)
+    for pk, term, weight in entries:
+        lists[term].append((pk, weight))
+    postings = {}
+    for term, items in lists.items():
+        if limit and len(items) > limit:
+            items = heapq.nlargest(limit, items, key=lambda item: item[1])
+        postings[term] = (tuple(pk for pk, _ in items), tuple(weight for _, weight in items))
+    return postings
+
+
+def similarity_scores(vector, postings, exclude):
+    """Cosine similarity of ``vector`` with every article that shares one of its terms."""
+    scores = {}
+    get = scores.get
+    for term, weight in vector.items():
+        entry = postings.get(term)
+        if entry is None:
+            continue
+        pks, weights = entry
+        # The products are computed by map() in C; this is the hot loop of a rebuild
+        for other, product in zip(pks, map(weight.__mul__, weights)):
+            scores[other] = get(other, 0.0) + product
+    scores.pop(exclude, None)
+    return scores
+
+
+def top_neighbours(scores, k=TOP_K):
+    """[(score, pk)] for the ``k`` best scores, best first."""
+    return heapq.nlargest(k, ((score, pk) for pk, score in scores.items()))
+
+
+# Set in each worker process of a parallel rebuild
+_shared_postings = None
+
+
+def _share_postings(postings):
+    global _shared_postings
+    _shared_postings = postings
+
+
+def _neighbours_batch(items, k):
+    return {pk: top_neighbours(similarity_scores(vector, _shared_postings, pk), k) for pk, vector in items}
+
+
+def compute(read_documents, k=TOP_K, workers=1):
+    """
+    Full computation over ``read_documents()``, which yields (pk, title,
+    summary, content) and is called twice, so the corpus is never held in
+    memory. Returns (document frequencies, vectors, neighbours). With
+    ``workers`` > 1 the neighbour search is spread over processes.
+    """
+    frequencies, total = Counter(), 0
+    for _, title, summary, content in read_documents():
+        frequencies.update(term_counts(title, summary, content).keys())
+        total += 1
+    max_df = max(MIN_DF, MAX_DF_RATIO * total)
+    frequencies = {term: n for term, n in frequencies.items() if MIN_DF <= n <= max_df}
+    idfs = {term: idf(n, total) for term, n in frequencies.items()}
+
+    vectors = {
+        pk: vectorize(term_counts(title, summary, content), idfs)
+        for pk, title, summary, content in read_documents()
+    }
+    postings = build_postings(
+        ((pk, term, weight) for pk, vector in vectors.items() for term, weight in vector.items()), limit=MAX_POSTINGS,
+    )
+    if workers > 1:
+        neighbours = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_share_postings, initargs=(postings,)) as pool:
+            for batch in pool.map(_neighbours_batch, batches(vectors.items(), 1000), repeat(k)):
+                neighbours.update(batch)
+    else:
+        neighbours = {pk: top_neighbours(similarity_scores(vector, postings, pk), k) for pk, vector in vectors.items()}
+    return frequencies, vectors, neighbours
+
+
+# --- Storage ---
+def batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def touch(pks):
+    """Bump updated_at so the detail pages' ETags change; update() skips the save signals."""
+    from .models import KnowledgeArticle
+
+    now = timezone.now()
+    for batch in batches(pks):
+        KnowledgeArticle.objects.filter(pk__in=batch).update(updated_at=now)
+
+
+def published_documents():
+    from .models import KnowledgeArticle
+
+    return (
+        KnowledgeArticle.objects.filter(is_published=True).order_by()
+        .values_list("pk", "title", "summary", "content").iterator(chunk_size=BATCH_SIZE)
+    )
+
+
+def current_lists():
+    from .models import RelatedArticle
+
+    lists = defaultdict(list)
+    for article_id, related_id in RelatedArticle.objects.order_by("article_id", "rank").values_list("article_id", "related_id").iterator():
+        lists[article_id].append(related_id)
+    return lists
+
+
+def rebuild(workers=1):
+    """Recompute vectors, document frequencies and neighbours for all published articles."""
+    from .models import ArticleTerm, KnowledgeTerm, RelatedArticle
+
+    frequencies, vectors, neighbours = compute(published_documents, workers=workers)
+    previous = current_lists()
+    with transaction.atomic():
+        KnowledgeTerm.objects.all().delete()
+        ArticleTerm.objects.all().delete()
+        RelatedArticle.objects.all().delete()
+        for batch in batches(KnowledgeTerm(term=term, document_frequency=n) for term, n in frequencies.items()):
+            KnowledgeTerm.objects.bulk_create(batch)
+        for batch in batches(
+            ArticleTerm(article_id=pk, term=term, weight=weight)
+            for pk, vector in vectors.items() for term, weight in vector.items()
+        ):
+            ArticleTerm.objects.bulk_create(batch)
+        for batch in batches(
+            RelatedArticle(article_id=pk, related_id=other, rank=rank, score=score)
+            for pk, items in neighbours.items() for rank, (score, other) in enumerate(items)
+        ):
+            RelatedArticle.objects.bulk_create(batch)
+        touch(pk for pk in previous.keys() | neighbours.keys() if previous.get(pk, []) != [o for _, o in neighbours.get(pk, [])])
+    return len(vectors)
+
+
+def load_postings(terms):
+    """Stored postings of ``terms``, complete (no champion-list cut) since only one article is scored."""
+    from .models import ArticleTerm
+
+    return build_postings(
+        row for batch in batches(terms)
+        for row in ArticleTerm.objects.filter(term__in=batch).values_list("article_id", "term", "weight")
+    )
+
+
+def store_neighbours(pk, items):
+    """Replace an article's neighbour list; returns whether it changed."""
+    from .models import RelatedArticle
+
+    old = list(RelatedArticle.objects.filter(article_id=pk).order_by("rank").values_list("related_id", "score"))
+    new = [(other, score) for score, other in items]
+    if old == new:
+        return False
+    RelatedArticle.objects.filter(article_id=pk).delete()
+    RelatedArticle.objects.bulk_create(
+        RelatedArticle(article_id=pk, related_id=other, rank=rank, score=score) for rank, (other, score) in enumerate(new)
+    )
+    touch([pk])
+    return True
+
+
+def refresh_lists(pks):
+    """Recompute the neighbour lists of ``pks`` from their stored vectors."""
+    from .models import ArticleTerm
+
+    for pk in pks:
+        vector = dict(ArticleTerm.objects.filter(article_id=pk).values_list("term", "weight"))
+        store_neighbours(pk, top_neighbours(similarity_scores(vector, load_postings(list(vector)), pk)))
+
+
+def update_article(pk):
+    """
+    Re-vectorize one article against the stored document frequencies, then
+    fix up neighbour lists: its own, the ones it used to appear in (its
+    score there may have dropped) and the ones its new scores now beat.
+    """
+    from .models import ArticleTerm, KnowledgeArticle, KnowledgeTerm, RelatedArticle
+
+    article = KnowledgeArticle.objects.filter(pk=pk).values_list("title", "summary", "content", "is_published").first()
+    with transaction.atomic():
+        stale = set(RelatedArticle.objects.filter(related_id=pk).values_list("article_id", flat=True))
+        ArticleTerm.objects.filter(article_id=pk).delete()
+        if article is None or not article[3]:
+            RelatedArticle.objects.filter(Q(article_id=pk) | Q(related_id=pk)).delete()
+            refresh_lists(stale)
+            return
+
+        counts = term_counts(*article[:3])
+        total = KnowledgeArticle.objects.filter(is_published=True).count()
+        idfs = {}
+        for batch in batches(list(counts)):
+            idfs.update(
+                (term, idf(n, total))
+                for term, n in KnowledgeTerm.objects.filter(term__in=batch).values_list("term", "document_frequency")
+            )
+        vector = vectorize(counts, idfs)
+        ArticleTerm.objects.bulk_create(ArticleTerm(article_id=pk, term=term, weight=weight) for term, weight in vector.items())
+        scores = similarity_scores(vector, load_postings(list(vector)), pk)
+        store_neighbours(pk, top_neighbours(scores))
+
+        # Lists that don't contain this article yet only need it merged in
+        lists = defaultdict(list)
+        for batch in batches(list(scores)):
+            for article_id, related_id, score in RelatedArticle.objects.filter(article_id__in=batch).values_list("article_id", "related_id", "score"):
+                lists[article_id].append((score, related_id))
+        for other, score in scores.items():
+            if other in stale:
+                continue
+            current = lists.get(other, [])
+            if len(current) < TOP_K or score > min(current)[0]:
+                store_neighbours(other, heapq.nlargest(TOP_K, current + [(score, pk)]))
+        refresh_lists(stale)
+
+
+def related_articles(article):
+    """The article's published neighbours, best first, in one query."""
+    from .models import RelatedArticle
+
+    links = (
+        RelatedArticle.objects.filter(article=article, related__is_published=True)
+        .select_related("related")
+        .only("rank", "related__title", "related__slug", "related__summary", "related__read_time_minutes")
+        .order_by("rank")
+    )
+    return [link.related for link in links]
+
+
+# --- Signals ---
+@receiver(post_save, sender="dashboard.KnowledgeArticle")
+def article_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not WATCHED_FIELDS & set(update_fields)):
+        return
+    transaction.on_commit(lambda: update_article(instance.pk))
+
+
+@receiver(pre_delete, sender="dashboard.KnowledgeArticle")
+def article_deleting(sender, instance, **kwargs):
+    from .models import RelatedArticle
+
+    # The cascade removes these links, so remember whose lists lose an entry
+    instance._related_from = list(RelatedArticle.objects.filter(related=instance).values_list("article_id", flat=True))
+
+
+@receiver(post_delete, sender="dashboard.KnowledgeArticle")
+def article_deleted(sender, instance, **kwargs):
+    stale = getattr(instance, "_related_from", [])
+    if stale:
+        transaction.on_commit(lambda: refresh_lists(stale))
@@ -0,0 +1,281 @@
+"""
+Rendering pipeline for Knowledge article bodies.
+
+``render()`` turns Markdown or HTML into sanitized HTML, a table of contents
+and a word count. It is pure (no database access) so ``rerender_articles``
+can fan it out over a process pool. Articles store the result together
+with ``content_hash``, a hash of the content, RENDERER_VERSION and
+RENDERER_BACKEND (the optional ``markdown`` package and its version, or
+the built-in subset), so installing, upgrading or removing ``markdown``
+also makes every row stale. Bump the version whenever the output of
+``render()`` changes, then run ``manage.py rerender_articles``.
+"""
+import hashlib
+import html
+import math
+import re
+from html.parser import HTMLParser
+
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils.text import slugify
+
+try:
+    import markdown
+except ImportError:
+    markdown = None
+
+RENDERER_VERSION = 1
+RENDERER_BACKEND = f"markdown-{markdown.__version__}" if markdown else "basic"
+WORDS_PER_MINUTE = 200
+TOC_LEVELS = ("h1", "h2", "h3")
+
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "code", "dd", "del", "div", "dl", "dt", "em", "figcaption",
+    "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "kbd", "li", "ol", "p", "pre",
+    "s", "span", "strong", "sub", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRS = {
+    "a": {"href", "title"},
+    "img": {"src", "alt", "title", "width", "height"},
+    "td": {"colspan", "rowspan", "align"},
+    "th": {"colspan", "rowspan", "align", "scope"},
+    "ol": {"start"},
+}
+URL_ATTRS = {"href", "src"}
+SAFE_SCHEMES = ("http", "https", "mailto")
+VOID_TAGS = {"br", "hr", "img"}
+# Dropped together with everything inside them
+DROP_CONTENT_TAGS = {"script", "style", "iframe", "object", "template", "noscript", "svg", "math"}
+
+HTML_START = re.compile(r"\s*<(p|div|h[1-6]|ul|ol|table|section|article|blockquote|pre|figure|img|br)\b", re.I)
+
+
+def content_hash(content):
+    return hashlib.sha256(f"{RENDERER_VERSION}:{RENDERER_BACKEND}:{content}".encode()).hexdigest()
+
+
+# --- Markdown ---
+INLINE_PATTERNS = [
+    (re.compile(r"\*\*(.+?)\*\*"), r"<strong>\1</strong>"),
+    (re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])"), r"<em>\1</em>"),
+    (re.compile(r"(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)"), r"<em>\1</em>"),
+    (re.compile(r"!\[([^\]]*)\]\(([^)\s]+)\)"), r'<img src="\2" alt="\1">'),
+    (re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)"), r'<a href="\2">\1</a>'),
+]
+
+
+def inline_markdown(text):
+    # Code spans are cut out first so their contents are left alone
+    parts = re.split(r"(`[^`]+`)", text)
+    out = []
+    for part in parts:
+        if part.startswith("`") and part.endswith("`") and len(part) > 1:
+            out.append(f"<code>{html.escape(part[1:-1], quote=False)}</code>")
+            continue
+        part = html.escape(part)
+        for pattern, replacement in INLINE_PATTERNS:
+            part = pattern.sub(replacement, part)
+        out.append(part)
+    return "".join(out)
+
+
+def basic_markdown(text):
+    """A small Markdown subset: headings, paragraphs, lists, quotes, fenced code and inline markup."""
+    out, paragraph, list_tag = [], [], None
+
+    def flush_paragraph():
+        if paragraph:
+            out.append(f"<p>{inline_markdown(' '.join(paragraph))}</p>")
+            paragraph.clear()
+
+    def close_list():
+        nonlocal list_tag
+        if list_tag:
+            out.append(f"</{list_tag}>")
+            list_tag = None
+
+    lines = text.replace("\r\n", "\n").split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            flush_paragraph()
+            close_list()
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith("```"):
+                code.append(lines[i])
+                i += 1
+            out.append(f"<pre><code>{html.escape(chr(10).join(code), quote=False)}</code></pre>")
+        elif not stripped:
+            flush_paragraph()
+            close_list()
+        elif heading := re.match(r"(#{1,6})\s+(.*?)\s*#*$", stripped):
+            flush_paragraph()
+            close_list()
+            level = len(heading.group(1))
+            out.append(f"<h{level}>{inline_markdown(heading.group(2))}</h{level}>")
+        elif re.fullmatch(r"(-\s*){3,}|(\*\s*){3,}", stripped):
+            flush_paragraph()
+            close_list()
+            out.append("<hr>")
+        elif item := re.match(r"([-*+]|\d+[.)])\s+(.*)", stripped):
+            flush_paragraph()
+            tag = "ul" if item.group(1) in "-*+" else "ol"
+            if list_tag != tag:
+                close_list()
+                out.append(f"<{tag}>")
+                list_tag = tag
+            out.append(f"<li>{inline_markdown(item.group(2))}</li>")
+        elif stripped.startswith(">"):
+            flush_paragraph()
+            close_list()
+            out.append(f"<blockquote><p>{inline_markdown(stripped.lstrip('> '))}</p></blockquote>")
+        else:
+            close_list()
+            paragraph.append(stripped)
+        i += 1
+    flush_paragraph()
+    close_list()
+    return "\n".join(out)
+
+
+def to_html(content):
+    """Convert Markdown to HTML; content that already looks like HTML is passed through."""
+    if HTML_START.match(content):
+        return content
+    if markdown is None:
+        return basic_markdown(content)
+    return markdown.markdown(content, extensions=["fenced_code", "tables"])
+
+
+# --- Sanitizing ---
+class Sanitizer(HTMLParser):
+    """
+    Allow-list HTML filter that also gives h1-h3 headings stable ids,
+    collects them as a table of contents and counts words.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.stack = []
+        self.dropping = 0
+        self.words = 0
+        self.toc = []
+        self.heading = None  # (tag, attrs, buffered output, text) while inside a TOC heading
+        self.used_ids = set()
+
+    def emit(self, chunk):
+        (self.heading[2] if self.heading else self.out).append(chunk)
+
+    def clean_attrs(self, tag, attrs):
+        cleaned = []
+        for name, value in attrs:
+            if name not in ALLOWED_ATTRS.get(tag, ()) or value is None:
+                continue
+            if name in URL_ATTRS:
+                # Browsers ignore whitespace and control characters inside schemes
+                scheme = re.match(r"([a-zA-Z][a-zA-Z0-9+.-]*):", re.sub(r"[\x00-\x20]", "", value))
+                if scheme and scheme.group(1).lower() not in SAFE_SCHEMES:
+                    continue
+            cleaned.append(f' {name}="{html.escape(value)}"')
+        if tag == "a" and any(name == "href" for name, _ in attrs):
+            cleaned.append(' rel="nofollow noopener"')
+        return "".join(cleaned)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        if tag in TOC_LEVELS and self.heading is None:
+            self.heading = (tag, self.clean_attrs(tag, attrs), [], [])
+            self.stack.append(tag)
+            return
+        self.emit(f"<{tag}{self.clean_attrs(tag, attrs)}>")
+        if tag not in VOID_TAGS:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and tag in self.stack and self.stack[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.stack:
+            return
+        # Close anything left open inside this element
+        while self.stack:
+            open_tag = self.stack.pop()
+            if self.heading and open_tag == self.heading[0]:
+                self.close_heading()
+            else:
+                self.emit(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def close_heading(self):
+        tag, attrs, body, text = self.heading
+        self.heading = None
+        title = " ".join("".join(text).split())
+        base = slugify(title) or "section"
+        anchor, n = base, 2
+        while anchor in self.used_ids:
+            anchor, n = f"{base}-{n}", n + 1
+        self.used_ids.add(anchor)
+        self.toc.append({"level": int(tag[1]), "id": anchor, "title": title})
+        self.out.append(f'<{tag} id="{anchor}"{attrs}>{"".join(body)}</{tag}>')
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.words += len(data.split())
+        if self.heading:
+            self.heading[3].append(data)
+        self.emit(html.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.stack:
+            self.handle_endtag(self.stack[-1])
+        return "".join(self.out)
+
+
+def render(content):
+    """Render an article body to {"html", "toc", "word_count", "read_time_minutes"}."""
+    sanitizer = Sanitizer()
+    sanitizer.feed(to_html(content or ""))
+    rendered = sanitizer.close()
+    return {
+        "html": rendered,
+        "toc": sanitizer.toc,
+        "word_count": sanitizer.words,
+        "read_time_minutes": max(1, math.ceil(sanitizer.words / WORDS_PER_MINUTE)),
+    }
+
+
+def apply_render(article, result=None):
+    """Store a render of ``article.content`` on the article (unsaved). False if already current."""
+    digest = content_hash(article.content)
+    if result is None and article.content_hash == digest:
+        return False
+    result = result or render(article.content)
+    article.content_html = result["html"]
+    article.toc = result["toc"]
+    article.read_time_minutes = result["read_time_minutes"]
+    article.content_hash = digest
+    return True
+
+
+@receiver(pre_save, sender="dashboard.KnowledgeArticle")
+def render_on_save(sender, instance, update_fields=None, **kwargs):
+    # Partial saves that leave content alone can't have made the render stale
+    if update_fields is None or "content" in update_fields:
+        apply_render(instance)
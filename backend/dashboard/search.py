@@ -0,0 +1,240 @@
+"""
+Full-text search for Knowledge Centre articles.
+
+Articles are copied into a search table that post_save/post_delete signals
+keep in step: an FTS5 virtual table on SQLite, a weighted tsvector with a
+GIN index on PostgreSQL. Other databases fall back to ``icontains``.
+``QuerySet.update()`` bypasses the signals; run
+``manage.py rebuild_search_index`` after bulk edits.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from .models import KnowledgeArticle
+
+TABLE = "dashboard_knowledgearticle_search"
+SNIPPET_WORDS = 16
+# Control characters never appear in article text, so they can mark matches
+# in raw snippets until the text has been HTML-escaped
+MARK_START, MARK_END = "\x02", "\x03"
+
+
+def search_terms(query):
+    return re.findall(r"\w+", query or "")
+
+
+def document(article):
+    """The indexed (title, summary, body) of an article, without markup."""
+    return article.title, strip_tags(article.summary or ""), strip_tags(article.content or "")
+
+
+def highlight(snippet):
+    """Escape a raw snippet and turn the match markers into <mark> tags."""
+    return mark_safe(escape(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>"))
+
+
+# --- Backends ---
+class SQLiteBackend:
+    """FTS5 table keyed by article id; weights live in its bm25 rank function."""
+
+    def index(self, cursor, pk, title, summary, body):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [pk])
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, title, summary, body) VALUES (%s, %s, %s, %s)",
+            [pk, title, summary, body],
+        )
+
+    def remove(self, cursor, pk):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [pk])
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+    def match_query(self, terms):
+        # Quoted terms are matched literally; the last one also matches as a prefix
+        return " ".join(f'"{term}"' for term in terms) + "*"
+
+    def match_sql(self, terms):
+        return f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [self.match_query(terms)]
+
+    def search(self, cursor, terms, limit, published_only):
+        published = "AND article.is_published" if published_only else ""
+        cursor.execute(
+            f"""
+            SELECT {TABLE}.rowid, -{TABLE}.rank,
+                   snippet({TABLE}, -1, %s, %s, '…', %s)
+            FROM {TABLE}
+            JOIN dashboard_knowledgearticle article ON article.id = {TABLE}.rowid
+            WHERE {TABLE} MATCH %s {published}
+            ORDER BY {TABLE}.rank
+            LIMIT %s
+            """,
+            [MARK_START, MARK_END, SNIPPET_WORDS, self.match_query(terms), limit],
+        )
+        return cursor.fetchall()
+
+
+class PostgresBackend:
+    """Side table holding a weighted tsvector (title A, summary B, body D) per article."""
+
+    # ts_rank weights for D, C, B and A
+    RANK_WEIGHTS = "{0.1, 0.2, 0.4, 1.0}"
+
+    def index(self, cursor, pk, title, summary, body):
+        cursor.execute(
+            f"""
+            INSERT INTO {TABLE} (article_id, body, document)
+            VALUES (%s, %s, setweight(to_tsvector('english', %s), 'A')
+                         || setweight(to_tsvector('english', %s), 'B')
+                         || setweight(to_tsvector('english', %s), 'D'))
+            ON CONFLICT (article_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document
+            """,
+            [pk, body, title, summary, body],
+        )
+
+    def remove(self, cursor, pk):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE article_id = %s", [pk])
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {TABLE}")
+
+    def match_query(self, terms):
+        return " & ".join(terms[:-1] + [terms[-1] + ":*"])
+
+    def match_sql(self, terms):
+        return (
+            f"SELECT article_id FROM {TABLE} WHERE document @@ to_tsquery('english', %s)",
+            [self.match_query(terms)],
+        )
+
+    def search(self, cursor, terms, limit, published_only):
+        published = "AND article.is_published" if published_only else ""
+        cursor.execute(
+            f"""
+            SELECT s.article_id, ts_rank(%s::float4[], s.document, q),
+                   ts_headline('english', s.body, q, %s)
+            FROM {TABLE} s
+            JOIN dashboard_knowledgearticle article ON article.id = s.article_id,
+                 to_tsquery('english', %s) q
+            WHERE s.document @@ q {published}
+            ORDER BY 2 DESC
+            LIMIT %s
+            """,
+            [
+                self.RANK_WEIGHTS,
+                f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=5",
+                self.match_query(terms),
+                limit,
+            ],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {"sqlite": SQLiteBackend, "postgresql": PostgresBackend}
+
+
+def get_backend():
+    """The index backend for the default database, or None to fall back to icontains."""
+    backend = BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+
+def fallback_filter(terms):
+    q = Q()
+    for term in terms:
+        q &= Q(title__icontains=term) | Q(summary__icontains=term) | Q(content__icontains=term)
+    return q
+
+
+# --- Querying ---
+def search(query, limit=20, published_only=True):
+    """
+    Best matches for ``query``, best first. Each article carries
+    ``search_rank`` (higher is better) and a highlighted ``search_snippet``.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    articles = KnowledgeArticle.objects.select_related("category").defer("content")
+    if published_only:
+        articles = articles.filter(is_published=True)
+
+    backend = get_backend()
+    if backend is None:
+        results = list(articles.filter(fallback_filter(terms))[:limit])
+        for article in results:
+            article.search_rank, article.search_snippet = 0, escape(article.summary)
+        return results
+
+    with connection.cursor() as cursor:
+        rows = backend.search(cursor, terms, limit, published_only)
+    by_id = articles.in_bulk([pk for pk, _, _ in rows])
+    results = []
+    for pk, rank, snippet in rows:
+        article = by_id.get(pk)
+        if article is not None:
+            article.search_rank, article.search_snippet = rank, highlight(snippet)
+            results.append(article)
+    return results
+
+
+def filter_queryset(queryset, query):
+    """Restrict a KnowledgeArticle queryset to matches for ``query``, keeping its ordering."""
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+    backend = get_backend()
+    if backend is None:
+        return queryset.filter(fallback_filter(terms))
+    sql, params = backend.match_sql(terms)
+    return queryset.filter(pk__in=RawSQL(sql, params))
+
+
+# --- Indexing ---
+def index_article(article):
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.index(cursor, article.pk, *document(article))
+
+
+def rebuild_index(batch_size=500):
+    """Re-index every article, one batch per transaction. Returns the number indexed."""
+    backend = get_backend()
+    if backend is None:
+        return 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+
+    count, last_id = 0, 0
+    while True:
+        batch = list(
+            KnowledgeArticle.objects.filter(id__gt=last_id).order_by("id").only("id", "title", "summary", "content")[:batch_size]
+        )
+        if not batch:
+            return count
+        with transaction.atomic(), connection.cursor() as cursor:
+            for article in batch:
+                backend.index(cursor, article.pk, *document(article))
+        count += len(batch)
+        last_id = batch[-1].pk
+
+
+@receiver(post_save, sender=KnowledgeArticle)
+def article_saved(sender, instance, **kwargs):
+    index_article(instance)
+
+
+@receiver(post_delete, sender=KnowledgeArticle)
+def article_deleted(sender, instance, **kwargs):
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, instance.pk)
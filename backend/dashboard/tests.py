@@ -1,3 +1,845 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from django.urls import reverse
+
+from . import popularity
+from .archive import archive_messages, search_archive
+from .catalog import get_catalog, invalidate_catalog
+from .conditional import table_stamp
+from .counters import adjust, get_counters, reconcile
+from .images import available_formats
+from .models import (
+    ArchivedMessage, ChunkedUpload, Client, ContactMessage, KnowledgeArticle, KnowledgeAttachment, KnowledgeCategory, Message, Service,
+    SubscriptionPlan, SupportMessage, Tool,
+)
+from .pagination import keyset_page
+from .related import rebuild, related_articles
+from .rendering import content_hash, render
+from .search import filter_queryset, rebuild_index, search
+from .uploads import partial_path, purge_stale_uploads
+from twain_core.storage import content_digest, file_sha256
+
+
+class PlanCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.basic = SubscriptionPlan.objects.create(
+            name="Basic", slug="basic", price_kes=1000, features="Chatbot, Reports", sort_order=1,
+        )
+        self.setup = SubscriptionPlan.objects.create(
+            name="Setup", slug="setup", plan_type="one_time", price_kes=5000,
+        )
+        SubscriptionPlan.objects.create(name="Old", slug="old", price_kes=10, is_active=False)
+
+    def test_catalog_groups_active_plans_in_one_query(self):
+        with self.assertNumQueries(2):  # the plans' stamp, then the plans
+            catalog = get_catalog()
+        self.assertEqual([p.pk for p in catalog["monthly_plans"]], [self.basic.pk])
+        self.assertEqual([p.pk for p in catalog["one_time_plans"]], [self.setup.pk])
+        with self.assertNumQueries(1):  # the stamp is still read to find the key
+            self.assertEqual(get_catalog()["monthly_plans"][0].feature_list(), ["Chatbot", "Reports"])
+        stamp = table_stamp(SubscriptionPlan)
+        with self.assertNumQueries(0):
+            get_catalog(stamp)
+
+    def test_save_and_delete_invalidate_catalog(self):
+        get_catalog()
+        self.basic.features = "Chatbot"
+        self.basic.save()
+        self.assertEqual(get_catalog()["monthly_plans"][0].feature_list(), ["Chatbot"])
+        self.basic.delete()
+        self.assertEqual(get_catalog()["monthly_plans"], [])
+
+    def test_change_made_elsewhere_is_seen_without_a_signal(self):
+        get_catalog()
+        # As another process would: nothing in this process's cache is told about it
+        SubscriptionPlan.objects.filter(pk=self.setup.pk).update(price_kes=6000, updated_at=timezone.now())
+        self.assertEqual(get_catalog()["one_time_plans"][0].price_kes, 6000)
+        SubscriptionPlan.objects.filter(pk=self.setup.pk).update(price_kes=7000)
+        invalidate_catalog()
+        self.assertEqual(get_catalog()["one_time_plans"][0].price_kes, 7000)
+
+    def test_pricing_page_reads_plans_from_cache(self):
+        self.client.force_login(User.objects.create_user("erin"))
+        self.client.get(reverse("dashboard_pricing"))
+        with self.assertNumQueries(3):  # session, user and the plans' version stamp
+            response = self.client.get(reverse("dashboard_pricing"))
+        self.assertEqual(response.status_code, 200)
+
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("otieno"))
+        self.article = KnowledgeArticle.objects.create(title="Setup", slug="setup", content="Body")
+        self.tool = Tool.objects.create(name="Zapier", slug="zapier")
+        SubscriptionPlan.objects.create(name="Basic", slug="basic", price_kes=1000)
+
+    def assert_revalidates(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        with self.assertNumQueries(3):  # session, user, one stamp query
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual((repeat.content, repeat.templates), (b"", []))
+        return first["ETag"]
+
+    def test_article_etag_follows_article_and_attachments(self):
+        url = self.article.get_absolute_url()
+        etag = self.assert_revalidates(url)
+        KnowledgeAttachment.objects.create(article=self.article, name="Guide", file="knowledge/attachments/guide.pdf")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)["ETag"]
+        self.article.title = "Setup guide"
+        self.article.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_article_etag_follows_rerender(self):
+        url = self.article.get_absolute_url()
+        # Last-Modified has one-second resolution
+        KnowledgeArticle.objects.filter(pk=self.article.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        first = self.client.get(url)
+        KnowledgeArticle.objects.filter(pk=self.article.pk).update(content_hash="")  # as after a renderer change
+        call_command("rerender_articles", workers=1, stdout=StringIO())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 200)
+
+    def test_tools_etag_follows_any_tool_change(self):
+        url = reverse("dashboard_tools")
+        etag = self.assert_revalidates(url)
+        self.tool.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pricing_etag_follows_plan_changes(self):
+        url = reverse("dashboard_pricing")
+        etag = self.assert_revalidates(url)
+        SubscriptionPlan.objects.create(name="Pro", slug="pro", price_kes=3000)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class KnowledgeSearchTests(TestCase):
+    def setUp(self):
+        self.bots = KnowledgeArticle.objects.create(
+            title="WhatsApp bots", slug="whatsapp-bots", summary="Automate replies.",
+            content="<p>Connect your <b>WhatsApp</b> number & start answering customers.</p>",
+        )
+        self.billing = KnowledgeArticle.objects.create(
+            title="Billing", slug="billing", summary="Paying with M-Pesa.",
+            content="Your WhatsApp bot renews monthly.",
+        )
+        self.draft = KnowledgeArticle.objects.create(
+            title="WhatsApp draft", slug="draft", content="Unpublished", is_published=False,
+        )
+
+    def test_title_matches_rank_above_body_matches(self):
+        results = search("whatsapp")
+        self.assertEqual([a.pk for a in results], [self.bots.pk, self.billing.pk])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        snippet = search("answering")[0].search_snippet
+        self.assertIn("<mark>answering</mark>", snippet)
+        self.assertIn("&amp;", snippet)
+        self.assertNotIn("<b>", snippet)
+
+    def test_prefix_and_stemmed_matches(self):
+        self.assertEqual([a.pk for a in search("autom")], [self.bots.pk])
+        self.assertEqual([a.pk for a in search("renew")], [self.billing.pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.billing.content = "Invoices are emailed."
+        self.billing.save()
+        self.assertEqual([a.pk for a in search("whatsapp")], [self.bots.pk])
+        self.bots.delete()
+        self.assertEqual(search("whatsapp"), [])
+
+    def test_filter_queryset_includes_unpublished(self):
+        matches = filter_queryset(KnowledgeArticle.objects.all(), "whatsapp")
+        self.assertEqual(set(matches), {self.bots, self.billing, self.draft})
+        self.assertEqual(rebuild_index(batch_size=2), 3)
+        self.assertEqual(filter_queryset(KnowledgeArticle.objects.all(), "unpublished").get(), self.draft)
+
+    def test_search_endpoint(self):
+        self.client.force_login(User.objects.create_user("frank"))
+        response = self.client.get(reverse("dashboard_knowledge_search"), {"q": "m-pesa"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["id"] for r in response.json()["results"]], [self.billing.pk])
+
+
+class RelatedArticleTests(TestCase):
+    def setUp(self):
+        articles = [
+            ("M-Pesa payments", "Accept M-Pesa payments with Daraja.", "Payments reach your till; Daraja callbacks confirm each payment."),
+            ("M-Pesa refunds", "Refund M-Pesa payments.", "Reverse payments through Daraja when a till callback fails."),
+            ("WhatsApp bots", "Automate WhatsApp replies.", "Bots answer customers on WhatsApp with templates."),
+            ("WhatsApp templates", "Approve WhatsApp templates.", "Templates let bots message customers first."),
+            ("Gardening", "Growing sukuma.", "Water seedlings daily."),
+        ]
+        self.articles = [
+            KnowledgeArticle.objects.create(title=title, slug=f"article-{n}", summary=summary, content=content)
+            for n, (title, summary, content) in enumerate(articles)
+        ]
+        rebuild()
+
+    def related(self, article):
+        return [a.pk for a in related_articles(article)]
+
+    def test_rebuild_links_articles_sharing_terms(self):
+        payments, refunds, bots, templates, gardening = self.articles
+        self.assertEqual(self.related(payments), [refunds.pk])
+        self.assertEqual(self.related(bots), [templates.pk])
+        self.assertEqual(self.related(gardening), [])
+
+    def test_detail_page_lists_related_articles(self):
+        with self.assertNumQueries(1):
+            related_articles(self.articles[0])
+        self.client.force_login(User.objects.create_user("wanjiru"))
+        response = self.client.get(self.articles[0].get_absolute_url())
+        self.assertContains(response, "Related articles")
+        self.assertContains(response, self.articles[1].get_absolute_url())
+
+    def test_saving_updates_neighbour_lists(self):
+        payments, refunds, bots, templates, _ = self.articles
+        with self.captureOnCommitCallbacks(execute=True):
+            chatbots = KnowledgeArticle.objects.create(
+                title="WhatsApp chatbots", slug="chatbots", summary="WhatsApp bots for customers.", content="Bots and templates.",
+            )
+        self.assertIn(bots.pk, self.related(chatbots))
+        self.assertIn(chatbots.pk, self.related(bots))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            refunds.is_published = False
+            refunds.save()
+        self.assertEqual(self.related(payments), [])
+        self.assertEqual(self.related(refunds), [])
+
+    def test_deleting_refreshes_neighbour_lists(self):
+        bots, templates = self.articles[2:4]
+        with self.captureOnCommitCallbacks(execute=True):
+            templates.delete()
+        self.assertEqual(self.related(bots), [])
+
+    def test_unrelated_edits_skip_recomputation(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.articles[0].save(update_fields=["updated_at"])
+        self.assertEqual(callbacks, [])
+
+
+class ArticleViewTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("achieng"))
+        self.setup = KnowledgeArticle.objects.create(title="Setup", slug="setup", content="Body")
+        self.billing = KnowledgeArticle.objects.create(title="Billing", slug="billing", content="Body")
+        popularity.buffer.drain()
+        cache.delete(popularity.LEADERBOARD_KEY)
+
+    def tearDown(self):
+        popularity.buffer.drain()
+
+    def test_views_are_buffered_until_the_interval_passes(self):
+        url = self.setup.get_absolute_url()
+        with self.settings(ARTICLE_VIEW_FLUSH_SECONDS=3600):
+            etag = self.client.get(url)["ETag"]
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(popularity.buffer.counts, {"setup": 2})
+        self.setup.refresh_from_db()
+        self.assertEqual(self.setup.view_count, 0)
+
+        with self.settings(ARTICLE_VIEW_FLUSH_SECONDS=0):
+            self.client.get(url)
+        self.setup.refresh_from_db()
+        self.assertEqual(self.setup.view_count, 3)
+        self.assertFalse(popularity.buffer.counts)
+
+    def test_flush_issues_one_update_per_distinct_count(self):
+        extra = KnowledgeArticle.objects.create(title="Extra", slug="extra", content="Body")
+        popularity.buffer.add("setup", 2)
+        popularity.buffer.add("billing", 2)
+        popularity.buffer.add("extra", 5)
+        popularity.buffer.add("missing")
+        with self.assertNumQueries(6):  # savepoint, an UPDATE each for 1, 2 and 5, release, leaderboard
+            self.assertEqual(popularity.flush(), 10)
+        counts = dict(KnowledgeArticle.objects.values_list("slug", "view_count"))
+        self.assertEqual(counts, {"setup": 2, "billing": 2, "extra": 5})
+
+    def test_recent_views_outrank_older_ones(self):
+        now = timezone.now()
+        half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+        popularity.write_views({"setup": 3}, now=now - 2 * half_life)
+        popularity.write_views({"billing": 1}, now=now)
+        leaderboard = popularity.build_leaderboard(now=now)
+        self.assertEqual([item["title"] for item in leaderboard], ["Billing", "Setup"])
+        self.assertAlmostEqual(leaderboard[0]["score"], 1.0)
+        self.assertAlmostEqual(leaderboard[1]["score"], 0.75)
+        self.assertEqual(leaderboard[1]["views"], 3)
+
+        popularity.write_views({"setup": 1}, now=now)
+        self.assertAlmostEqual(popularity.build_leaderboard(now=now)[0]["score"], 1.75)
+
+    def test_short_half_life_far_from_the_epoch_does_not_overflow(self):
+        # Over a hundred thousand half-lives: 2 ** that is far past the float limit
+        later = popularity.TRENDING_EPOCH + timedelta(days=3650)
+        with self.settings(TRENDING_HALF_LIFE_HOURS=0.5):
+            popularity.write_views({"setup": 2}, now=later)
+            popularity.write_views({"setup": 2}, now=later)
+            leaderboard = popularity.build_leaderboard(now=later)
+        self.assertAlmostEqual(leaderboard[0]["score"], 4.0)
+
+    def test_leaderboard_is_served_from_the_cache(self):
+        popularity.buffer.add("billing")
+        popularity.flush()
+        with self.assertNumQueries(0):
+            self.assertEqual([item["title"] for item in popularity.trending_articles()], ["Billing"])
+        response = self.client.get(reverse("dashboard_knowledge"))
+        self.assertContains(response, "Trending")
+        self.assertContains(response, self.billing.get_absolute_url())
+
+        self.billing.is_published = False
+        self.billing.save()
+        self.assertEqual(popularity.trending_articles(), [])
+
+    def test_failed_flush_keeps_views_buffered(self):
+        popularity.buffer.add("setup")
+        with mock.patch.object(popularity, "write_views", side_effect=DatabaseError), self.assertLogs("dashboard.popularity"):
+            self.assertEqual(popularity.flush(), 0)
+        self.assertEqual(popularity.buffer.counts, {"setup": 1})
+
+
+class AdminCounterTests(TestCase):
+    def counts(self, *fields):
+        counters = get_counters()
+        return tuple(counters[field] for field in fields)
+
+    def test_saves_and_deletes_adjust_counters(self):
+        first = Message.objects.create(name="Amina")
+        ContactMessage.objects.create(name="Baraka", is_read=True)  # proxies count too
+        Service.objects.create(title="Bots", description="WhatsApp bots")
+        client = Client.objects.create(name="Duka", email="duka@example.com")
+        self.assertEqual(self.counts("message_count", "unread_count", "service_count", "client_count"), (2, 1, 1, 1))
+
+        first.is_read = True
+        first.save(update_fields=["is_read"])
+        first.save()  # unchanged, so nothing to count
+        self.assertEqual(self.counts("message_count", "unread_count"), (2, 0))
+
+        Message.objects.filter(is_read=True).delete()
+        client.delete()
+        self.assertEqual(self.counts("message_count", "unread_count", "client_count"), (0, 0, 0))
+
+    def test_bulk_updates_adjust_explicitly(self):
+        Message.objects.create(name="Amina")
+        Message.objects.create(name="Baraka")
+        marked = Message.objects.filter(is_read=False).update(is_read=True)
+        adjust(unread_count=-marked)
+        self.assertEqual(self.counts("message_count", "unread_count"), (2, 0))
+
+    def test_reconcile_corrects_drift(self):
+        Message.objects.create(name="Amina")
+        Message.objects.bulk_create([Message(name="Baraka"), Message(name="Chebet", is_read=True)])
+        self.assertEqual(reconcile(), {"message_count": -2, "unread_count": -1})
+        self.assertEqual(self.counts("message_count", "unread_count"), (3, 2))
+        self.assertEqual(reconcile(), {})
+
+        out = StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertIn("already exact", out.getvalue())
+
+    def test_counters_are_one_row_read(self):
+        with self.assertNumQueries(1):
+            get_counters()
+
+
+class MessageKindTests(TestCase):
+    def test_forms_record_their_kind(self):
+        self.client.post(reverse("homepage"), {
+            "name": "Amina", "email": "amina@example.com", "business_name": "Duka", "platform": "WhatsApp",
+            "description": "A bot",
+        })
+        self.client.force_login(User.objects.create_user("baraka"))
+        self.client.post(reverse("dashboard_support"), {"problem": "Bot is down", "urgency": "High"})
+        self.assertEqual(set(Message.objects.values_list("kind", flat=True)), {"contact", "support"})
+        self.assertEqual(ContactMessage.objects.get().name, "Amina")
+        self.assertEqual(SupportMessage.objects.get().problem, "Bot is down")
+
+    def test_proxies_save_and_read_their_own_kind(self):
+        ticket = SupportMessage.objects.create(problem="Payments failing")
+        self.assertEqual(Message.objects.get(pk=ticket.pk).kind, "support")
+        self.assertEqual(list(ContactMessage.objects.all()), [])
+        self.assertIn("message_support_idx", SupportMessage.objects.order_by("-created_at", "id")[:100].explain())
+
+    def test_backfill_marks_messages_with_a_problem_as_support(self):
+        contact = Message.objects.create(name="Amina", kind="support")
+        ticket = Message.objects.create(problem="Bot is down")
+        Message.objects.update(kind="contact")
+        import_module("dashboard.migrations.0022_message_kind").backfill_kind(django_apps, None)
+        self.assertEqual(Message.objects.get(pk=contact.pk).kind, "contact")
+        self.assertEqual(Message.objects.get(pk=ticket.pk).kind, "support")
+
+
+class MessageArchiveTests(TestCase):
+    def setUp(self):
+        old = timezone.now() - timedelta(days=400)
+        for n in range(5):
+            Message.objects.create(name=f"Old {n}", description=f"Bot number {n}", is_read=True)
+        Message.objects.create(name="Old unread", is_read=False)
+        Message.objects.create(name="Recent", is_read=True)
+        Message.objects.exclude(name="Recent").update(created_at=old)
+
+    def test_moves_old_read_messages_in_batches(self):
+        originals = {m.pk: m for m in Message.objects.filter(name__startswith="Old ", is_read=True)}
+        with self.assertNumQueries(3 * 7 + 3):  # per batch: savepoint, select, insert, unread count, delete, counters, release; then an empty one
+            self.assertEqual(archive_messages(timedelta(days=180), batch_size=2), 5)
+        self.assertEqual(set(Message.objects.values_list("name", flat=True)), {"Old unread", "Recent"})
+        archived = ArchivedMessage.objects.get(pk=next(iter(originals)))
+        original = originals[archived.pk]
+        self.assertEqual((archived.name, archived.description, archived.created_at), (original.name, original.description, original.created_at))
+        self.assertEqual(get_counters()["message_count"], 2)
+        self.assertEqual(archive_messages(timedelta(days=180)), 0)
+
+    def test_search_and_command(self):
+        out = StringIO()
+        call_command("archive_messages", "--days", "30", stdout=out)
+        self.assertIn("Archived 5 messages", out.getvalue())
+        self.assertEqual([m.name for m in search_archive("number 3")], ["Old 3"])
+        self.assertEqual(search_archive("").count(), 5)
+
+    def test_search_index_follows_the_archive_table(self):
+        archive_messages(timedelta(days=180))
+        self.assertEqual([m.name for m in search_archive("num 2")], ["Old 2"])  # words match by prefix
+        ArchivedMessage.objects.filter(name="Old 2").update(description="Moved to WhatsApp")
+        self.assertEqual(search_archive("number 2").count(), 0)
+        self.assertEqual([m.name for m in search_archive("whatsapp")], ["Old 2"])
+        ArchivedMessage.objects.filter(name="Old 2").delete()
+        self.assertEqual(search_archive("whatsapp").count(), 0)
+
+
+class ArticleRenderingTests(TestCase):
+    def test_markdown_renders_with_toc(self):
+        result = render("# Setup\n\nRun **this**.\n\n## Setup\n\n- one\n- two")
+        self.assertIn('<h1 id="setup">Setup</h1>', result["html"])
+        self.assertIn('<h2 id="setup-2">Setup</h2>', result["html"])
+        self.assertIn("<strong>this</strong>", result["html"])
+        self.assertEqual([entry["id"] for entry in result["toc"]], ["setup", "setup-2"])
+
+    def test_html_is_sanitized(self):
+        html = render(
+            '<p onclick="x()">Hi<script>alert(1)</script> <a href="java\tscript:alert(1)">x</a>'
+            '<a href="https://twain.co.ke">ok</a></p>'
+        )["html"]
+        self.assertNotIn("script", html)
+        self.assertNotIn("onclick", html)
+        self.assertIn("<a rel=\"nofollow noopener\">x</a>", html)
+        self.assertIn('href="https://twain.co.ke"', html)
+
+    def test_read_time_from_word_count(self):
+        self.assertEqual(render("word " * 450)["read_time_minutes"], 3)
+
+    def test_save_renders_once_per_content(self):
+        article = KnowledgeArticle.objects.create(title="Guide", slug="guide", content="## Step one\n\nDo it.")
+        self.assertIn('<h2 id="step-one">', article.content_html)
+        self.assertEqual(article.content_hash, content_hash(article.content))
+        self.assertEqual(article.read_time_minutes, 1)
+
+        article.read_time_minutes = 7
+        article.save()
+        self.assertEqual(article.read_time_minutes, 7)  # content unchanged, render kept
+
+    def test_rerender_command_fixes_stale_rows(self):
+        article = KnowledgeArticle.objects.create(title="Guide", slug="guide", content="Body text")
+        KnowledgeArticle.objects.filter(pk=article.pk).update(content_html="old", content_hash="old")
+        call_command("rerender_articles", workers=2, stdout=StringIO())
+        article.refresh_from_db()
+        self.assertEqual(article.content_html, "<p>Body text</p>")
+        self.assertEqual(article.content_hash, content_hash("Body text"))
+
+    def test_changing_markdown_backend_makes_renders_stale(self):
+        article = KnowledgeArticle.objects.create(title="Guide", slug="guide", content="Body text")
+        with mock.patch("dashboard.rendering.RENDERER_BACKEND", "markdown-0.0"):
+            self.assertNotEqual(content_hash(article.content), article.content_hash)
+
+
+class KnowledgePaginationTests(TestCase):
+    def setUp(self):
+        self.guides = KnowledgeCategory.objects.create(name="Guides", slug="guides")
+        KnowledgeCategory.objects.create(name="Empty", slug="empty")
+        articles = [
+            KnowledgeArticle(
+                title=f"Article {i}", slug=f"article-{i}", content="Body", sort_order=i % 3,
+                category=self.guides if i % 2 else None,
+            )
+            for i in range(25)
+        ]
+        KnowledgeArticle.objects.bulk_create(articles)
+        # bulk_create gives near-identical timestamps; force ties on published_at too
+        KnowledgeArticle.objects.filter(id__lte=articles[10].pk).update(published_at=articles[0].published_at)
+
+    def test_pages_walk_the_full_ordering_without_gaps(self):
+        expected = list(KnowledgeArticle.objects.order_by("sort_order", "-published_at", "id").values_list("id", flat=True))
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(KnowledgeArticle.objects.all(), cursor, page_size=4)
+            seen += [a.pk for a in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_starts_from_the_top(self):
+        first, _ = keyset_page(KnowledgeArticle.objects.all(), None, page_size=3)
+        page, _ = keyset_page(KnowledgeArticle.objects.all(), "not-a-cursor", page_size=3)
+        self.assertEqual(page, first)
+
+    def test_listing_and_fragment(self):
+        self.client.force_login(User.objects.create_user("gina"))
+        popularity.trending_articles()  # the leaderboard is cached between view-count flushes
+        with self.assertNumQueries(4):  # session, user, categories with counts, one page
+            response = self.client.get(reverse("dashboard_knowledge"))
+        counts = {c.slug: c.article_count for c in response.context["categories"]}
+        self.assertEqual(counts, {"guides": 12, "empty": 0})
+        self.assertEqual(len(response.context["articles"]), 12)
+
+        fragment = self.client.get(
+            reverse("dashboard_knowledge_page"), {"cursor": response.context["next_cursor"]},
+        ).json()
+        self.assertIn("card-title", fragment["html"])
+
+
+def png_upload(name, size, mode="RGBA"):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@override_settings(IMAGE_DERIVATIVES_ASYNC=False)
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.formats = [fmt for fmt, _, _ in available_formats()]
+
+    def create_article(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return KnowledgeArticle.objects.create(title="Photo", slug="photo", content="Body", **kwargs)
+
+    def test_upload_builds_derivatives_at_each_width(self):
+        article = self.create_article(feature_image=png_upload("phone.png", (1000, 500)))
+        article.refresh_from_db()
+        variants = article.image_variants
+        self.assertEqual(variants["source"], article.feature_image.name)
+        self.assertEqual((variants["width"], variants["height"]), (1000, 500))
+        self.assertEqual(
+            sorted({(item["width"], item["height"]) for item in variants["items"]}),
+            [(320, 160), (640, 320), (960, 480), (1000, 500)],
+        )
+        self.assertEqual(len(variants["items"]), 4 * len(self.formats))
+        for item in variants["items"]:
+            self.assertTrue(default_storage.exists(item["name"]))
+
+        image = article.responsive_image()
+        self.assertEqual((image["width"], image["height"]), (1000, 500))
+        self.assertIn("320w", image["srcset"])
+        largest_jpeg = [item for item in variants["items"] if item["format"] == "jpeg"][-1]
+        self.assertEqual((largest_jpeg["width"], image["src"]), (1000, default_storage.url(largest_jpeg["name"])))
+        self.assertEqual(len(image["sources"]), len(self.formats) - 1)
+
+    def test_replacing_image_drops_old_derivatives(self):
+        article = self.create_article(feature_image=png_upload("first.png", (400, 300), mode="RGB"))
+        article.refresh_from_db()
+        old_files = [item["name"] for item in article.image_variants["items"]]
+
+        article.feature_image = png_upload("second.png", (200, 100), mode="RGB")
+        with self.captureOnCommitCallbacks(execute=True):
+            article.save()
+        article.refresh_from_db()
+        self.assertEqual({item["width"] for item in article.image_variants["items"]}, {200})
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+
+    def test_backfill_command(self):
+        article = self.create_article(feature_image=png_upload("old.png", (700, 700), mode="RGB"))
+        KnowledgeArticle.objects.filter(pk=article.pk).update(image_variants={})
+        self.assertEqual(KnowledgeArticle.objects.get(pk=article.pk).responsive_image()["srcset"], "")
+
+        call_command("build_image_derivatives", workers=2, stdout=StringIO())
+        article.refresh_from_db()
+        self.assertEqual({item["width"] for item in article.image_variants["items"]}, {320, 640, 700})
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.body = bytes(range(256)) * 40
+        self.name = default_storage.save("knowledge/videos/clip.mp4", ContentFile(self.body))
+        self.url = f"/media/{self.name}"
+        self.client.force_login(User.objects.create_user("hana"))
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_full_response_and_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(self.content(response), self.body)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.body)}")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(self.content(response), self.body[100:200])
+
+        suffix = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(self.content(suffix), self.body[-10:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.body)}-").status_code, 416)
+        # Several ranges are allowed to be answered with the whole file
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-1,5-6").status_code, 200)
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag).status_code, 206)
+        stale = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"0-0"')
+        self.assertEqual(stale.status_code, 200)
+        old_date = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=http_date(0))
+        self.assertEqual(old_date.status_code, 200)
+
+    def test_path_traversal_is_rejected(self):
+        self.assertEqual(self.client.get("/media/../settings.py").status_code, 404)
+        self.assertEqual(self.client.get("/media/knowledge/").status_code, 404)
+
+    @override_settings(MEDIA_OFFLOAD="x-accel-redirect", MEDIA_ACCEL_PREFIX="/protected-media/")
+    def test_offload_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.name}")
+        self.assertEqual(response.content, b"")
+
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.body = b"%PDF-1.4 handbook"
+        self.digest = hashlib.sha256(self.body).hexdigest()
+
+    def legacy_file(self, name):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as legacy:
+            legacy.write(self.body)
+        return path
+
+    def test_identical_uploads_share_one_blob(self):
+        first = default_storage.save("knowledge/attachments/handbook.pdf", ContentFile(self.body))
+        second = default_storage.save("knowledge/attachments/copy.pdf", ContentFile(self.body))
+        image = default_storage.save("knowledge/images/handbook.pdf", ContentFile(self.body))
+        self.assertEqual(first, f"knowledge/attachments/{self.digest}.pdf")
+        self.assertNotEqual(first, second)
+        self.assertEqual({content_digest(name) for name in (first, second, image)}, {self.digest})
+
+        blob = default_storage.blob_path(self.digest)
+        self.assertEqual(os.stat(blob).st_nlink, 4)
+        self.assertEqual(os.stat(default_storage.path(second)).st_ino, os.stat(blob).st_ino)
+
+        default_storage.delete(first)
+        default_storage.delete(image)
+        with default_storage.open(second) as remaining:
+            self.assertEqual(remaining.read(), self.body)
+        default_storage.delete(second)
+        self.assertFalse(os.path.exists(blob))
+
+    def test_hashed_names_are_served_as_immutable(self):
+        self.client.force_login(User.objects.create_user("amina"))
+        name = default_storage.save("knowledge/images/shot.png", ContentFile(self.body))
+        self.assertIn("immutable", self.client.get(f"/media/{name}")["Cache-Control"])
+        self.legacy_file("knowledge/images/old.png")
+        self.assertEqual(self.client.get("/media/knowledge/images/old.png")["Cache-Control"], "private, max-age=3600")
+        self.assertEqual(self.client.get(f"/media/.blobs/{self.digest[:2]}/{self.digest}").status_code, 404)
+        self.assertEqual(self.client.get(f"/media/knowledge/../.blobs/{self.digest[:2]}/{self.digest}").status_code, 404)
+
+    def test_dedupe_media_links_and_renames_existing_files(self):
+        article = KnowledgeArticle.objects.create(title="Guide", slug="guide", content="Body")
+        self.legacy_file("knowledge/attachments/guide.pdf")
+        self.legacy_file("knowledge/attachments/guide-copy.pdf")
+        attachment = KnowledgeAttachment.objects.create(article=article, name="Guide", file="knowledge/attachments/guide.pdf")
+
+        call_command("dedupe_media", "--rename", "--workers", "2", stdout=StringIO())
+        original, copy = (default_storage.path(f"knowledge/attachments/{n}.pdf") for n in ("guide", "guide-copy"))
+        self.assertEqual(os.stat(original).st_ino, os.stat(copy).st_ino)
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.file.name, f"knowledge/attachments/{self.digest}.pdf")
+        self.assertEqual(attachment.file.read(), self.body)
+        # Old names keep working for links already embedded in articles
+        self.assertTrue(os.path.exists(original))
+
+# Chunk bodies bigger than DATA_UPLOAD_MAX_MEMORY_SIZE prove they are streamed, not read into request.body
+@override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=1000, DATA_UPLOAD_MAX_MEMORY_SIZE=500)
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root, partial_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.addCleanup(shutil.rmtree, partial_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=partial_root))
+        self.user = User.objects.create_user("wanjiru")
+        self.client.force_login(self.user)
+        self.article = KnowledgeArticle.objects.create(title="Training", slug="training", content="Body")
+        self.data = os.urandom(2500)
+
+    def start(self, target="video", **extra):
+        payload = {"article": self.article.pk, "target": target, "filename": "intro.mp4", "size": len(self.data), **extra}
+        response = self.client.post(reverse("upload_create"), payload, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put_chunk(self, upload_id, index, body=None, checksum=None):
+        body = self.data[index * 1000:(index + 1) * 1000] if body is None else body
+        return self.client.put(
+            reverse("upload_chunk", args=[upload_id, index]), body, content_type="application/octet-stream",
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(body).hexdigest(),
+        )
+
+    def complete(self, upload_id):
+        return self.client.post(reverse("upload_complete", args=[upload_id]))
+
+    def test_chunks_in_any_order_assemble_into_the_video(self):
+        state = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertEqual((state["chunk_size"], state["total_chunks"], state["received"]), (1000, 3, []))
+        for index in (2, 0):
+            self.assertEqual(self.put_chunk(state["id"], index).status_code, 200)
+
+        # A resuming client learns which chunks are still needed
+        resumed = self.client.get(reverse("upload_detail", args=[state["id"]])).json()
+        self.assertEqual(resumed["received"], [0, 2])
+        self.assertEqual(self.complete(state["id"]).status_code, 409)
+
+        self.put_chunk(state["id"], 1)
+        response = self.complete(state["id"])
+        self.assertEqual(response.status_code, 200)
+        self.article.refresh_from_db()
+        self.assertEqual(response.json()["name"], self.article.video_file.name)
+        with self.article.video_file.open("rb") as stored:
+            self.assertEqual(stored.read(), self.data)
+        upload = ChunkedUpload.objects.get(pk=state["id"])
+        self.assertEqual(upload.status, "complete")
+        self.assertFalse(partial_path(upload).exists())
+        self.assertEqual(self.complete(state["id"]).status_code, 409)
+
+    def test_hash_and_move_run_outside_any_transaction(self):
+        state = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        for index in range(3):
+            self.put_chunk(state["id"], index)
+        depth = len(connection.savepoint_ids)
+        seen = []
+
+        def hash_file(path):
+            seen.append(len(connection.savepoint_ids))
+            return file_sha256(path)
+
+        with mock.patch("dashboard.uploads.file_sha256", hash_file), mock.patch("twain_core.storage.file_sha256", hash_file):
+            self.assertEqual(self.complete(state["id"]).status_code, 200)
+        self.assertEqual(seen, [depth, depth])  # the whole-file check, then the storage move
+
+    def test_failed_move_leaves_upload_resumable(self):
+        state = self.start()
+        for index in range(3):
+            self.put_chunk(state["id"], index)
+        with mock.patch("twain_core.storage.ContentAddressedStorage._save", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.complete(state["id"])
+        upload = ChunkedUpload.objects.get(pk=state["id"])
+        self.assertEqual(upload.status, "uploading")
+        self.assertTrue(partial_path(upload).exists())
+        self.assertEqual(self.complete(state["id"]).status_code, 200)
+
+    def test_failed_attach_marks_upload_failed(self):
+        state = self.start()
+        for index in range(3):
+            self.put_chunk(state["id"], index)
+        with mock.patch.object(KnowledgeArticle, "save", side_effect=DatabaseError("locked")):
+            with self.assertRaises(DatabaseError):
+                self.complete(state["id"])
+        self.assertEqual(ChunkedUpload.objects.get(pk=state["id"]).status, "failed")
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, "knowledge", "videos")), [])
+        response = self.complete(state["id"])
+        self.assertEqual((response.status_code, response.json()["error"]), (409, "Upload failed; start a new one."))
+
+    def test_replaced_video_is_deleted(self):
+        names = []
+        for _ in range(2):
+            self.data = os.urandom(2500)
+            state = self.start()
+            for index in range(3):
+                self.put_chunk(state["id"], index)
+            with self.captureOnCommitCallbacks(execute=True):
+                names.append(self.complete(state["id"]).json()["name"])
+        self.assertFalse(default_storage.exists(names[0]))
+        self.assertTrue(default_storage.exists(names[1]))
+
+    def test_bad_chunks_are_rejected(self):
+        state = self.start()
+        self.assertEqual(self.put_chunk(state["id"], 0, checksum="0" * 64).status_code, 422)
+        self.assertEqual(self.put_chunk(state["id"], 0, body=self.data[:999]).status_code, 400)
+        self.assertEqual(self.put_chunk(state["id"], 3, body=b"x").status_code, 400)
+        self.assertEqual(self.client.get(reverse("upload_detail", args=[state["id"]])).json()["received"], [])
+
+    def test_whole_file_checksum_is_verified(self):
+        state = self.start(sha256="0" * 64)
+        for index in range(3):
+            self.put_chunk(state["id"], index)
+        self.assertEqual(self.complete(state["id"]).status_code, 422)
+        self.article.refresh_from_db()
+        self.assertFalse(self.article.video_file)
+
+    def test_attachment_target_creates_attachment(self):
+        state = self.start(target="attachment", name="Slides")
+        for index in range(3):
+            self.put_chunk(state["id"], index)
+        self.assertEqual(self.complete(state["id"]).status_code, 200)
+        attachment = self.article.attachments.get()
+        self.assertEqual(attachment.name, "Slides")
+        self.assertEqual(attachment.file.size, len(self.data))
+
+    def test_uploads_are_private_to_their_owner(self):
+        state = self.start()
+        self.client.force_login(User.objects.create_user("intruder"))
+        self.assertEqual(self.put_chunk(state["id"], 0).status_code, 404)
+        self.assertEqual(self.client.get(reverse("upload_detail", args=[state["id"]])).status_code, 404)
+
+    def test_purge_removes_stale_uploads(self):
+        stale, fresh = self.start(), self.start()
+        ChunkedUpload.objects.filter(pk=stale["id"]).update(updated_at=ChunkedUpload.objects.get(pk=stale["id"]).updated_at - timedelta(days=2))
+        stale_path = partial_path(ChunkedUpload.objects.get(pk=stale["id"]))
+        self.assertEqual(purge_stale_uploads(timedelta(hours=24)), 1)
+        self.assertFalse(stale_path.exists())
+        self.assertTrue(partial_path(ChunkedUpload.objects.get(pk=fresh["id"])).exists())
+        self.assertFalse(ChunkedUpload.objects.filter(pk=stale["id"]).exists())
@@ -0,0 +1,248 @@
+"""
+Resumable chunked uploads for Knowledge article videos and attachments.
+
+A client opens an upload with the file's size (and optionally its SHA-256),
+then PUTs fixed-size chunks in any order, each with its own SHA-256. Chunks
+are streamed straight into a preallocated ``.part`` file with positional
+writes, so memory stays at one block whatever the file size, and a dropped
+connection only costs the chunks in flight: the upload's status lists what
+has arrived. On completion the file is moved (not copied) into storage and
+attached to the article. ``manage.py purge_stale_uploads`` removes uploads
+that were abandoned.
+"""
+import functools
+import hashlib
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from twain_core.storage import file_sha256
+
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    status = 400
+
+
+class ChecksumMismatch(UploadError):
+    status = 422
+
+
+class IncompleteUpload(UploadError):
+    status = 409
+
+
+class AssembledFile(File):
+    """
+    A finished ``.part`` file. ``temporary_file_path()`` makes
+    FileSystemStorage move it into place instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_dir():
+    # Keep this on the same filesystem as MEDIA_ROOT so completion is a rename
+    path = Path(settings.CHUNKED_UPLOAD_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def partial_path(upload):
+    return upload_dir() / f"{upload.pk}.part"
+
+
+def create_upload(user, article, target, filename, size, sha256="", attachment_name=""):
+    from .models import ChunkedUpload
+
+    filename = os.path.basename(str(filename or "").replace("\\", "/")).strip()
+    if target not in dict(ChunkedUpload.TARGET_CHOICES):
+        raise UploadError("Unknown upload target.")
+    if not filename:
+        raise UploadError("A filename is required.")
+    if not isinstance(size, int) or isinstance(size, bool) or size < 1:
+        raise UploadError("Size must be a positive number of bytes.")
+    if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError("File is too large.")
+    sha256 = (sha256 or "").lower()
+    if sha256 and (len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256)):
+        raise UploadError("sha256 must be a hex SHA-256 digest.")
+
+    upload = ChunkedUpload.objects.create(
+        user=user, article=article, target=target, filename=filename, size=size, sha256=sha256,
+        attachment_name=(attachment_name or "")[:200], chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+    )
+    # Sparse on most filesystems: no blocks are written until chunks arrive
+    with open(partial_path(upload), "wb") as part:
+        part.truncate(size)
+    return upload
+
+
+def upload_state(upload):
+    received = sorted(upload.chunks.values_list("index", flat=True))
+    return {
+        "id": str(upload.pk),
+        "status": upload.status,
+        "filename": upload.filename,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "total_chunks": upload.total_chunks,
+        "received": received,
+    }
+
+
+def not_uploading(status):
+    if status == "failed":
+        return IncompleteUpload("Upload failed; start a new one.")
+    return IncompleteUpload("Upload is already complete.")
+
+
+def write_chunk(upload, index, stream, length, sha256):
+    """
+    Copy chunk ``index`` from ``stream`` to its offset in the ``.part`` file,
+    one block at a time. The chunk only counts as received if its length and
+    SHA-256 match; a bad chunk is simply sent again.
+    """
+    from .models import UploadChunk
+
+    if upload.status != "uploading":
+        raise not_uploading(upload.status)
+    if not 0 <= index < upload.total_chunks:
+        raise UploadError("Chunk index out of range.")
+    expected = upload.chunk_length(index)
+    if length != expected:
+        raise UploadError(f"Chunk {index} must be {expected} bytes.")
+    sha256 = (sha256 or "").lower()
+    if not sha256:
+        raise UploadError("Chunk checksum is missing.")
+
+    digest = hashlib.sha256()
+    offset = index * upload.chunk_size
+    written = 0
+    fd = os.open(partial_path(upload), os.O_WRONLY)
+    try:
+        while written < expected:
+            block = stream.read(min(BLOCK_SIZE, expected - written))
+            if not block:
+                break
+            digest.update(block)
+            # Positional writes: concurrent chunks never share a file offset
+            os.pwrite(fd, block, offset + written)
+            written += len(block)
+    finally:
+        os.close(fd)
+    if written != expected:
+        raise UploadError(f"Chunk {index} was truncated.")
+    if digest.hexdigest() != sha256:
+        raise ChecksumMismatch(f"Chunk {index} failed its checksum.")
+
+    UploadChunk.objects.update_or_create(upload=upload, index=index, defaults={"sha256": sha256})
+    # Touch the upload so the stale-upload sweep sees it is still active
+    type(upload).objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+
+
+def complete_upload(upload):
+    """
+    Verify the assembled file and attach it; returns the stored FieldFile.
+
+    Hashing and moving a file of up to CHUNKED_UPLOAD_MAX_SIZE takes a while,
+    and on SQLite an open transaction holds the database write lock, so both
+    run outside one. The upload is claimed first (uploading -> assembling in
+    one UPDATE, which also stops a second completion racing this one); only
+    attaching the stored file is a transaction.
+    """
+    from .models import ChunkedUpload, KnowledgeArticle, KnowledgeAttachment
+
+    claimed = ChunkedUpload.objects.filter(pk=upload.pk, status="uploading").update(
+        status="assembling", updated_at=timezone.now()
+    )
+    if not claimed:
+        raise not_uploading(ChunkedUpload.objects.filter(pk=upload.pk).values_list("status", flat=True).first())
+    upload = ChunkedUpload.objects.select_related("article").get(pk=upload.pk)
+    try:
+        received = upload.chunks.count()
+        if received != upload.total_chunks:
+            raise IncompleteUpload(f"{upload.total_chunks - received} chunk(s) still missing.")
+        path = partial_path(upload)
+        if upload.sha256 and file_sha256(path) != upload.sha256:
+            raise ChecksumMismatch("Assembled file does not match its checksum.")
+    except BaseException:
+        ChunkedUpload.objects.filter(pk=upload.pk).update(status="uploading")
+        raise
+
+    article = upload.article
+    if upload.target == "video":
+        owner, stored = article, article.video_file
+    else:
+        owner = KnowledgeAttachment(article=article, name=upload.attachment_name or upload.filename)
+        stored = owner.file
+    try:
+        with AssembledFile(open(path, "rb"), name=upload.filename) as assembled:
+            stored.save(upload.filename, assembled, save=False)
+    except BaseException:
+        # While the .part file is still there nothing was stored and the
+        # client can simply complete again
+        status = "uploading" if path.exists() else "failed"
+        ChunkedUpload.objects.filter(pk=upload.pk).update(status=status, updated_at=timezone.now())
+        raise
+
+    try:
+        with transaction.atomic():
+            attached = ChunkedUpload.objects.filter(pk=upload.pk, status="assembling").update(
+                status="complete", updated_at=timezone.now()
+            )
+            if not attached:
+                raise IncompleteUpload("Upload was removed while it was being assembled.")
+            if upload.target == "video":
+                replaced = KnowledgeArticle.objects.filter(pk=article.pk).values_list("video_file", flat=True).get()
+                article.save(update_fields=["video_file", "updated_at"])
+                if replaced and replaced != stored.name:
+                    transaction.on_commit(functools.partial(stored.storage.delete, replaced))
+            else:
+                last = article.attachments.order_by("-sort_order").values_list("sort_order", flat=True).first()
+                owner.sort_order = 0 if last is None else last + 1
+                owner.save()
+            upload.chunks.all().delete()
+    except BaseException:
+        # The .part file was moved into storage, so there is nothing left to
+        # retry with; purge_stale_uploads removes the failed upload later
+        stored.storage.delete(stored.name)
+        ChunkedUpload.objects.filter(pk=upload.pk, status="assembling").update(status="failed", updated_at=timezone.now())
+        raise
+    return stored
+
+
+def delete_upload(upload):
+    partial_path(upload).unlink(missing_ok=True)
+    upload.delete()
+
+
+def purge_stale_uploads(max_age=None):
+    """
+    Delete uploads untouched for ``max_age`` (CHUNKED_UPLOAD_EXPIRY_HOURS by
+    default) together with their ``.part`` files, and any ``.part`` file that
+    no upload owns. Returns the number of uploads removed.
+    """
+    from .models import ChunkedUpload
+
+    if max_age is None:
+        max_age = timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS)
+    cutoff = timezone.now() - max_age
+    stale = ChunkedUpload.objects.filter(updated_at__lt=cutoff)
+    removed = 0
+    for upload in stale.iterator():
+        delete_upload(upload)
+        removed += 1
+
+    live = {str(pk) for pk in ChunkedUpload.objects.exclude(status="complete").values_list("pk", flat=True)}
+    for part in upload_dir().glob("*.part"):
+        if part.stem not in live and part.stat().st_mtime < cutoff.timestamp():
+            part.unlink(missing_ok=True)
+    return removed
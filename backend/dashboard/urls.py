@@ -6,17 +6,26 @@ urlpatterns = [
     # --- Core Dashboard Pages ---
     path("", views.dashboard_home, name="dashboard_home"),
     path("subscription/", views.dashboard_subscription, name="dashboard_subscription"), 
+    path("subscription/<int:plan_id>/pay/", views.initiate_payment, name="initiate_payment"),
     path("pricing/", views.pricing_page, name="dashboard_pricing"),
     path("settings/", views.settings_page, name="dashboard_settings"),
     path("support/", dashboard_support, name="dashboard_support"),
 
     # --- Knowledge Centre ---
     path("knowledge/", views.knowledge_centre_page, name="dashboard_knowledge"),
+    path("knowledge/page/", views.knowledge_articles_fragment, name="dashboard_knowledge_page"),
+    path("knowledge/search/", views.knowledge_search, name="dashboard_knowledge_search"),
     path("knowledge/<slug:slug>/", views.knowledge_detail_page, name="dashboard_knowledge_detail"),
     path("knowledge/add/", views.knowledge_add, name="knowledge_add"),
     path("knowledge/<int:pk>/edit/", views.knowledge_edit, name="knowledge_edit"),
     path("knowledge/<int:pk>/delete/", views.knowledge_delete, name="knowledge_delete"),
 
+    # --- Chunked uploads ---
+    path("uploads/", views.upload_create, name="upload_create"),
+    path("uploads/<uuid:upload_id>/", views.upload_detail, name="upload_detail"),
+    path("uploads/<uuid:upload_id>/chunks/<int:index>/", views.upload_chunk, name="upload_chunk"),
+    path("uploads/<uuid:upload_id>/complete/", views.upload_complete, name="upload_complete"),
+
     # --- Tools ---
     path("tools/", views.tools_page, name="dashboard_tools"),  
     path("tools/add/", views.tool_add, name="tool_add"),
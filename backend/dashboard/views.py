@@ -5,9 +5,12 @@ from django.conf import settings
 from django.urls import reverse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.contrib import messages
 
@@ -18,8 +21,18 @@ from dashboard.models import (
     Tool,
     KnowledgeArticle,
     KnowledgeCategory,
+    ChunkedUpload,
 )
+from dashboard import conditional, uploads
+from dashboard.catalog import get_catalog
+from dashboard.pagination import keyset_page
+from dashboard.popularity import counts_views, trending_articles
+from dashboard.related import related_articles
+from dashboard.search import search
 from admin_dashboard.forms import ToolForm, KnowledgeArticleForm, KnowledgeCategoryForm
+from django_daraja.mpesa.exceptions import MpesaConnectionError
+from payments.checkout import start_checkout
+from twain_core.ratelimit import ratelimit
 
 
 # --- Dashboard Home ---
@@ -47,19 +60,70 @@ def dashboard_home(request):
 
 
 # --- Knowledge Centre ---
+def knowledge_page(request):
+    """The requested page of published articles, optionally within one category."""
+    articles = KnowledgeArticle.objects.filter(is_published=True).defer("content", "content_html", "toc")
+    category = request.GET.get("category", "").strip()
+    if category:
+        articles = articles.filter(category__slug=category)
+    return keyset_page(articles, request.GET.get("cursor"))
+
+
 @login_required
 def knowledge_centre_page(request):
-    categories = KnowledgeCategory.objects.filter(is_active=True).order_by("sort_order", "name")
-    articles = KnowledgeArticle.objects.filter(is_published=True).order_by("sort_order", "-published_at")
-    featured = articles.filter(featured=True)
+    query = request.GET.get("q", "").strip()
+    categories = KnowledgeCategory.objects.filter(is_active=True).annotate(
+        article_count=Count("articles", filter=Q(articles__is_published=True)),
+    ).order_by("sort_order", "name")
+    next_cursor = None
+    if query:
+        articles = search(query, limit=50)
+    else:
+        articles, next_cursor = knowledge_page(request)
     return render(request, "dashboard/knowledge_centre.html", {
         "categories": categories,
         "articles": articles,
-        "featured": featured,
+        "next_cursor": next_cursor,
+        "active_category": request.GET.get("category", ""),
+        "query": query,
+        "trending": [] if query else trending_articles(),
     })
 
 
 @login_required
+def knowledge_articles_fragment(request):
+    """Next page of article cards as HTML, for infinite scroll."""
+    articles, next_cursor = knowledge_page(request)
+    html = render_to_string("dashboard/includes/knowledge_cards.html", {"articles": articles}, request=request)
+    return JsonResponse({"html": html, "next_cursor": next_cursor})
+
+
+@login_required
+def knowledge_search(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 50)
+    except ValueError:
+        limit = 20
+    results = [
+        {
+            "id": article.pk,
+            "title": article.title,
+            "url": article.get_absolute_url(),
+            "summary": article.summary,
+            "snippet": article.search_snippet,
+            "rank": article.search_rank,
+        }
+        for article in search(query, limit=limit)
+    ]
+    return JsonResponse({"query": query, "results": results})
+
+
+# Browsers keep these pages but revalidate them; unchanged pages come back as 304
+@login_required
+@counts_views
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conditional.article_etag, last_modified_func=conditional.article_last_modified)
 def knowledge_detail_page(request, slug):
     article = KnowledgeArticle.objects.filter(slug=slug, is_published=True).first()
     if not article:
@@ -67,6 +131,7 @@ def knowledge_detail_page(request, slug):
     return render(request, "dashboard/knowledge_detail.html", {
         "article": article,
         "attachments": article.attachments.all(),
+        "related": related_articles(article),
     })
 
 
@@ -103,25 +168,84 @@ def knowledge_delete(request, pk):
     return redirect("dashboard_knowledge")
 
 
+# --- Chunked Uploads ---
+def upload_error(exc):
+    return JsonResponse({"error": str(exc)}, status=exc.status)
+
+
+@login_required
+@require_POST
+def upload_create(request):
+    try:
+        data = json.loads(request.body or b"{}")
+        article = KnowledgeArticle.objects.filter(pk=int(data.get("article", 0))).first()
+    except (ValueError, TypeError):
+        return JsonResponse({"error": "Invalid JSON body."}, status=400)
+    if article is None:
+        return JsonResponse({"error": "Article not found."}, status=404)
+    try:
+        upload = uploads.create_upload(
+            request.user, article, data.get("target"), data.get("filename"), data.get("size"),
+            sha256=data.get("sha256", ""), attachment_name=data.get("name", ""),
+        )
+    except uploads.UploadError as exc:
+        return upload_error(exc)
+    return JsonResponse(uploads.upload_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(["GET", "DELETE"])
+def upload_detail(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+    if request.method == "DELETE":
+        uploads.delete_upload(upload)
+        return HttpResponse(status=204)
+    return JsonResponse(uploads.upload_state(upload))
+
+
+@login_required
+@require_http_methods(["PUT"])
+def upload_chunk(request, upload_id, index):
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    try:
+        # Read from the request stream; request.body would buffer the whole chunk
+        uploads.write_chunk(upload, index, request, length, request.headers.get("X-Chunk-SHA256"))
+    except uploads.UploadError as exc:
+        return upload_error(exc)
+    return JsonResponse({"index": index, "received": True})
+
+
+@login_required
+@require_POST
+def upload_complete(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+    try:
+        stored = uploads.complete_upload(upload)
+    except uploads.UploadError as exc:
+        return upload_error(exc)
+    return JsonResponse({"status": "complete", "name": stored.name, "url": stored.url})
+
+
 # --- Subscription Page ---
 @login_required
 def dashboard_subscription(request):
-    plans = SubscriptionPlan.objects.filter(is_active=True).order_by("sort_order", "price_kes")
-    monthly_plans = plans.filter(plan_type="monthly")
-    one_time_plans = plans.filter(plan_type="one_time")
-
     user_sub = None
     if request.user.is_authenticated:
         user_sub = UserSubscription.objects.filter(user=request.user).first()
 
     return render(request, "dashboard/subscription.html", {
-        "monthly_plans": monthly_plans,
-        "one_time_plans": one_time_plans,
+        **get_catalog(),
         "user_sub": user_sub,
     })
 
 # --- Tools Page ---
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conditional.tools_etag, last_modified_func=conditional.tools_last_modified)
 def tools_page(request):
     tools = Tool.objects.filter(is_active=True).order_by("sort_order", "name")
     return render(request, "dashboard/tools.html", {"tools": tools})
@@ -165,6 +289,7 @@ def tool_delete(request, pk):
 def dashboard_support(request):
     if request.method == "POST":
         Message.objects.create(
+            kind="support",
             problem=request.POST.get("problem"),
             urgency=request.POST.get("urgency"),
         )
@@ -174,15 +299,10 @@ def dashboard_support(request):
 
 # --- Pricing Page ---
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=conditional.plans_etag, last_modified_func=conditional.plans_last_modified)
 def pricing_page(request):
-    plans = SubscriptionPlan.objects.filter(is_active=True).order_by("sort_order", "price_kes")
-    monthly_plans = plans.filter(plan_type="monthly")
-    one_time_plans = plans.filter(plan_type="one_time")
-
-    return render(request, "dashboard/pricing.html", {
-        "monthly_plans": monthly_plans,
-        "one_time_plans": one_time_plans,
-    })
+    return render(request, "dashboard/pricing.html", get_catalog(conditional.plans_stamp(request)))
 
 
 # --- Settings Page ---
@@ -195,15 +315,29 @@ def settings_page(request):
 # --- M-Pesa Payment Handlers ---
 @login_required
 @require_POST
+@ratelimit(key="phone", rate="3/m")
+@ratelimit(key="user", rate="10/m")
 def initiate_payment(request, plan_id):
     plan = get_object_or_404(SubscriptionPlan, pk=plan_id)
     phone_number = request.POST.get("phone_number", "").strip()
 
-    # Basic validation (expects 2547XXXXXXXX format)
-    if not phone_number or not phone_number.startswith("2547") or len(phone_number) != 12:
+    def render_subscription(**extra):
         return render(request, "dashboard/subscription.html", {
-            "monthly_plans": SubscriptionPlan.objects.filter(is_active=True, plan_type="monthly").order_by("sort_order", "price_kes"),
-            "one_time_plans": SubscriptionPlan.objects.filter(is_active=True, plan_type="one_time").order_by("sort_order", "price_kes"),
+            **get_catalog(),
             "user_sub": UserSubscription.objects.filter(user=request.user).first(),
-            "payment_error": "Enter a valid phone (2547XXXXXXXX).",
+            **extra,
         })
+
+    # Basic validation (expects 2547XXXXXXXX format)
+    if not phone_number or not phone_number.startswith("2547") or len(phone_number) != 12:
+        return render_subscription(payment_error="Enter a valid phone (2547XXXXXXXX).")
+
+    # Repeat submissions within the dedupe window reuse the first STK push
+    try:
+        response_data = start_checkout(request.user, phone_number, plan.price_kes, plan=plan)
+    except MpesaConnectionError:
+        return render_subscription(payment_error="M-Pesa is unavailable right now. Please try again shortly.")
+
+    if response_data.get("ResponseCode") != "0":
+        return render_subscription(payment_error=response_data.get("errorMessage") or "Payment request was rejected.")
+    return render_subscription(payment_message=response_data.get("CustomerMessage"))
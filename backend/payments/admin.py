@@ -1,3 +1,19 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import MpesaCallback, PaymentEvent
+
+
+@admin.register(MpesaCallback)
+class MpesaCallbackAdmin(admin.ModelAdmin):
+    list_display = ("id", "checkout_request_id", "status", "attempts", "received_at", "processed_at")
+    list_filter = ("status",)
+    search_fields = ("checkout_request_id",)
+    readonly_fields = ("raw_body", "received_at", "claimed_at", "processed_at")
+    ordering = ("-id",)
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "checkout_request_id", "created_at")
+    search_fields = ("checkout_request_id",)
+    ordering = ("-id",)
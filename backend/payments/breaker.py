@@ -0,0 +1,111 @@
+"""
+A small thread-safe circuit breaker.
+
+closed    -> calls go through; ``failure_threshold`` consecutive failures open it
+open      -> calls fail fast with CircuitOpenError for ``reset_timeout`` seconds
+half_open -> a single probe call is let through; success closes, failure re-opens
+"""
+import logging
+import threading
+import time
+
+from django_daraja.mpesa.exceptions import MpesaConnectionError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(MpesaConnectionError):
+    """Raised instead of calling upstream while the circuit is open."""
+
+    def __init__(self, name, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"{name} circuit is open; retry in {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, failure_exceptions=(Exception,)):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.transitions = {}
+        self.calls = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _transition(self, state):
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        logger.warning("Circuit %s: %s", self.name, key)
+        self.state = state
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                if elapsed < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._probe_in_flight = True
+            self.calls += 1
+
+    def _on_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def _on_failure(self):
+        with self._lock:
+            self.failed += 1
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.failure_exceptions:
+            self._on_failure()
+            raise
+        except BaseException:
+            # Not an upstream failure (e.g. bad input); don't leave a half-open probe hanging
+            with self._lock:
+                self._probe_in_flight = False
+            raise
+        self._on_success()
+        return result
+
+    def snapshot(self):
+        """Current state and counters, for dashboards and health checks."""
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "calls": self.calls,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "transitions": dict(self.transitions),
+            }
@@ -0,0 +1,92 @@
+"""
+Starting an M-Pesa checkout (STK push + pending Payment).
+
+Repeat requests for the same user, plan and phone inside
+MPESA_CHECKOUT_DEDUPE_SECONDS get the first request's Daraja response
+back instead of sending another push.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .daraja import get_client
+from .models import CheckoutIdempotencyKey, Payment
+
+# Returned to a duplicate request while the first one is still talking to Daraja
+IN_PROGRESS_RESPONSE = {
+    "ResponseCode": "0",
+    "ResponseDescription": "Payment request already in progress",
+    "CustomerMessage": "A payment prompt has already been sent to your phone.",
+}
+
+
+def idempotency_key(user, plan, phone_number, amount):
+    raw = f"{user.pk}:{plan.pk if plan else ''}:{phone_number}:{amount}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def claim_key(key):
+    """
+    Reserve ``key`` for this request.
+
+    Returns (record, created). ``created`` is False when another request
+    holds an unexpired reservation for the same key.
+    """
+    now = timezone.now()
+    window = timedelta(seconds=getattr(settings, "MPESA_CHECKOUT_DEDUPE_SECONDS", 60))
+    CheckoutIdempotencyKey.objects.filter(key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            return CheckoutIdempotencyKey.objects.create(key=key, expires_at=now + window), True
+    except IntegrityError:
+        record = CheckoutIdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            # The holder released it between our insert and this read; try once more
+            return claim_key(key)
+        return record, False
+
+
+def purge_expired_keys():
+    """Delete idempotency keys whose window has passed."""
+    return CheckoutIdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def start_checkout(user, phone_number, amount, plan=None, callback_url=None,
+                   account_reference="Twain", transaction_desc="Subscription"):
+    """Send an STK push for ``amount`` and record the pending Payment; returns Daraja's response."""
+    record, created = claim_key(idempotency_key(user, plan, phone_number, amount))
+    if not created:
+        return record.response or IN_PROGRESS_RESPONSE
+
+    try:
+        response_data = get_client().stk_push(
+            phone_number, amount, account_reference, transaction_desc,
+            callback_url or settings.MPESA_CALLBACK_URL,
+        )
+    except Exception:
+        record.delete()
+        raise
+
+    # Extract checkout request ID
+    checkout_request_id = response_data.get("CheckoutRequestID")
+    if not checkout_request_id:
+        # Daraja rejected the push; let the user retry straight away
+        record.delete()
+        return response_data
+
+    # Save pending payment with checkout_request_id
+    payment = Payment.objects.create(
+        user=user,
+        plan=plan,
+        amount=amount,
+        phone_number=phone_number,
+        status='pending',
+        checkout_request_id=checkout_request_id,
+    )
+    record.payment = payment
+    record.response = response_data
+    record.save(update_fields=["payment", "response"])
+    return response_data
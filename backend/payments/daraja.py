@@ -0,0 +1,191 @@
+import base64
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django_daraja.mpesa.exceptions import MpesaConnectionError, MpesaInvalidParameterException
+from django_daraja.mpesa.utils import api_base_url, format_phone_number, mpesa_config
+
+from .breaker import CircuitBreaker
+
+
+# Refresh the OAuth token this many seconds before Daraja says it expires
+TOKEN_EXPIRY_MARGIN = 60
+
+# 5xx answers that are a normal reply rather than an outage
+# ("The transaction is being processed" from the STK Push Query API)
+PENDING_ERROR_CODES = {"500.001.1001"}
+
+
+class DarajaClient:
+    """
+    Process-wide Daraja API client.
+
+    Keeps one keep-alive connection pool and caches the OAuth access token
+    until shortly before it expires, so an STK push costs a single round-trip.
+    """
+
+    def __init__(self, base_url=None, consumer_key=None, consumer_secret=None, pool_size=10,
+                 timeout=None, budget=None, breaker=None):
+        self.base_url = (base_url or getattr(settings, "MPESA_API_BASE_URL", "") or api_base_url()).rstrip("/") + "/"
+        self.consumer_key = consumer_key or mpesa_config("MPESA_CONSUMER_KEY")
+        self.consumer_secret = consumer_secret or mpesa_config("MPESA_CONSUMER_SECRET")
+
+        # (connect, read) per HTTP request, and a total budget per API call
+        # (which may include a token refresh and a retry)
+        self.timeout = timeout or (
+            getattr(settings, "MPESA_CONNECT_TIMEOUT", 3.05),
+            getattr(settings, "MPESA_READ_TIMEOUT", 10),
+        )
+        self.budget = budget or getattr(settings, "MPESA_CALL_BUDGET", 15)
+        self.breaker = breaker or CircuitBreaker(
+            "daraja",
+            failure_threshold=getattr(settings, "MPESA_BREAKER_FAILURES", 5),
+            reset_timeout=getattr(settings, "MPESA_BREAKER_RESET_SECONDS", 30),
+            failure_exceptions=(MpesaConnectionError,),
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def _timeout(self, deadline):
+        """Per-request timeout, clipped to what is left of the call budget."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise MpesaConnectionError("Daraja call budget exhausted")
+        connect, read = self.timeout
+        return (min(connect, remaining), min(read, remaining))
+
+    # --- OAuth ---
+    def access_token(self, deadline=None):
+        """Return a valid access token, fetching a new one only when the cached one is stale."""
+        if self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+        with self._token_lock:
+            # Another thread may have refreshed the token while we waited for the lock
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+            return self._refresh_token(deadline or time.monotonic() + self.budget)
+
+    def _refresh_token(self, deadline):
+        url = self.base_url + "oauth/v1/generate?grant_type=client_credentials"
+        try:
+            r = self.session.get(url, auth=(self.consumer_key, self.consumer_secret), timeout=self._timeout(deadline))
+            r.raise_for_status()
+            data = r.json()
+        except (requests.exceptions.RequestException, ValueError) as ex:
+            raise MpesaConnectionError(f"Could not get access token: {ex}")
+
+        expires_in = int(data.get("expires_in", 3599))
+        self._token = data["access_token"]
+        self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+        return self._token
+
+    def invalidate_token(self):
+        """Drop the cached token, e.g. after Daraja rejects it."""
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    # --- Requests ---
+    def _post(self, path, data):
+        """POST to Daraja through the circuit breaker; fails fast while the circuit is open."""
+        return self.breaker.call(self._send, path, data)
+
+    def _send(self, path, data):
+        deadline = time.monotonic() + self.budget
+        headers = {"Authorization": "Bearer " + self.access_token(deadline)}
+        try:
+            r = self.session.post(self.base_url + path, json=data, headers=headers, timeout=self._timeout(deadline))
+            if r.status_code == 401:
+                # Token revoked early on Daraja's side: refresh once and retry
+                self.invalidate_token()
+                headers["Authorization"] = "Bearer " + self.access_token(deadline)
+                r = self.session.post(self.base_url + path, json=data, headers=headers, timeout=self._timeout(deadline))
+            payload = r.json()
+        except requests.exceptions.ConnectionError:
+            raise MpesaConnectionError("Connection failed")
+        except requests.exceptions.Timeout:
+            raise MpesaConnectionError("Daraja timed out")
+        except (requests.exceptions.RequestException, ValueError) as ex:
+            raise MpesaConnectionError(str(ex))
+
+        if r.status_code >= 500 and payload.get("errorCode") not in PENDING_ERROR_CODES:
+            raise MpesaConnectionError(f"Daraja returned HTTP {r.status_code}: {payload.get('errorMessage', '')}")
+        return payload
+
+    def _password(self):
+        """Return (business_short_code, timestamp, password) for Lipa na M-Pesa requests."""
+        if mpesa_config("MPESA_ENVIRONMENT") == "sandbox":
+            business_short_code = mpesa_config("MPESA_EXPRESS_SHORTCODE")
+        else:
+            business_short_code = mpesa_config("MPESA_SHORTCODE")
+        passkey = mpesa_config("MPESA_PASSKEY")
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        password = base64.b64encode((business_short_code + passkey + timestamp).encode("ascii")).decode("utf-8")
+        return business_short_code, timestamp, password
+
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc, callback_url):
+        """Send an STK prompt to the customer's phone and return Daraja's JSON response."""
+        if str(account_reference).strip() == "":
+            raise MpesaInvalidParameterException("Account reference cannot be blank")
+        if str(transaction_desc).strip() == "":
+            raise MpesaInvalidParameterException("Transaction description cannot be blank")
+        if not isinstance(amount, int):
+            raise MpesaInvalidParameterException("Amount must be an integer")
+
+        phone_number = format_phone_number(phone_number)
+        business_short_code, timestamp, password = self._password()
+        return self._post("mpesa/stkpush/v1/processrequest", {
+            "BusinessShortCode": business_short_code,
+            "Password": password,
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": amount,
+            "PartyA": phone_number,
+            "PartyB": business_short_code,
+            "PhoneNumber": phone_number,
+            "CallBackURL": callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": transaction_desc,
+        })
+
+    def stk_push_query(self, checkout_request_id):
+        """Ask Daraja for the final status of an earlier STK push."""
+        business_short_code, timestamp, password = self._password()
+        return self._post("mpesa/stkpushquery/v1/query", {
+            "BusinessShortCode": business_short_code,
+            "Password": password,
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
+        })
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared DarajaClient for this process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DarajaClient()
+    return _client
+
+
+def reset_client():
+    """Discard the shared client (used by tests and after settings changes)."""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,124 @@
+"""
+Pub/sub for payment status changes, across processes.
+
+Payments are settled by the callback worker and by reconciliation, each a
+management command in its own process, while the SSE view in
+payments.views runs on the ASGI server's event loop. Publishers therefore
+write a PaymentEvent row in the same transaction as the payment change.
+In the ASGI process one relay task per event loop, running only while some
+stream is open, reads new events every RELAY_INTERVAL seconds (a single
+primary-key range query however many streams are open) and hands them to
+the local subscribers. ``manage.py reconcile_payments`` purges old events.
+"""
+import asyncio
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import PaymentEvent
+
+RELAY_INTERVAL = 0.5
+# A relay starting up also delivers events this recent, so one committed
+# just before it began isn't missed; streams ignore repeats
+RELAY_LOOKBACK = timedelta(seconds=10)
+EVENT_MAX_AGE = timedelta(hours=1)
+
+_subscribers = {}
+_relays = {}
+_lock = threading.Lock()
+
+
+class Subscription:
+    """One SSE client waiting for updates to one checkout."""
+
+    def __init__(self, checkout_request_id):
+        self.checkout_request_id = checkout_request_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def deliver(self, payload):
+        # Called from any thread; the queue belongs to the event loop
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, payload)
+
+
+def subscribe(checkout_request_id):
+    subscription = Subscription(checkout_request_id)
+    with _lock:
+        _subscribers.setdefault(checkout_request_id, set()).add(subscription)
+        relay = _relays.get(subscription.loop)
+        if relay is None or relay.done():
+            _relays[subscription.loop] = subscription.loop.create_task(relay_events(subscription.loop))
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        subscribers = _subscribers.get(subscription.checkout_request_id)
+        if subscribers:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del _subscribers[subscription.checkout_request_id]
+        loop = subscription.loop
+        relay = _relays.get(loop)
+        if relay is not None and not any(s.loop is loop for group in _subscribers.values() for s in group):
+            del _relays[loop]
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(relay.cancel)
+
+
+def publish(checkout_request_id, payload):
+    """Send ``payload`` to everyone in this process watching ``checkout_request_id``."""
+    with _lock:
+        subscribers = list(_subscribers.get(checkout_request_id, ()))
+    for subscription in subscribers:
+        try:
+            subscription.deliver(payload)
+        except RuntimeError:
+            # Event loop already closed; the client is gone
+            unsubscribe(subscription)
+
+
+def watched(loop):
+    with _lock:
+        return {cid for cid, subscribers in _subscribers.items() if any(s.loop is loop for s in subscribers)}
+
+
+async def relay_events(loop):
+    """Deliver PaymentEvents to this loop's subscribers until none are left."""
+    since = timezone.now() - RELAY_LOOKBACK
+    before = PaymentEvent.objects.filter(created_at__lt=since).order_by("-id").values_list("id", flat=True)
+    last_id = await before.afirst() or 0
+    while checkout_request_ids := watched(loop):
+        events = PaymentEvent.objects.filter(id__gt=last_id, checkout_request_id__in=checkout_request_ids)
+        async for last_id, checkout_request_id, payload in events.order_by("id").values_list("id", "checkout_request_id", "payload"):
+            publish(checkout_request_id, payload)
+        await asyncio.sleep(RELAY_INTERVAL)
+
+
+def publish_payments(payments):
+    """Publish the payments' statuses; they reach subscribers when the current transaction commits."""
+    PaymentEvent.objects.bulk_create(
+        PaymentEvent(checkout_request_id=payment.checkout_request_id, payload=payment_payload(payment))
+        for payment in payments
+    )
+
+
+def publish_payment(payment):
+    publish_payments([payment])
+
+
+def purge_events(max_age=EVENT_MAX_AGE):
+    """Delete events older than any open stream could still be waiting for; returns how many."""
+    return PaymentEvent.objects.filter(created_at__lt=timezone.now() - max_age).delete()[0]
+
+
+def payment_payload(payment):
+    return {
+        "checkout_request_id": payment.checkout_request_id,
+        "status": payment.status,
+        "result_desc": payment.result_desc or "",
+    }
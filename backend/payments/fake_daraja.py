@@ -0,0 +1,211 @@
+"""
+A tiny local stand-in for the Safaricom Daraja API.
+
+Used by the test suite so the payment flow can run without network access:
+
+    with FakeDarajaServer() as fake:
+        client = DarajaClient(base_url=fake.base_url, consumer_key="k", consumer_secret="s")
+
+With ``send_callbacks=True`` it also plays the customer: after each STK push
+it POSTs an stkCallback to the push's CallBackURL (or ``callback_url``)
+after ``callback_delay`` seconds, failing or dropping a configurable share.
+"""
+import json
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeDarajaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path.startswith("/oauth/v1/generate"):
+            with fake.lock:
+                fake.token_requests += 1
+                fake.token = uuid.uuid4().hex[:28]
+            return self._send_json({"access_token": fake.token, "expires_in": str(fake.expires_in)})
+        self._send_json({"errorMessage": "Not found"}, status=404)
+
+    def do_POST(self):
+        fake = self.server.fake
+        data = self._read_json()
+        if fake.delay:
+            time.sleep(fake.delay)
+        if fake.fail_status:
+            return self._send_json({"errorCode": "500.003.02", "errorMessage": "System is busy"}, status=fake.fail_status)
+        if self.headers.get("Authorization") != f"Bearer {fake.token}":
+            return self._send_json({"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"}, status=401)
+
+        if self.path == "/mpesa/stkpush/v1/processrequest":
+            checkout_request_id = "ws_CO_" + uuid.uuid4().hex[:20]
+            merchant_request_id = uuid.uuid4().hex[:12]
+            with fake.lock:
+                fake.stk_requests.append(data)
+            self._send_json({
+                "MerchantRequestID": merchant_request_id,
+                "CheckoutRequestID": checkout_request_id,
+                "ResponseCode": "0",
+                "ResponseDescription": "Success. Request accepted for processing",
+                "CustomerMessage": "Success. Request accepted for processing",
+            })
+            if fake.send_callbacks:
+                fake.schedule_callback(data, merchant_request_id, checkout_request_id)
+            return
+
+        if self.path == "/mpesa/stkpushquery/v1/query":
+            checkout_request_id = data.get("CheckoutRequestID")
+            with fake.lock:
+                fake.query_requests.append(checkout_request_id)
+                result = fake.query_results.get(checkout_request_id, fake.default_query_result)
+            if result is None:
+                # What Daraja answers while the customer has not responded yet
+                return self._send_json({
+                    "errorCode": "500.001.1001",
+                    "errorMessage": "The transaction is being processed",
+                }, status=500)
+            result_code, result_desc = result
+            return self._send_json({
+                "ResponseCode": "0",
+                "ResponseDescription": "The service request has been accepted successsfully",
+                "CheckoutRequestID": checkout_request_id,
+                "ResultCode": result_code,
+                "ResultDesc": result_desc,
+            })
+        self._send_json({"errorMessage": "Not found"}, status=404)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that's expected here
+        pass
+
+
+class FakeDarajaServer:
+    """Runs FakeDarajaHandler on a background thread bound to localhost."""
+
+    def __init__(self, host="127.0.0.1", port=0, expires_in=3599):
+        self.expires_in = expires_in
+        self.token = None
+        self.token_requests = 0
+        self.stk_requests = []
+        self.query_requests = []
+        # CheckoutRequestID -> (ResultCode, ResultDesc), or None for "still processing"
+        self.query_results = {}
+        self.default_query_result = ("0", "The service request is processed successfully.")
+        # Callback simulation; see configure_callbacks()
+        self.send_callbacks = False
+        self.callbacks_sent = 0
+        self.callbacks_failed = 0
+        self.callbacks_dropped = 0
+        # Simulated upstream trouble for POSTs: seconds of latency, and an HTTP error status
+        self.delay = 0.0
+        self.fail_status = None
+        self.lock = threading.Lock()
+
+        self.httpd = _QuietHTTPServer((host, port), FakeDarajaHandler)
+        self.httpd.fake = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+
+    def configure_callbacks(self, callback_url=None, delay=0.0, failure_rate=0.0, drop_rate=0.0, seed=None):
+        """
+        Simulate customers answering STK prompts.
+
+        ``delay`` is seconds, or a (min, max) range; ``failure_rate`` is the
+        share of callbacks reporting "cancelled by user"; ``drop_rate`` the
+        share that never arrive at all.
+        """
+        self.send_callbacks = True
+        self.callback_url = callback_url
+        self.callback_delay = delay
+        self.callback_failure_rate = failure_rate
+        self.callback_drop_rate = drop_rate
+        self.random = random.Random(seed)
+        return self
+
+    def schedule_callback(self, push, merchant_request_id, checkout_request_id):
+        with self.lock:
+            roll = self.random.random()
+            delay = self.callback_delay
+            if isinstance(delay, (tuple, list)):
+                delay = self.random.uniform(*delay)
+        if roll < self.callback_drop_rate:
+            with self.lock:
+                self.callbacks_dropped += 1
+            return
+
+        callback = {
+            "MerchantRequestID": merchant_request_id,
+            "CheckoutRequestID": checkout_request_id,
+        }
+        if roll < self.callback_drop_rate + self.callback_failure_rate:
+            callback.update({"ResultCode": 1032, "ResultDesc": "Request cancelled by user"})
+        else:
+            callback.update({
+                "ResultCode": 0,
+                "ResultDesc": "The service request is processed successfully.",
+                "CallbackMetadata": {"Item": [
+                    {"Name": "Amount", "Value": push.get("Amount")},
+                    {"Name": "MpesaReceiptNumber", "Value": "FK" + uuid.uuid4().hex[:8].upper()},
+                    {"Name": "PhoneNumber", "Value": push.get("PhoneNumber")},
+                ]},
+            })
+        url = self.callback_url or push.get("CallBackURL")
+        body = json.dumps({"Body": {"stkCallback": callback}}).encode("utf-8")
+        timer = threading.Timer(delay, self._send_callback, args=(url, body))
+        timer.daemon = True
+        timer.start()
+
+    def _send_callback(self, url, body):
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+            ok = True
+        except OSError:
+            ok = False
+        with self.lock:
+            if ok:
+                self.callbacks_sent += 1
+            else:
+                self.callbacks_failed += 1
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,192 @@
+"""
+M-Pesa callback inbox.
+
+The callback view only stores the raw body; everything that touches
+Payment and UserSubscription happens here, in a worker
+(`python manage.py process_mpesa_callbacks`).
+
+A worker claims an entry by moving it to processing and stamping
+claimed_at. If it dies before recording the outcome, the claim lapses
+after CLAIM_LEASE and the next batch puts the entry back in the queue.
+
+Entries are taken in next_attempt_at order. A retried entry (an orphan
+waiting for its Payment, or one that hit an error) is pushed back by a
+doubling delay, so a flood of callbacks for unknown CheckoutRequestIDs,
+which anyone can post, can't keep real callbacks out of the batches.
+"""
+import json
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .events import publish_payment
+from .models import MpesaCallback, Payment
+from dashboard.models import UserSubscription
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# Processing one entry takes milliseconds; a claim older than this belongs
+# to a worker that died mid-entry.
+CLAIM_LEASE = timedelta(minutes=5)
+
+# A callback can beat the Payment row it refers to (Daraja answers the push,
+# then calls back before lipa_na_mpesa has saved the row). Such entries stay
+# pending for this long before being given up on.
+ORPHAN_GRACE = timedelta(minutes=10)
+
+# Delay before the first retry of an entry, doubled for each later attempt
+RETRY_DELAY = timedelta(seconds=5)
+MAX_RETRY_DELAY = timedelta(minutes=2)
+
+
+class PaymentNotFound(Exception):
+    pass
+
+
+def enqueue(raw_body):
+    """Append a raw callback body to the inbox (a single INSERT)."""
+    return MpesaCallback.objects.create(raw_body=raw_body)
+
+
+def parse_stk_callback(raw_body):
+    """Return the stkCallback dict from a Daraja callback body; ValueError if it isn't one."""
+    data = json.loads(raw_body)
+    for key in ("Body", "stkCallback"):
+        data = data.get(key, {}) if isinstance(data, dict) else None
+    if not isinstance(data, dict):
+        raise ValueError("Callback body is not a Daraja STK callback object")
+    return data
+
+
+def activate_subscription(payment):
+    """Activate the payer's subscription for the plan bought with ``payment``."""
+    plan = payment.plan
+    if plan is None:
+        # Every checkout records its plan; migration 0003 linked the older payments
+        # whose amount matched exactly one plan, and the rest can't be told apart
+        logger.warning("Payment %s has no plan; not activating a subscription", payment.pk)
+        return None
+    try:
+        sub = payment.user.subscription
+    except UserSubscription.DoesNotExist:
+        sub = UserSubscription(user=payment.user)
+    sub.activate(plan)
+    return sub
+
+
+def apply_stk_callback(stk_callback):
+    """
+    Update the Payment (and subscription) for one STK callback.
+
+    Returns False when the payment was already settled by an earlier
+    delivery of the same CheckoutRequestID, so retries from Daraja are no-ops.
+    Raises PaymentNotFound when there is no payment for it (yet).
+    """
+    result_code = stk_callback.get("ResultCode")
+    result_desc = stk_callback.get("ResultDesc")
+    checkout_request_id = stk_callback.get("CheckoutRequestID")
+
+    # Payment, its plan and the user's subscription in one joined query
+    payment = (
+        Payment.objects.select_for_update(of=("self",))
+        .select_related("plan", "user__subscription")
+        .filter(checkout_request_id=checkout_request_id)
+        .first()
+    )
+    if not payment:
+        raise PaymentNotFound(f"No payment for CheckoutRequestID {checkout_request_id!r}")
+    if payment.status != 'pending':
+        return False
+
+    if result_code == 0:  # Success
+        # Extract M-Pesa receipt number
+        items = stk_callback.get("CallbackMetadata", {}).get("Item", [])
+        mpesa_receipt = None
+        for item in items:
+            if item.get("Name") == "MpesaReceiptNumber":
+                mpesa_receipt = item.get("Value")
+
+        payment.status = 'success'
+        payment.transaction_id = mpesa_receipt
+        payment.result_desc = result_desc
+        payment.save(update_fields=["status", "transaction_id", "result_desc"])
+
+        activate_subscription(payment)
+    else:
+        payment.status = 'failed'
+        payment.result_desc = result_desc
+        payment.save(update_fields=["status", "result_desc"])
+    publish_payment(payment)
+    return True
+
+
+def claim(entry_id):
+    """Atomically move an entry from pending to processing; False if another worker got it."""
+    claimed = MpesaCallback.objects.filter(pk=entry_id, status='pending').update(
+        status='processing', claimed_at=timezone.now()
+    )
+    return claimed == 1
+
+
+def release_stale_claims():
+    """Put entries claimed by a worker that died mid-entry back to pending; returns how many."""
+    return MpesaCallback.objects.filter(
+        status='processing', claimed_at__lt=timezone.now() - CLAIM_LEASE
+    ).update(status='pending')
+
+
+def retry_delay(attempts):
+    """How long an entry that has been tried ``attempts`` times waits before the next try."""
+    return min(RETRY_DELAY * 2 ** min(attempts - 1, 16), MAX_RETRY_DELAY)
+
+
+def process_entry(entry):
+    """Process a single claimed inbox entry and record its outcome."""
+    entry.attempts += 1
+    try:
+        stk_callback = parse_stk_callback(entry.raw_body)
+        entry.checkout_request_id = stk_callback.get("CheckoutRequestID") or ""
+        with transaction.atomic():
+            applied = apply_stk_callback(stk_callback)
+        entry.status = 'processed' if applied else 'duplicate'
+        entry.error = ""
+    except PaymentNotFound as ex:
+        entry.error = str(ex)
+        entry.status = 'failed' if timezone.now() - entry.received_at > ORPHAN_GRACE else 'pending'
+    except Exception as ex:
+        logger.exception("Failed to process M-Pesa callback #%s", entry.pk)
+        entry.error = str(ex)
+        # Malformed bodies will never succeed; anything else is retried a few times
+        entry.status = 'failed' if isinstance(ex, ValueError) or entry.attempts >= MAX_ATTEMPTS else 'pending'
+    entry.processed_at = timezone.now()
+    if entry.status == 'pending':
+        entry.next_attempt_at = entry.processed_at + retry_delay(entry.attempts)
+    entry.save(update_fields=["status", "checkout_request_id", "attempts", "error", "processed_at", "next_attempt_at"])
+    return entry.status
+
+
+def process_batch(batch_size=100):
+    """
+    Drain up to ``batch_size`` pending inbox entries that are due, oldest first.
+
+    Returns a dict counting entries per resulting status; 'pending' counts
+    entries put back for a later retry.
+    """
+    counts = {}
+    release_stale_claims()
+    ids = list(
+        MpesaCallback.objects.filter(status='pending', next_attempt_at__lte=timezone.now())
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    for entry_id in ids:
+        if not claim(entry_id):
+            continue
+        entry = MpesaCallback.objects.get(pk=entry_id)
+        status = process_entry(entry)
+        counts[status] = counts.get(status, 0) + 1
+    return counts
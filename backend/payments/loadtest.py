@@ -0,0 +1,239 @@
+"""
+Load-test harness for the pay -> callback -> subscription-activation flow.
+
+Drives concurrent checkouts at a running site whose Daraja client points at
+a FakeDarajaServer (MPESA_API_BASE_URL), lets the fake fire callbacks back at
+/payments/callback/, drains the callback inbox, and reports throughput,
+latency percentiles and database contention. Used by
+``manage.py loadtest_payments`` and by the payments test suite.
+"""
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, close_old_connections
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from dashboard.models import SubscriptionPlan, UserSubscription
+from .inbox import process_batch
+from .models import MpesaCallback, Payment
+
+User = get_user_model()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    return {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+
+
+def logged_in_session(user, base_url):
+    """A requests.Session carrying a session cookie and CSRF token for ``user``."""
+    client = Client()
+    client.force_login(user)
+    csrf_token = get_random_string(32)
+
+    session = requests.Session()
+    session.cookies.set(settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+    session.cookies.set(settings.CSRF_COOKIE_NAME, csrf_token)
+    session.headers.update({"X-CSRFToken": csrf_token, "Referer": base_url})
+    return session
+
+
+class InboxDrainer(threading.Thread):
+    """Runs the callback worker in the background and records lock contention."""
+
+    def __init__(self, batch_size=100, idle_sleep=0.05):
+        super().__init__(daemon=True)
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.stop_event = threading.Event()
+        self.lock_errors = 0
+        self.batches = 0
+        self.processed = Counter()
+        self.max_backlog = 0
+        self.busy_seconds = 0.0
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                self.drain_once()
+                self.stop_event.wait(self.idle_sleep)
+            self.drain_once()
+        finally:
+            close_old_connections()
+
+    def drain_once(self):
+        started = time.perf_counter()
+        try:
+            self.max_backlog = max(self.max_backlog, MpesaCallback.objects.filter(status='pending').count())
+            counts = process_batch(self.batch_size)
+        except OperationalError:
+            # "database is locked" and friends: the contention we want to see
+            self.lock_errors += 1
+            return
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+        if counts:
+            self.batches += 1
+            self.processed.update(counts)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def create_load_users(count, prefix=None):
+    prefix = prefix or f"loadtest-{uuid.uuid4().hex[:6]}"
+    users = [User(username=f"{prefix}-{i}") for i in range(count)]
+    for user in users:
+        user.set_unusable_password()
+    User.objects.bulk_create(users)
+    return list(User.objects.filter(username__startswith=f"{prefix}-").order_by("id"))
+
+
+def wait_for_settlement(started_at, timeout, poll=0.1):
+    """
+    Poll until every checkout in ``started_at`` (checkout id -> perf_counter
+    time of its response) is no longer pending; return settle latencies.
+    Latencies are only as fine-grained as ``poll``.
+    """
+    remaining = set(started_at)
+    settled = {}
+    deadline = time.perf_counter() + timeout
+    while remaining and time.perf_counter() < deadline:
+        done = Payment.objects.filter(checkout_request_id__in=remaining).exclude(status='pending').values_list(
+            "checkout_request_id", flat=True,
+        )
+        now = time.perf_counter()
+        for checkout_request_id in done:
+            settled[checkout_request_id] = now - started_at[checkout_request_id]
+            remaining.discard(checkout_request_id)
+        if remaining:
+            time.sleep(poll)
+    return settled
+
+
+def run_load_test(base_url, checkouts=100, concurrency=10, plan=None, fake=None, drain=True, settle_timeout=60,
+                  user_prefix=None):
+    """
+    Run ``checkouts`` checkouts against ``base_url`` with ``concurrency`` in flight.
+
+    The users it creates are named ``<user_prefix>-<n>``, so a caller that
+    passes the prefix can remove them even if the run fails part way.
+    Returns a report dict; see ``format_report``.
+    """
+    base_url = base_url.rstrip("/")
+    pay_url = base_url + reverse("pay")
+    plan = plan or SubscriptionPlan.objects.filter(is_active=True).first()
+    users = create_load_users(checkouts, user_prefix)
+    sessions = [logged_in_session(user, base_url) for user in users]
+    # Distinct phones, so per-phone rate limits measure the flow rather than throttle it
+    phones = [f"2547{i:08d}" for i in range(checkouts)]
+
+    drainer = InboxDrainer() if drain else None
+    if drainer:
+        drainer.start()
+
+    started_at = {}
+    statuses = Counter()
+    latencies = []
+
+    def checkout(i):
+        t0 = time.perf_counter()
+        try:
+            r = sessions[i].post(pay_url, data={"phone": phones[i], "plan_id": plan.pk}, timeout=30)
+            status = r.status_code
+            checkout_request_id = r.json().get("CheckoutRequestID") if status == 200 else None
+        except (requests.RequestException, ValueError):
+            status, checkout_request_id = "error", None
+        t1 = time.perf_counter()
+        return status, t1 - t0, checkout_request_id, t1
+
+    t_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for status, latency, checkout_request_id, answered_at in pool.map(checkout, range(checkouts)):
+                statuses[status] += 1
+                latencies.append(latency)
+                if checkout_request_id:
+                    started_at[checkout_request_id] = answered_at
+        checkout_seconds = time.perf_counter() - t_start
+
+        settled = wait_for_settlement(started_at, settle_timeout)
+        total_seconds = time.perf_counter() - t_start
+    finally:
+        if drainer:
+            drainer.stop()
+
+    outcomes = Counter(Payment.objects.filter(checkout_request_id__in=started_at).values_list("status", flat=True))
+    report = {
+        "checkouts": checkouts,
+        "concurrency": concurrency,
+        "http_statuses": dict(statuses),
+        "checkout_seconds": checkout_seconds,
+        "checkout_throughput": checkouts / checkout_seconds if checkout_seconds else 0,
+        "checkout_latency": summarize(latencies),
+        "settle_latency": summarize(list(settled.values())),
+        "settled_throughput": len(settled) / total_seconds if total_seconds else 0,
+        "outcomes": dict(outcomes),
+        "unsettled": len(started_at) - len(settled),
+        "active_subscriptions": UserSubscription.objects.filter(user__in=users, status="active").count(),
+        "users": [user.pk for user in users],
+    }
+    if drainer:
+        report["db"] = {
+            "lock_errors": drainer.lock_errors,
+            # Entries put back to pending after an error (usually a lock timeout)
+            "retried_entries": drainer.processed.get('pending', 0),
+            "max_inbox_backlog": drainer.max_backlog,
+            "drain_batches": drainer.batches,
+            "drain_busy_seconds": drainer.busy_seconds,
+        }
+    if fake is not None:
+        report["callbacks"] = {
+            "sent": fake.callbacks_sent, "failed": fake.callbacks_failed, "dropped": fake.callbacks_dropped,
+        }
+    return report
+
+
+def format_report(report):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    def latency(key):
+        return " ".join(f"{p}={ms(v)}" for p, v in report[key].items())
+
+    lines = [
+        f"Checkouts:      {report['checkouts']} at concurrency {report['concurrency']}",
+        f"HTTP statuses:  {report['http_statuses']}",
+        f"Checkout:       {report['checkout_throughput']:.1f}/s  {latency('checkout_latency')}",
+        f"Settlement:     {report['settled_throughput']:.1f}/s  {latency('settle_latency')}",
+        f"Outcomes:       {report['outcomes']}  unsettled={report['unsettled']}  "
+        f"active subscriptions={report['active_subscriptions']}",
+    ]
+    if "db" in report:
+        db = report["db"]
+        lines.append(
+            f"DB contention:  lock errors={db['lock_errors']}  retried entries={db['retried_entries']}  "
+            f"max inbox backlog={db['max_inbox_backlog']}  "
+            f"drain batches={db['drain_batches']}  drain busy={db['drain_busy_seconds']:.2f}s"
+        )
+    if "callbacks" in report:
+        lines.append(f"Callbacks:      {report['callbacks']}")
+    return "\n".join(lines)
@@ -0,0 +1,77 @@
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.models import SubscriptionPlan
+from payments.fake_daraja import FakeDarajaServer
+from payments.loadtest import format_report, run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the pay -> callback -> activation flow against a running server. "
+        "Start the server with MPESA_API_BASE_URL pointing at the fake Daraja this command runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL of the running site.")
+        parser.add_argument("--fake-port", type=int, default=8765, help="Port for the fake Daraja server.")
+        parser.add_argument("--checkouts", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--callback-delay", default="0.5,2", help="Seconds before each callback, or a min,max range.")
+        parser.add_argument("--failure-rate", type=float, default=0.1, help="Share of callbacks reporting a cancelled payment.")
+        parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of callbacks never sent.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--settle-timeout", type=float, default=60)
+        parser.add_argument("--no-drain", action="store_true", help="Don't drain the inbox here (a worker is already running).")
+        parser.add_argument("--keep-data", action="store_true", help="Keep the load-test users, payments and plan.")
+
+    def handle(self, *args, **options):
+        try:
+            delay = tuple(float(part) for part in options["callback_delay"].split(","))
+        except ValueError:
+            raise CommandError("--callback-delay must be a number or min,max")
+        delay = delay[0] if len(delay) == 1 else delay
+
+        target = options["target"].rstrip("/")
+        # Everything this run creates carries the prefix, so cleanup never
+        # touches real users or plans, and a failed run leaves nothing behind.
+        # The plan has to be active for checkout to accept it, so it is
+        # internal-looking and lives only as long as the run.
+        prefix = f"loadtest-{uuid.uuid4().hex[:8]}"
+        fake = FakeDarajaServer(port=options["fake_port"]).configure_callbacks(
+            callback_url=target + "/payments/callback/",
+            delay=delay,
+            failure_rate=options["failure_rate"],
+            drop_rate=options["drop_rate"],
+            seed=options["seed"],
+        )
+        plan = None
+        try:
+            plan = SubscriptionPlan.objects.create(
+                slug=prefix, name=f"[internal] {prefix}", price_kes=1, sort_order=9999,
+                description="Created by manage.py loadtest_payments; deleted when the run ends.",
+            )
+            self.stdout.write(f"Fake Daraja listening on {fake.base_url} (server needs MPESA_API_BASE_URL={fake.base_url})")
+            with fake:
+                report = run_load_test(
+                    target,
+                    checkouts=options["checkouts"],
+                    concurrency=options["concurrency"],
+                    plan=plan,
+                    fake=fake,
+                    drain=not options["no_drain"],
+                    settle_timeout=options["settle_timeout"],
+                    user_prefix=prefix,
+                )
+        finally:
+            if options["keep_data"]:
+                self.stdout.write(f"Kept load-test users and plan prefixed {prefix!r}.")
+            else:
+                # Payments and subscriptions go with their users
+                get_user_model().objects.filter(username__startswith=f"{prefix}-").delete()
+                if plan is not None:
+                    plan.delete()
+
+        self.stdout.write(format_report(report))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.inbox import process_batch
+
+
+class Command(BaseCommand):
+    help = "Drain the M-Pesa callback inbox, updating payments and activating subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Entries processed per batch.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the inbox is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain the inbox once and exit instead of polling.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        while True:
+            counts = process_batch(batch_size)
+            if counts:
+                summary = ", ".join(f"{status}={n}" for status, n in sorted(counts.items()))
+                self.stdout.write(f"Processed callbacks: {summary}")
+            if sum(counts.values()) - counts.get("pending", 0) >= batch_size:
+                continue  # more work is probably waiting
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payments.checkout import purge_expired_keys
+from payments.events import purge_events
+from payments.reconcile import reconcile
+
+
+class Command(BaseCommand):
+    help = "Re-check pending M-Pesa payments whose callback never arrived, using the STK Push Query API."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=10, help="Only payments pending for at least this many minutes.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Payments queried and settled per transaction.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Maximum STK queries in flight.")
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            rate = stats["scanned"] / stats["elapsed"] if stats["elapsed"] else 0
+            self.stdout.write(
+                f"chunk {stats['chunks']}: scanned={stats['scanned']} success={stats['success']} "
+                f"failed={stats['failed']} pending={stats['pending']} error={stats['error']} ({rate:.0f}/s)"
+            )
+
+        stats = reconcile(
+            older_than=timedelta(minutes=options["older_than"]),
+            chunk_size=options["chunk_size"],
+            concurrency=options["concurrency"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {stats['scanned']} payments in {stats['elapsed']:.1f}s: "
+            f"{stats['success']} succeeded, {stats['failed']} failed, {stats['pending']} still pending, {stats['error']} errors."
+        ))
+
+        purged = purge_expired_keys()
+        if purged:
+            self.stdout.write(f"Purged {purged} expired checkout idempotency keys.")
+
+        purged = purge_events()
+        if purged:
+            self.stdout.write(f"Purged {purged} old payment events.")
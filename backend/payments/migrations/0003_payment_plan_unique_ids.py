@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_plan_and_blank_ids(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    SubscriptionPlan = apps.get_model('dashboard', 'SubscriptionPlan')
+
+    # Empty strings would collide under the new unique constraints; NULLs don't
+    Payment.objects.filter(checkout_request_id='').update(checkout_request_id=None)
+    Payment.objects.filter(transaction_id='').update(transaction_id=None)
+
+    # Only link historic payments whose amount matches exactly one plan
+    plans_by_price = {}
+    for plan in SubscriptionPlan.objects.all():
+        plans_by_price.setdefault(plan.price_kes, []).append(plan.pk)
+    for price, plan_ids in plans_by_price.items():
+        if len(plan_ids) == 1:
+            Payment.objects.filter(plan__isnull=True, amount=price).update(plan_id=plan_ids[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_contactmessage_supportmessage_delete_payment'),
+        ('payments', '0002_mpesacallback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='dashboard.subscriptionplan'),
+        ),
+        migrations.RunPython(backfill_plan_and_blank_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='checkout_request_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_mpesacallback_claimed_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='mpesacallback',
+            name='payments_mp_status_1b5657_idx',
+        ),
+        migrations.AddField(
+            model_name='mpesacallback',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='mpesacallback',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='payments_mp_status_8a2570_idx'),
+        ),
+    ]
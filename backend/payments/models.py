@@ -1,11 +1,14 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
+from dashboard.models import SubscriptionPlan
 
 class Payment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    plan = models.ForeignKey(SubscriptionPlan, on_delete=models.SET_NULL, null=True, blank=True, related_name="payments")
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     phone_number = models.CharField(max_length=15)
-    transaction_id = models.CharField(max_length=100, blank=True, null=True)
+    transaction_id = models.CharField(max_length=100, blank=True, null=True, unique=True)
     status = models.CharField(
         max_length=20,
         choices=[
@@ -18,8 +21,67 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     # New fields for better tracking
-    checkout_request_id = models.CharField(max_length=100, blank=True, null=True)  
+    checkout_request_id = models.CharField(max_length=100, blank=True, null=True, unique=True)
     result_desc = models.TextField(blank=True, null=True)  
 
+    class Meta:
+        indexes = [
+            # Reconciliation scans for stale pending payments
+            models.Index(fields=['status', 'created_at']),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.amount} ({self.status})"
+
+
+class MpesaCallback(models.Model):
+    """Raw STK callback body as received from Daraja, processed later by a worker."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('duplicate', 'Duplicate'),
+        ('failed', 'Failed'),
+    ]
+
+    raw_body = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    checkout_request_id = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['checkout_request_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.checkout_request_id or 'callback'} #{self.pk} ({self.status})"
+
+
+class PaymentEvent(models.Model):
+    """A payment status change, read by the SSE relay in the web process (see payments.events)."""
+    checkout_request_id = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.checkout_request_id} {self.payload.get('status')}"
+
+
+class CheckoutIdempotencyKey(models.Model):
+    """One in-flight STK push per (user, plan, phone) within the dedupe window."""
+    key = models.CharField(max_length=64, unique=True)
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} (expires {self.expires_at:%Y-%m-%d %H:%M:%S})"
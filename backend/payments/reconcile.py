@@ -0,0 +1,144 @@
+"""
+Reconciliation of stale pending payments.
+
+Payments whose STK callback never arrived are re-checked with the STK Push
+Query API and settled in bulk (`python manage.py reconcile_payments`).
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_daraja.mpesa.exceptions import MpesaConnectionError
+
+from .daraja import get_client
+from .events import publish_payments
+from .inbox import activate_subscription
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+# STK ResultCodes that end a checkout for good: insufficient funds, subscriber
+# busy, request expired, push not delivered, cancelled by the user, phone
+# unreachable, wrong PIN, and push error. Anything else, such as 4999 ("still
+# under processing") or a code Daraja adds later, leaves the payment pending
+# for the next run.
+FAILED_RESULT_CODES = {"1", "1001", "1019", "1025", "1032", "1037", "2001", "9999"}
+
+
+def stale_pending_chunks(older_than, chunk_size=500):
+    """
+    Yield lists of (id, checkout_request_id) for pending payments older than ``older_than``.
+
+    Walks the pending payments in (created_at, id) order, seeking past the
+    last row of each chunk, so every chunk is a range scan on the
+    (status, created_at) index and memory stays bounded by ``chunk_size``.
+    """
+    cutoff = timezone.now() - older_than
+    qs = Payment.objects.filter(
+        status='pending', created_at__lt=cutoff, checkout_request_id__isnull=False,
+    ).order_by('created_at', 'id').values_list('id', 'checkout_request_id', 'created_at')
+
+    chunk = list(qs[:chunk_size])
+    while chunk:
+        yield [(pk, checkout_request_id) for pk, checkout_request_id, _ in chunk]
+        last_id, _, last_created = chunk[-1]
+        chunk = list(
+            qs.filter(created_at__gte=last_created)
+            .filter(Q(created_at__gt=last_created) | Q(id__gt=last_id))[:chunk_size]
+        )
+
+
+def interpret_query(response):
+    """
+    Map an STK Push Query response to ('success'|'failed'|None, description).
+
+    None means Daraja has no final answer yet and the payment stays pending:
+    an error response (errorCode 500.001.1001, "The transaction is being
+    processed") or a ResultCode that isn't known to be final.
+    """
+    if "ResultCode" not in response:
+        return None, response.get("errorMessage", "")
+    result_code = str(response["ResultCode"])
+    result_desc = response.get("ResultDesc", "")
+    if result_code == "0":
+        return 'success', result_desc
+    if result_code in FAILED_RESULT_CODES:
+        return 'failed', result_desc
+    logger.info("STK query for %s not final: %s %s", response.get("CheckoutRequestID"), result_code, result_desc)
+    return None, result_desc
+
+
+def query_statuses(checkout_request_ids, client, concurrency):
+    """Query Daraja for each checkout with at most ``concurrency`` requests in flight."""
+    def query(checkout_request_id):
+        try:
+            return checkout_request_id, interpret_query(client.stk_push_query(checkout_request_id))
+        except MpesaConnectionError as ex:
+            logger.warning("STK query failed for %s: %s", checkout_request_id, ex)
+            return checkout_request_id, ('error', str(ex))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return dict(pool.map(query, checkout_request_ids))
+
+
+def settle_chunk(results):
+    """
+    Apply query results for one chunk in a single transaction.
+
+    Only payments that are still pending are touched, so a callback that
+    lands while we were querying always wins.
+    """
+    counts = {'success': 0, 'failed': 0}
+    final = {cid: outcome for cid, outcome in results.items() if outcome[0] in counts}
+    if not final:
+        return counts
+
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update(of=("self",))
+            .select_related("plan", "user__subscription")
+            .filter(checkout_request_id__in=final, status='pending')
+        )
+        for payment in payments:
+            payment.status, payment.result_desc = final[payment.checkout_request_id]
+            counts[payment.status] += 1
+        Payment.objects.bulk_update(payments, ["status", "result_desc"])
+
+        for payment in payments:
+            if payment.status == 'success':
+                activate_subscription(payment)
+        publish_payments(payments)
+    return counts
+
+
+def reconcile(older_than=timedelta(minutes=10), chunk_size=500, concurrency=8, client=None, progress=None):
+    """
+    Re-check stale pending payments and settle those with a final status.
+
+    ``progress`` is called with the running stats dict after each chunk.
+    Returns the final stats.
+    """
+    client = client or get_client()
+    stats = {'scanned': 0, 'success': 0, 'failed': 0, 'pending': 0, 'error': 0, 'chunks': 0}
+    started = time.monotonic()
+
+    for chunk in stale_pending_chunks(older_than, chunk_size):
+        results = query_statuses([cid for _, cid in chunk], client, concurrency)
+        settled = settle_chunk(results)
+
+        stats['chunks'] += 1
+        stats['scanned'] += len(chunk)
+        stats['success'] += settled['success']
+        stats['failed'] += settled['failed']
+        stats['error'] += sum(1 for status, _ in results.values() if status == 'error')
+        stats['pending'] += sum(1 for status, _ in results.values() if status is None)
+        stats['elapsed'] = time.monotonic() - started
+        if progress:
+            progress(stats)
+
+    stats['elapsed'] = time.monotonic() - started
+    return stats
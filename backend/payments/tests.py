@@ -1,3 +1,415 @@
-from django.test import TestCase
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_daraja.mpesa.exceptions import MpesaConnectionError
+
+from dashboard.models import SubscriptionPlan, UserSubscription
+from .breaker import CircuitBreaker, CircuitOpenError
+from .checkout import start_checkout
+from .daraja import DarajaClient, reset_client
+from .fake_daraja import FakeDarajaServer
+from .inbox import CLAIM_LEASE, apply_stk_callback, claim, process_batch
+from .events import publish, publish_payment
+from .loadtest import percentile, run_load_test
+from .models import CheckoutIdempotencyKey, MpesaCallback, Payment
+from .reconcile import interpret_query, reconcile, stale_pending_chunks
+
+
+class DarajaClientTests(SimpleTestCase):
+    def setUp(self):
+        self.fake = FakeDarajaServer().start()
+        self.addCleanup(self.fake.stop)
+        self.client_ = DarajaClient(base_url=self.fake.base_url, consumer_key="key", consumer_secret="secret")
+
+    def test_token_is_cached_across_pushes(self):
+        for _ in range(3):
+            data = self.client_.stk_push("0712345678", 10, "twain", "subscription", "http://testserver/cb/")
+            self.assertEqual(data["ResponseCode"], "0")
+        self.assertEqual(self.fake.token_requests, 1)
+        self.assertEqual(len(self.fake.stk_requests), 3)
+        self.assertEqual(self.fake.stk_requests[0]["PhoneNumber"], "254712345678")
+
+    def test_concurrent_callers_refresh_token_once(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            tokens = set(pool.map(lambda _: self.client_.access_token(), range(32)))
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(self.fake.token_requests, 1)
+
+    def test_expired_token_is_refreshed(self):
+        self.client_.access_token()
+        self.client_._token_expires_at = 0.0
+        self.client_.access_token()
+        self.assertEqual(self.fake.token_requests, 2)
+
+    def test_rejected_token_is_refreshed_and_retried(self):
+        self.client_.access_token()
+        self.fake.token = "revoked"
+        data = self.client_.stk_push("254712345678", 10, "twain", "subscription", "http://testserver/cb/")
+        self.assertEqual(data["ResponseCode"], "0")
+        self.assertEqual(self.fake.token_requests, 2)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.fake = FakeDarajaServer().start()
+        self.addCleanup(self.fake.stop)
+        self.breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60, failure_exceptions=(MpesaConnectionError,))
+        self.client_ = DarajaClient(
+            base_url=self.fake.base_url, consumer_key="key", consumer_secret="secret",
+            timeout=(0.5, 0.2), budget=1, breaker=self.breaker,
+        )
+
+    def push(self):
+        return self.client_.stk_push("254712345678", 10, "twain", "subscription", "http://testserver/cb/")
+
+    def test_slow_upstream_times_out_then_fails_fast(self):
+        self.client_.access_token()
+        self.fake.delay = 0.5
+        for _ in range(2):
+            with self.assertRaises(MpesaConnectionError):
+                self.push()
+        self.assertEqual(self.breaker.state, "open")
+        requests_before = len(self.fake.stk_requests)
+        with self.assertRaises(CircuitOpenError):
+            self.push()
+        self.assertEqual(len(self.fake.stk_requests), requests_before)
+        self.assertEqual(self.breaker.snapshot()["rejected"], 1)
+
+    def test_half_open_probe_closes_circuit(self):
+        self.fake.fail_status = 503
+        for _ in range(2):
+            with self.assertRaises(MpesaConnectionError):
+                self.push()
+        self.fake.fail_status = None
+        self.breaker.opened_at -= 60
+        self.assertEqual(self.push()["ResponseCode"], "0")
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertEqual(self.breaker.transitions, {"closed->open": 1, "open->half_open": 1, "half_open->closed": 1})
+
+    def test_failed_probe_reopens_circuit(self):
+        self.fake.fail_status = 503
+        for _ in range(2):
+            with self.assertRaises(MpesaConnectionError):
+                self.push()
+        self.breaker.opened_at -= 60
+        with self.assertRaises(MpesaConnectionError):
+            self.push()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.transitions["half_open->open"], 1)
+
+
+def stk_callback_body(checkout_request_id, result_code=0, receipt="QK12345XYZ"):
+    callback = {
+        "MerchantRequestID": "29115-34620561-1",
+        "CheckoutRequestID": checkout_request_id,
+        "ResultCode": result_code,
+        "ResultDesc": "The service request is processed successfully." if result_code == 0 else "Request cancelled by user",
+    }
+    if result_code == 0:
+        callback["CallbackMetadata"] = {"Item": [
+            {"Name": "Amount", "Value": 1500},
+            {"Name": "MpesaReceiptNumber", "Value": receipt},
+        ]}
+    return json.dumps({"Body": {"stkCallback": callback}})
+
+
+class CallbackInboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.plan = SubscriptionPlan.objects.create(name="Starter", slug="starter", price_kes=1500)
+        self.payment = Payment.objects.create(
+            user=self.user, plan=self.plan, amount=1500, phone_number="254712345678", checkout_request_id="ws_CO_1"
+        )
+
+    def post_callback(self, body):
+        return self.client.post(reverse("callback"), body, content_type="application/json")
+
+    def test_callback_only_enqueues(self):
+        response = self.post_callback(stk_callback_body("ws_CO_1"))
+        self.assertEqual(response.json()["ResultCode"], 0)
+        self.assertEqual(MpesaCallback.objects.get().status, "pending")
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "pending")
+
+    def test_worker_settles_payment_and_activates_subscription(self):
+        self.post_callback(stk_callback_body("ws_CO_1"))
+        self.assertEqual(process_batch(), {"processed": 1})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "success")
+        self.assertEqual(self.payment.transaction_id, "QK12345XYZ")
+        self.assertEqual(self.user.subscription.status, "active")
+        self.assertEqual(self.user.subscription.plan, self.plan)
+
+    def test_plan_comes_from_payment_not_price(self):
+        promo = SubscriptionPlan.objects.create(name="Promo", slug="promo", price_kes=1500, plan_type="one_time")
+        self.payment.plan = promo
+        self.payment.save()
+        self.post_callback(stk_callback_body("ws_CO_1"))
+        process_batch()
+        self.assertEqual(self.user.subscription.plan, promo)
+
+    def test_payment_without_plan_activates_nothing(self):
+        SubscriptionPlan.objects.create(name="Promo", slug="promo", price_kes=1500)
+        Payment.objects.filter(pk=self.payment.pk).update(plan=None)
+        self.post_callback(stk_callback_body("ws_CO_1"))
+        with self.assertLogs("payments.inbox", "WARNING"):
+            self.assertEqual(process_batch(), {"processed": 1})
+        self.assertFalse(UserSubscription.objects.filter(user=self.user).exists())
+
+    def test_payment_plan_and_subscription_load_in_one_query(self):
+        UserSubscription.objects.create(user=self.user, plan=self.plan, status="canceled")
+        stk_callback = json.loads(stk_callback_body("ws_CO_1"))["Body"]["stkCallback"]
+        with self.assertNumQueries(4):  # joined payment/plan/subscription read, payment update, subscription update, event insert
+            self.assertTrue(apply_stk_callback(stk_callback))
+        self.user.subscription.refresh_from_db()
+        self.assertEqual(self.user.subscription.status, "active")
+
+    def test_redelivered_callback_is_a_duplicate(self):
+        self.post_callback(stk_callback_body("ws_CO_1"))
+        self.post_callback(stk_callback_body("ws_CO_1", result_code=1032))
+        self.assertEqual(process_batch(), {"processed": 1, "duplicate": 1})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "success")
+
+    def test_callback_arriving_before_payment_is_retried(self):
+        self.post_callback(stk_callback_body("ws_CO_2"))
+        self.assertEqual(process_batch(), {"pending": 1})
+        Payment.objects.create(user=self.user, plan=self.plan, amount=1500, phone_number="254712345678", checkout_request_id="ws_CO_2")
+        self.assertEqual(process_batch(), {})  # backing off
+        MpesaCallback.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_batch(), {"processed": 1})
+
+    def test_orphan_flood_does_not_starve_real_callbacks(self):
+        for n in range(5):
+            self.post_callback(stk_callback_body(f"ws_CO_bogus{n}"))
+        self.assertEqual(process_batch(batch_size=5), {"pending": 5})
+        self.post_callback(stk_callback_body("ws_CO_1"))
+        self.assertEqual(process_batch(batch_size=5), {"processed": 1})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "success")
+
+    def test_malformed_body_is_marked_failed(self):
+        self.post_callback("not json")
+        self.assertEqual(process_batch(), {"failed": 1})
+
+    def test_json_that_is_not_an_object_fails_at_once(self):
+        for body in ('["Body"]', '"Body"', '{"Body": []}'):
+            self.post_callback(body)
+        self.assertEqual(process_batch(), {"failed": 3})
+        self.assertEqual(set(MpesaCallback.objects.values_list("attempts", flat=True)), {1})
+
+    def test_entry_left_processing_by_a_dead_worker_is_retried(self):
+        self.post_callback(stk_callback_body("ws_CO_1"))
+        entry = MpesaCallback.objects.get()
+        self.assertTrue(claim(entry.pk))
+        self.assertEqual(process_batch(), {})
+        MpesaCallback.objects.filter(pk=entry.pk).update(claimed_at=timezone.now() - CLAIM_LEASE - timedelta(seconds=1))
+        self.assertEqual(process_batch(), {"processed": 1})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "success")
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.fake = FakeDarajaServer().start()
+        self.addCleanup(self.fake.stop)
+        self.daraja = DarajaClient(base_url=self.fake.base_url, consumer_key="key", consumer_secret="secret")
+        self.user = User.objects.create_user("bob", password="pw")
+        self.plan = SubscriptionPlan.objects.create(name="Starter", slug="starter", price_kes=1500)
+
+    def make_payment(self, checkout_request_id, age=timedelta(hours=1)):
+        payment = Payment.objects.create(
+            user=self.user, plan=self.plan, amount=1500, phone_number="254712345678",
+            checkout_request_id=checkout_request_id,
+        )
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - age)
+        return payment
+
+    def test_settles_stale_payments_in_chunks(self):
+        paid = self.make_payment("ws_CO_paid")
+        cancelled = self.make_payment("ws_CO_cancelled")
+        waiting = self.make_payment("ws_CO_waiting")
+        fresh = self.make_payment("ws_CO_fresh", age=timedelta(seconds=5))
+        self.fake.query_results["ws_CO_cancelled"] = ("1032", "Request cancelled by user")
+        self.fake.query_results["ws_CO_waiting"] = None
+
+        progress = []
+        stats = reconcile(chunk_size=2, concurrency=2, client=self.daraja, progress=progress.append)
+
+        self.assertEqual(stats["chunks"], 2)
+        self.assertEqual(len(progress), 2)
+        self.assertEqual((stats["scanned"], stats["success"], stats["failed"], stats["pending"]), (3, 1, 1, 1))
+        self.assertNotIn("ws_CO_fresh", self.fake.query_requests)
+        statuses = dict(Payment.objects.values_list("checkout_request_id", "status"))
+        self.assertEqual(statuses, {
+            "ws_CO_paid": "success", "ws_CO_cancelled": "failed", "ws_CO_waiting": "pending", "ws_CO_fresh": "pending",
+        })
+        self.assertEqual(self.user.subscription.plan, self.plan)
+
+    def test_only_final_result_codes_settle(self):
+        self.assertEqual(interpret_query({"ResultCode": "0", "ResultDesc": "ok"}), ("success", "ok"))
+        for code in ("1", "1032", "1037", "2001"):
+            self.assertEqual(interpret_query({"ResultCode": code, "ResultDesc": "no"})[0], "failed")
+        self.assertEqual(
+            interpret_query({"errorCode": "500.001.1001", "errorMessage": "The transaction is being processed"}),
+            (None, "The transaction is being processed"),
+        )
+        self.assertEqual(interpret_query({"ResultCode": "4999", "ResultDesc": "Still processing"}), (None, "Still processing"))
+
+        processing = self.make_payment("ws_CO_processing")
+        self.fake.query_results["ws_CO_processing"] = ("4999", "The transaction is still under processing")
+        stats = reconcile(client=self.daraja)
+        self.assertEqual((stats["pending"], stats["failed"]), (1, 0))
+        processing.refresh_from_db()
+        self.assertEqual(processing.status, "pending")
+
+    def test_chunks_follow_creation_order(self):
+        # Ids and creation times disagree, and two payments share a timestamp
+        late, early, tie = (self.make_payment(f"ws_CO_{n}") for n in ("late", "early", "tie"))
+        created = timezone.now() - timedelta(hours=2)
+        Payment.objects.filter(pk__in=[early.pk, tie.pk]).update(created_at=created)
+        chunks = list(stale_pending_chunks(timedelta(minutes=10), chunk_size=1))
+        self.assertEqual(chunks, [[(early.pk, "ws_CO_early")], [(tie.pk, "ws_CO_tie")], [(late.pk, "ws_CO_late")]])
+
+    def test_callback_settled_payment_is_not_overwritten(self):
+        payment = self.make_payment("ws_CO_1")
+        Payment.objects.filter(pk=payment.pk).update(status="failed")
+        stats = reconcile(client=self.daraja)
+        self.assertEqual(stats["scanned"], 0)
+
+
+class CheckoutIdempotencyTests(TestCase):
+    def setUp(self):
+        self.fake = FakeDarajaServer().start()
+        self.addCleanup(self.fake.stop)
+        settings_override = override_settings(
+            MPESA_API_BASE_URL=self.fake.base_url, MPESA_CONSUMER_KEY="key", MPESA_CONSUMER_SECRET="secret",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+        self.user = User.objects.create_user("carol", password="pw")
+        self.plan = SubscriptionPlan.objects.create(name="Starter", slug="starter", price_kes=1500)
+
+    def test_double_tap_sends_one_push(self):
+        first = start_checkout(self.user, "254712345678", 1500, plan=self.plan)
+        second = start_checkout(self.user, "254712345678", 1500, plan=self.plan)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.fake.stk_requests), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_different_phone_is_a_new_checkout(self):
+        start_checkout(self.user, "254712345678", 1500, plan=self.plan)
+        start_checkout(self.user, "254787654321", 1500, plan=self.plan)
+        self.assertEqual(len(self.fake.stk_requests), 2)
+
+    def test_expired_window_allows_a_new_push(self):
+        start_checkout(self.user, "254712345678", 1500, plan=self.plan)
+        CheckoutIdempotencyKey.objects.update(expires_at=timezone.now())
+        start_checkout(self.user, "254712345678", 1500, plan=self.plan)
+        self.assertEqual(len(self.fake.stk_requests), 2)
+
+    def test_initiate_payment_view_dedupes(self):
+        self.client.force_login(self.user)
+        url = reverse("initiate_payment", args=[self.plan.pk])
+        for _ in range(2):
+            response = self.client.post(url, {"phone_number": "254712345678"})
+            self.assertContains(response, "alert-success")
+        self.assertEqual(Payment.objects.get().plan, self.plan)
+
+    def test_pay_view_validates_before_pushing(self):
+        url = reverse("pay")
+        self.assertEqual(self.client.post(url, {"phone": "254712345678", "plan_id": self.plan.pk}).status_code, 302)
+        self.client.force_login(self.user)
+        for data in ({"phone": "254712345678", "amount": "1500"}, {"phone": "254712345678", "plan_id": "x"}, {"plan_id": self.plan.pk}):
+            self.assertEqual(self.client.post(url, data).status_code, 400)
+        self.assertEqual(self.fake.stk_requests, [])
+        response = self.client.post(url, {"phone": "254712345678", "plan_id": self.plan.pk, "amount": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Payment.objects.get().amount, 1500)
+
+
+class PaymentEventsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("erin", password="pw")
+        Payment.objects.create(user=self.user, amount=1500, phone_number="254712345678", checkout_request_id="ws_CO_9")
+        self.url = reverse("payment_events", args=["ws_CO_9"])
+
+    async def test_stream_pushes_status_change(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b'"status": "pending"', await anext(chunks))
+
+        publish("ws_CO_9", {"checkout_request_id": "ws_CO_9", "status": "success", "result_desc": "ok"})
+        self.assertIn(b'"status": "success"', await anext(chunks))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(chunks)
+
+    async def test_stream_receives_status_published_by_another_process(self):
+        # The worker publishes by writing a PaymentEvent; nothing reaches this
+        # process's subscribers except through the relay reading that table
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b'"status": "pending"', await anext(chunks))
+
+        def settle():
+            payment = Payment.objects.get(checkout_request_id="ws_CO_9")
+            payment.status, payment.result_desc = "success", "ok"
+            payment.save(update_fields=["status", "result_desc"])
+            with patch("payments.events.publish") as local_publish:
+                publish_payment(payment)
+            local_publish.assert_not_called()
+
+        await sync_to_async(settle)()
+        self.assertIn(b'"status": "success"', await asyncio.wait_for(anext(chunks), 5))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(chunks)
+
+    async def test_other_users_cannot_watch_payment(self):
+        other = await User.objects.acreate_user("frank", password="pw")
+        await self.async_client.aforce_login(other)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+class PaymentFlowLoadTests(LiveServerTestCase):
+    """A small end-to-end load run; `manage.py loadtest_payments` runs bigger ones."""
+
+    def setUp(self):
+        self.fake = FakeDarajaServer().configure_callbacks(
+            callback_url=self.live_server_url + "/payments/callback/", delay=(0.01, 0.05), failure_rate=0.25, seed=7,
+        ).start()
+        self.addCleanup(self.fake.stop)
+        settings_override = override_settings(
+            MPESA_API_BASE_URL=self.fake.base_url, MPESA_CONSUMER_KEY="key", MPESA_CONSUMER_SECRET="secret",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+        self.plan = SubscriptionPlan.objects.create(name="Starter", slug="starter", price_kes=1500)
+
+    def test_concurrent_checkouts_settle_and_activate(self):
+        report = run_load_test(self.live_server_url, checkouts=12, concurrency=4, plan=self.plan, fake=self.fake, settle_timeout=20)
+        self.assertEqual(report["http_statuses"], {200: 12})
+        self.assertEqual(report["unsettled"], 0, report)
+        self.assertEqual(sum(report["outcomes"].values()), 12)
+        self.assertEqual(report["active_subscriptions"], report["outcomes"].get("success", 0))
+        self.assertIsNotNone(report["settle_latency"]["p99"])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 95), percentile(values, 99)), (50, 95, 99))
+        self.assertIsNone(percentile([], 50))
@@ -4,4 +4,6 @@ urlpatterns=[
     path('',views.home,name='home'),
     path('pay/',views.lipa_na_mpesa,name='pay'),
     path('callback/',views.callback,name='callback'),
+    path('daraja-status/',views.daraja_status,name='daraja_status'),
+    path('<str:checkout_request_id>/events/',views.payment_events,name='payment_events'),
 ]
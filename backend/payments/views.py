@@ -1,39 +1,56 @@
-from django.shortcuts import render
-from django.http import JsonResponse
-from django_daraja.mpesa.core import MpesaClient
-from django.views.decorators.csrf import csrf_exempt
+import asyncio
 import json
+import time
+
+from django.conf import settings
+from django.shortcuts import render, get_object_or_404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django_daraja.mpesa.exceptions import MpesaConnectionError
+from .breaker import CircuitOpenError
+from .checkout import start_checkout
+from .daraja import get_client
+from .events import payment_payload, subscribe, unsubscribe
 from .models import Payment
-from dashboard.models import UserSubscription, SubscriptionPlan
+from .inbox import enqueue
+from dashboard.models import SubscriptionPlan
+from twain_core.ratelimit import ratelimit
 
 def home(request):
     return render(request, 'pay.html')
 
+@login_required
+@ratelimit(key="phone", rate="3/m")
+@ratelimit(key="user", rate="10/m")
 def lipa_na_mpesa(request):
     if request.method == 'POST':
-        phone_number = request.POST.get("phone")
-        amount = int(request.POST.get("amount"))
+        phone_number = (request.POST.get("phone") or "").strip()
+        plan_id = request.POST.get("plan_id") or ""
+        if not phone_number:
+            return JsonResponse({"error": "A phone number is required."}, status=400)
+        if not plan_id.isdigit():
+            return JsonResponse({"error": "A plan is required."}, status=400)
+        # Charge the plan's own price; a posted amount is never trusted
+        plan = get_object_or_404(SubscriptionPlan, pk=plan_id, is_active=True)
+        amount = plan.price_kes
         account_reference = "grok"
         transaction_desc = "payment for school fees"
-        callback_url = "https://nonbituminous-flatteredly-jaunita.ngrok-free.dev/payments/callback/"
-
-        cl = MpesaClient()
-        response = cl.stk_push(phone_number, amount, account_reference, transaction_desc, callback_url)
-
-        # Decode HTTPResponse into JSON dict
-        response_data = json.loads(response.content.decode("utf-8"))
-
-        # Extract checkout request ID
-        checkout_request_id = response_data.get("CheckoutRequestID")
+        callback_url = settings.MPESA_CALLBACK_URL
 
-        # Save pending payment with checkout_request_id
-        Payment.objects.create(
-            user=request.user,
-            amount=amount,
-            phone_number=phone_number,
-            status='pending',
-            checkout_request_id=checkout_request_id
-        )
+        # Double taps within the dedupe window get the first push's response back
+        try:
+            response_data = start_checkout(
+                request.user, phone_number, amount, plan=plan, callback_url=callback_url,
+                account_reference=account_reference, transaction_desc=transaction_desc,
+            )
+        except MpesaConnectionError as ex:
+            # Upstream is slow or down (or the circuit is open): fail fast instead of tying up the worker
+            response = JsonResponse({"error": "M-Pesa is unavailable right now. Please try again shortly."}, status=503)
+            if isinstance(ex, CircuitOpenError):
+                response["Retry-After"] = str(max(1, int(ex.retry_after)))
+            return response
         return JsonResponse(response_data)
     return JsonResponse({"error": "Invalid request"}, status=400)
 
@@ -41,42 +58,77 @@ def lipa_na_mpesa(request):
 @csrf_exempt
 def callback(request):
     if request.method == 'POST':
-        data = json.loads(request.body.decode('utf-8'))
-        print("Callback data:", data)
-
-        # Extract transaction details
-        stk_callback = data.get("Body", {}).get("stkCallback", {})
-        result_code = stk_callback.get("ResultCode")
-        result_desc = stk_callback.get("ResultDesc")
-        checkout_request_id = stk_callback.get("CheckoutRequestID")
-
-        # Find the payment record
-        payment = Payment.objects.filter(checkout_request_id=checkout_request_id).first()
-
-        if result_code == 0 and payment:  # Success
-            # Extract M-Pesa receipt number
-            items = stk_callback.get("CallbackMetadata", {}).get("Item", [])
-            mpesa_receipt = None
-            for item in items:
-                if item.get("Name") == "MpesaReceiptNumber":
-                    mpesa_receipt = item.get("Value")
-
-            # Update payment record
-            payment.status = 'success'
-            payment.transaction_id = mpesa_receipt
-            payment.result_desc = result_desc
-            payment.save()
-
-            # Activate subscription
-            plan = SubscriptionPlan.objects.filter(price_kes=payment.amount).first()
-            if plan:
-                sub, created = UserSubscription.objects.get_or_create(user=payment.user)
-                sub.activate(plan)
-
-        elif payment:
-            payment.status = 'failed'
-            payment.result_desc = result_desc
-            payment.save()
-
+        # Ack immediately; payments.inbox processes the body in the background worker
+        enqueue(request.body.decode('utf-8', errors='replace'))
         return JsonResponse({"ResultCode": 0, "ResultDesc": "Accepted"})
     return JsonResponse({"error": "Invalid request method"}, status=400)
+
+
+@staff_member_required
+def daraja_status(request):
+    """Circuit breaker state and counters for the Daraja client."""
+    return JsonResponse(get_client().breaker.snapshot())
+
+
+# How long a status stream stays open, and how often it re-reads the row as
+# a safety net should a relayed event go astray (see payments.events)
+PAYMENT_EVENTS_MAX_SECONDS = 180
+PAYMENT_EVENTS_RECHECK_SECONDS = 15
+
+
+def sse_event(payload):
+    return f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+
+async def payment_events(request, checkout_request_id):
+    """
+    Server-Sent Events stream of a checkout's status.
+
+    Sends the current status straight away, then each change until the
+    payment is settled. Serve through twain_core.asgi so open streams
+    don't hold a worker thread.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    payments = Payment.objects.only("checkout_request_id", "status", "result_desc").filter(
+        checkout_request_id=checkout_request_id, user=user,
+    )
+
+    async def current():
+        payment = await payments.afirst()
+        if payment is None:
+            raise Http404("Payment not found")
+        return payment_payload(payment)
+
+    # Subscribe before the first read so an update in between isn't missed
+    subscription = subscribe(checkout_request_id)
+    try:
+        payload = await current()
+    except Http404:
+        unsubscribe(subscription)
+        raise
+
+    async def stream():
+        try:
+            last = payload
+            yield sse_event(last)
+            deadline = time.monotonic() + PAYMENT_EVENTS_MAX_SECONDS
+            while last["status"] == 'pending' and time.monotonic() < deadline:
+                try:
+                    update = await subscription.get(PAYMENT_EVENTS_RECHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    update = await current()
+                if update != last:
+                    last = update
+                    yield sse_event(last)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx buffering the stream
+    return response
@@ -2,6 +2,9 @@
 ASGI config for twain_core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the site through it (e.g. ``uvicorn twain_core.asgi:application``) so
+long-lived streams such as /payments/<checkout_request_id>/events/ wait on the
+event loop instead of holding a worker thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
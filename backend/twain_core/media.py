@@ -0,0 +1,167 @@
+"""
+Serving of uploaded media (MEDIA_ROOT) to logged-in users.
+
+Supports conditional GETs (ETag and Last-Modified from file metadata) and
+single byte ranges with If-Range, so video players can seek without
+re-downloading from byte zero. File bytes avoid Python buffers where the
+deployment allows it:
+
+* MEDIA_OFFLOAD = "x-accel-redirect": nginx serves MEDIA_ACCEL_PREFIX + path
+  from an ``internal`` location after this view has checked access;
+* MEDIA_OFFLOAD = "x-sendfile": Apache (mod_xsendfile) or lighttpd serve the path;
+* otherwise the open file goes to the WSGI server's ``wsgi.file_wrapper``,
+  which gunicorn and uWSGI send with os.sendfile(), limited to the range.
+
+Content-addressed names (see twain_core.storage) never change content, so
+they are cached for a year as ``immutable``; browsers skip revalidation.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import BLOB_DIR, is_content_addressed
+
+BLOCK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class RangeFile:
+    """
+    The window [start, start + length) of an open file.
+
+    Sendfile-capable servers use ``fileno()`` from the current offset and
+    stop at Content-Length; other servers call ``read()``, which stops at
+    the end of the window.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Inclusive (start, end) for a single-range ``Range`` header. Returns None
+    when the header should be ignored (malformed or several ranges) and
+    raises RangeNotSatisfiable when no byte of the file is in range.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if not start:
+        suffix = int(end)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - suffix), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, (min(int(end), size - 1) if end else size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether a Range may be honoured: no If-Range, or it names the current version."""
+    value = request.headers.get("If-Range")
+    if not value:
+        return True
+    if value.startswith(('"', "W/")):
+        return value == etag  # strong comparison; weak tags never match
+    return parse_http_date_safe(value) == last_modified
+
+
+def media_file(path):
+    """Absolute path and stat result for ``path`` under MEDIA_ROOT, or Http404."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404("Media file not found")
+    # Blobs are only reachable through the names that link to them
+    in_blob_store = os.path.relpath(full_path, settings.MEDIA_ROOT).split(os.sep)[0] == BLOB_DIR
+    if in_blob_store or not stat.S_ISREG(st.st_mode):
+        raise Http404("Media file not found")
+    return full_path, st
+
+
+@login_required
+def serve_media(request, path):
+    full_path, st = media_file(path)
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    last_modified = int(st.st_mtime)
+
+    def finish(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Accept-Ranges"] = "bytes"
+        if is_content_addressed(path):
+            response["Cache-Control"] = f"private, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            response["Cache-Control"] = "private, max-age=3600"
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    offload = getattr(settings, "MEDIA_OFFLOAD", "")
+    if offload:
+        # The web server does the transfer, including any Range request
+        response = HttpResponse(content_type=content_type)
+        if offload == "x-accel-redirect":
+            response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + quote(path)
+        else:
+            response["X-Sendfile"] = full_path
+        return finish(response)
+
+    byte_range = None
+    if "Range" in request.headers and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers["Range"], st.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{st.st_size}"
+            return finish(response)
+
+    start, end = byte_range or (0, st.st_size - 1)
+    length = end - start + 1
+    response = FileResponse(RangeFile(open(full_path, "rb"), start, length), content_type=content_type)
+    response.block_size = BLOCK_SIZE
+    response["Content-Length"] = str(length)
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return finish(response)
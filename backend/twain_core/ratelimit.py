@@ -0,0 +1,203 @@
+"""
+Token-bucket rate limiting.
+
+Use the ``ratelimit`` decorator on views we own, and ``RateLimitMiddleware``
+with ``RATELIMIT_RULES`` for views we can't decorate (e.g. Django's LoginView):
+
+    @ratelimit(key="phone", rate="3/m")
+    @ratelimit(key="user", rate="10/m")
+    def lipa_na_mpesa(request): ...
+
+Buckets live in ``RATELIMIT_BACKEND``: ``LocalMemoryBackend`` (per process,
+the default) or ``CacheBackend`` (shared through Django's cache framework).
+"""
+import functools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """Turn '10/m' into (capacity, refill tokens per second)."""
+    count, _, period = rate.partition("/")
+    count = int(count)
+    seconds = PERIODS[period[-1]] * int(period[:-1] or 1)
+    return count, count / seconds
+
+
+# --- Backends ---
+class LocalMemoryBackend:
+    """
+    Buckets in an OrderedDict guarded by a lock; limits are per process.
+
+    At most ``max_keys`` buckets are kept. Each use moves a bucket to the
+    end, so under key-spraying the least recently used one is dropped: the
+    bucket that has had longest to refill, not the clients being limited.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """Take one token from ``key``; return 0 if allowed, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+                bucket = (capacity, now)
+            else:
+                self._buckets.move_to_end(key)
+            tokens, last = bucket
+            tokens = min(capacity, tokens + (now - last) * refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / refill_rate
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBackend:
+    """
+    Buckets stored in a Django cache so all workers share them.
+
+    The read-modify-write is not atomic across processes, so a burst of
+    concurrent requests may get a token or two more than the limit.
+    """
+
+    def __init__(self, alias="default"):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        now = time.time() if now is None else now
+        cache_key = f"ratelimit:{key}"
+        tokens, last = self.cache.get(cache_key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - last) * refill_rate)
+        timeout = math.ceil(capacity / refill_rate)  # a full refill makes the entry redundant
+        if tokens >= 1:
+            self.cache.set(cache_key, (tokens - 1, now), timeout)
+            return 0
+        self.cache.set(cache_key, (tokens, now), timeout)
+        return (1 - tokens) / refill_rate
+
+    def reset(self):
+        self.cache.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, "RATELIMIT_BACKEND", "twain_core.ratelimit.LocalMemoryBackend")
+                _backend = import_string(path)()
+    return _backend
+
+
+# --- Keys ---
+def client_ip(request):
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def key_ip(request):
+    return "ip:" + client_ip(request)
+
+
+def key_user(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return key_ip(request)
+
+
+def key_phone(request):
+    phone = request.POST.get("phone") or request.POST.get("phone_number") or ""
+    digits = "".join(ch for ch in phone if ch.isdigit())
+    if not digits:
+        return key_ip(request)
+    # 07XXXXXXXX, 2547XXXXXXXX and +2547XXXXXXXX are the same phone
+    return "phone:" + digits[-9:]
+
+
+KEYS = {"ip": key_ip, "user": key_user, "phone": key_phone}
+
+
+def too_many_requests(retry_after):
+    seconds = max(1, math.ceil(retry_after))
+    response = HttpResponse(f"Too many requests. Try again in {seconds} seconds.", status=429, content_type="text/plain")
+    response["Retry-After"] = str(seconds)
+    return response
+
+
+def check(request, key, rate, scope):
+    """Return a 429 response if ``request`` is over ``rate`` for ``key``, else None."""
+    if not getattr(settings, "RATELIMIT_ENABLED", True):
+        return None
+    key_func = KEYS[key] if isinstance(key, str) else key
+    capacity, refill_rate = parse_rate(rate)
+    retry_after = get_backend().consume(f"{scope}:{key_func(request)}", capacity, refill_rate)
+    if retry_after:
+        logger.warning("Rate limited %s on %s (%s)", key_func(request), scope, rate)
+        return too_many_requests(retry_after)
+    return None
+
+
+def ratelimit(key="ip", rate="10/m", methods=("POST",)):
+    """Limit a view to ``rate`` requests per ``key`` ('ip', 'user', 'phone' or a callable)."""
+    def decorator(view):
+        scope = f"{view.__module__}.{view.__name__}:{key if isinstance(key, str) else key.__name__}"
+
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method in methods:
+                limited = check(request, key, rate, scope)
+                if limited:
+                    return limited
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+class RateLimitMiddleware:
+    """
+    Applies ``RATELIMIT_RULES``, a list of (path prefix, key, rate) tuples,
+    to POST requests. Place it after AuthenticationMiddleware so 'user' keys work.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rules = [
+            (prefix, key, rate, f"path:{prefix}:{key}")
+            for prefix, key, rate in getattr(settings, "RATELIMIT_RULES", [])
+        ]
+
+    def __call__(self, request):
+        if request.method == "POST":
+            for prefix, key, rate, scope in self.rules:
+                if request.path.startswith(prefix):
+                    limited = check(request, key, rate, scope)
+                    if limited:
+                        return limited
+        return self.get_response(request)
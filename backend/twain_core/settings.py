@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 
 
@@ -54,6 +55,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'twain_core.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,6 +87,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Every atomic() takes SQLite's write lock when it starts. With
+            # the default DEFERRED mode a transaction that reads and then
+            # writes (claiming an inbox entry, settling a payment, moving a
+            # counter) has to upgrade its read lock, and SQLite fails that
+            # with "database is locked" at once rather than waiting out the
+            # busy timeout, so the callback worker, reconcile_payments and
+            # the web process collided under load. The cost: transactions
+            # that only read also queue for the lock, so keep atomic()
+            # blocks short. Reads outside atomic() are unaffected.
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds a writer waits for the lock before giving up
+            'timeout': 20,
+        },
+        # A file (not in-memory) test database, so the live-server load tests
+        # get one connection per thread like a real deployment
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -132,12 +153,56 @@ STATICFILES_DIRS = [
 # Media settings 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Uploads are stored by content hash, once per distinct file (see twain_core/storage.py)
+STORAGES = {
+    "default": {"BACKEND": "twain_core.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+# Media is served by twain_core.media.serve_media. Set MEDIA_OFFLOAD to
+# "x-accel-redirect" (nginx, internal location at MEDIA_ACCEL_PREFIX) or
+# "x-sendfile" (Apache/lighttpd) to let the web server send the bytes.
+MEDIA_OFFLOAD = config('MEDIA_OFFLOAD', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+
+# Feature image derivatives (see dashboard/images.py); built in a background
+# thread pool after upload unless IMAGE_DERIVATIVES_ASYNC is False
+IMAGE_DERIVATIVES_ASYNC = config('IMAGE_DERIVATIVES_ASYNC', default=True, cast=bool)
+IMAGE_DERIVATIVE_WORKERS = config('IMAGE_DERIVATIVE_WORKERS', default=2, cast=int)
+
+# Resumable chunked uploads (see dashboard/uploads.py). Partial files live in
+# CHUNKED_UPLOAD_DIR, which should share a filesystem with MEDIA_ROOT so a
+# finished upload is renamed into place rather than copied
+CHUNKED_UPLOAD_DIR = config('CHUNKED_UPLOAD_DIR', default=str(BASE_DIR / "uploads_partial"))
+CHUNKED_UPLOAD_CHUNK_SIZE = config('CHUNKED_UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+CHUNKED_UPLOAD_MAX_SIZE = config('CHUNKED_UPLOAD_MAX_SIZE', default=4 * 1024 ** 3, cast=int)
+CHUNKED_UPLOAD_EXPIRY_HOURS = config('CHUNKED_UPLOAD_EXPIRY_HOURS', default=24, cast=int)
+
+# Knowledge article view counts are buffered per process and written every
+# ARTICLE_VIEW_FLUSH_SECONDS (see dashboard/popularity.py); trending scores
+# halve every TRENDING_HALF_LIFE_HOURS
+ARTICLE_VIEW_FLUSH_SECONDS = config('ARTICLE_VIEW_FLUSH_SECONDS', default=60, cast=int)
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', default=72, cast=float)
+if not 0 < TRENDING_HALF_LIFE_HOURS < float('inf'):
+    raise ImproperlyConfigured('TRENDING_HALF_LIFE_HOURS must be a positive number of hours.')
+
+# Read messages older than this move to the archive table (manage.py
+# archive_messages, see dashboard/archive.py)
+MESSAGE_ARCHIVE_AFTER_DAYS = config('MESSAGE_ARCHIVE_AFTER_DAYS', default=180, cast=int)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Rate limiting (see twain_core/ratelimit.py)
+# Use 'twain_core.ratelimit.CacheBackend' to share buckets between workers
+RATELIMIT_ENABLED = True
+RATELIMIT_BACKEND = "twain_core.ratelimit.LocalMemoryBackend"
+# (path prefix, key, rate) for views that can't take the @ratelimit decorator
+RATELIMIT_RULES = [
+    ("/login/", "ip", "10/m"),
+]
+
 # Authentication redirects
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "dashboard_home"
@@ -152,3 +217,13 @@ MPESA_PASSKEY=config('MPESA_PASSKEY')
 MPESA_ENVIRONMENT=config('MPESA_ENVIRONMENT')
 MPESA_CALLBACK_URL=config('MPESA_CALLBACK_URL')
 MPESA_EXPRESS_SHORTCODE=config('MPESA_EXPRESS_SHORTCODE')
+# Optional override of the Daraja base URL (e.g. a local fake server in tests)
+MPESA_API_BASE_URL=config('MPESA_API_BASE_URL', default='')
+# Daraja timeouts (seconds) and circuit breaker (see payments/breaker.py)
+MPESA_CONNECT_TIMEOUT=config('MPESA_CONNECT_TIMEOUT', default=3.05, cast=float)
+MPESA_READ_TIMEOUT=config('MPESA_READ_TIMEOUT', default=10, cast=float)
+MPESA_CALL_BUDGET=config('MPESA_CALL_BUDGET', default=15, cast=float)
+MPESA_BREAKER_FAILURES=config('MPESA_BREAKER_FAILURES', default=5, cast=int)
+MPESA_BREAKER_RESET_SECONDS=config('MPESA_BREAKER_RESET_SECONDS', default=30, cast=float)
+# Repeat checkouts for the same user, plan and phone within this window reuse the first STK push
+MPESA_CHECKOUT_DEDUPE_SECONDS=config('MPESA_CHECKOUT_DEDUPE_SECONDS', default=60, cast=int)
@@ -0,0 +1,148 @@
+"""
+Content-addressed storage for uploaded media.
+
+Files are saved as ``<upload_to>/<sha256><ext>``. The bytes of each distinct
+file live once in ``.blobs/<aa>/<sha256>`` under MEDIA_ROOT; every saved name
+is a hard link to that blob, so uploading the same PDF to five attachments
+costs one copy on disk, and the filesystem's link count is the refcount.
+Deleting a name unlinks it and drops the blob once no name uses it.
+
+A name's content never changes (names are never overwritten), which lets
+``serve_media`` mark them immutable. ``manage.py dedupe_media`` brings
+existing MEDIA_ROOT files into the blob store.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+BLOB_DIR = ".blobs"
+BLOCK_SIZE = 64 * 1024
+HASHED_NAME_RE = re.compile(r"^([0-9a-f]{64})(?:_[A-Za-z0-9]{7})?(?:\.[^/]*)?$")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while block := source.read(BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_digest(name):
+    """The SHA-256 a content-addressed name was saved under, or None."""
+    match = HASHED_NAME_RE.match(posixpath.basename(name))
+    return match.group(1) if match else None
+
+
+def is_content_addressed(name):
+    return content_digest(name) is not None
+
+
+def hashed_name(name, digest):
+    """``name`` moved to its content-addressed form, keeping directory and extension."""
+    return posixpath.join(posixpath.dirname(name), digest + os.path.splitext(name)[1].lower()[:16])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_path(self, digest):
+        return os.path.join(self.location, BLOB_DIR, digest[:2], digest)
+
+    def stage(self, content):
+        """
+        Copy ``content`` into a temporary file next to the blobs, hashing as it
+        goes; returns (path, digest). Files that are already on disk (chunked
+        or temporary uploads) are moved instead of copied.
+        """
+        tmp_dir = os.path.join(self.location, BLOB_DIR, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        if hasattr(content, "temporary_file_path"):
+            digest = file_sha256(content.temporary_file_path())
+            fd, path = tempfile.mkstemp(dir=tmp_dir)
+            os.close(fd)
+            file_move_safe(content.temporary_file_path(), path, allow_overwrite=True)
+        else:
+            digest = hashlib.sha256()
+            fd, path = tempfile.mkstemp(dir=tmp_dir)
+            with os.fdopen(fd, "wb") as staged:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    staged.write(chunk)
+            digest = digest.hexdigest()
+        os.chmod(path, self.file_permissions_mode or 0o644)
+        return path, digest
+
+    def _save(self, name, content):
+        staged, digest = self.stage(content)
+        try:
+            blob = self.blob_path(digest)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            candidate = hashed_name(name, digest)
+            while True:
+                try:
+                    os.link(staged, blob)
+                except FileExistsError:
+                    pass  # these bytes are already stored
+                name = self.get_available_name(candidate)
+                full_path = self.path(name)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                try:
+                    os.link(blob, full_path)
+                except FileExistsError:
+                    continue  # another save took the name first
+                except FileNotFoundError:
+                    continue  # the blob was deleted meanwhile; restore it from the staged copy
+                return name
+        finally:
+            os.unlink(staged)
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        super().delete(name)
+        digest = content_digest(name)
+        if digest:
+            self.release_blob(digest)
+
+    def release_blob(self, digest):
+        """Remove the blob for ``digest`` if no name links to it any more."""
+        blob = self.blob_path(digest)
+        try:
+            if os.stat(blob).st_nlink == 1:
+                os.unlink(blob)
+        except FileNotFoundError:
+            pass
+
+    def adopt(self, path, digest):
+        """
+        Turn the existing file at ``path`` into a link of the blob for
+        ``digest``; returns the bytes this frees (0 if it was the first copy).
+        """
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(path, blob)
+            return 0
+        except FileExistsError:
+            pass
+        file_stat, blob_stat = os.stat(path), os.stat(blob)
+        if (file_stat.st_dev, file_stat.st_ino) == (blob_stat.st_dev, blob_stat.st_ino):
+            return 0
+        tmp_path = f"{path}.dedupe"
+        os.link(blob, tmp_path)
+        os.replace(tmp_path, path)
+        return file_stat.st_size if file_stat.st_nlink == 1 else 0
+
+    def orphaned_blobs(self):
+        """Blobs that no name links to any more."""
+        root = os.path.join(self.location, BLOB_DIR)
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != "tmp"]
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.stat(path).st_nlink == 1:
+                    yield path
@@ -17,9 +17,9 @@ Including another URLconf
 from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from accounts.views import logout_view
+from twain_core.media import serve_media
 
 
 
@@ -43,5 +43,7 @@ urlpatterns =[
     path("dashboard/", include("dashboard.urls")),          # customer dashboard
     path("admin_dashboard/", include("admin_dashboard.urls")),  # admin dashboard
 
-    
-    ]  + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Uploaded media, for logged-in users (Range/ETag aware; see twain_core/media.py)
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name="media"),
+
+    ]